@@ -9,7 +9,15 @@ import logging
 import os
 import urllib.parse
 import PIL.Image, PIL.ImageDraw, PIL.ImageFont
-import math
+
+from frame_broadcaster import FrameBroadcaster
+from concurrent.futures import ThreadPoolExecutor
+from frame_grabber import FrameGrabber
+from capture_backend import load_capture_options, open_capture
+from frame_scheduler import AdaptiveFrameScheduler
+from motion_gate import MotionGate
+from detection_engine import DetectionProfile, DetectionProcess, LineGeometry, detect_frame
+from centroid_tracker import CentroidTracker
 
 class CameraCounter:
     """คลาสสำหรับนับลูกค้าผ่านกล้องวงจรปิด"""
@@ -49,6 +57,33 @@ class CameraCounter:
         self.recording_interval = config_manager.getint('Recording', 'interval_seconds', fallback=300)
         self.last_record_time = time.time()
         
+        # ตั้งค่าการส่งภาพไปยังผู้ชม (เข้ารหัสครั้งเดียวต่อเฟรมแล้วแชร์ให้ทุกคน)
+        self.stream_max_fps = config_manager.getint('Streaming', 'max_fps', fallback=15)
+        self.stream_quality = config_manager.getint('Streaming', 'jpeg_quality', fallback=80)
+        self.stream_resize_factor = config_manager.getfloat('Streaming', 'resize_factor', fallback=0.75)
+        
+        # ข้ามเฟรมแบบปรับตัวเองเมื่อประมวลผลไม่ทันกล้อง
+        self.adaptive_skip = config_manager.getboolean('Capture', 'adaptive_skip', fallback=True)
+        self.skip_target_load = config_manager.getfloat('Capture', 'target_load', fallback=0.8)
+        self.max_frame_skip = config_manager.getint('Capture', 'max_skip', fallback=8)
+        
+        # โหมดพักเมื่อไม่มีการเคลื่อนไหวใน ROI (ประมวลผลเต็มรูปแบบเพียง idle_fps เฟรมต่อวินาที)
+        self.motion_gate_enabled = config_manager.getboolean('Capture', 'motion_gate', fallback=True)
+        self.idle_after_seconds = config_manager.getfloat('Capture', 'idle_after_seconds', fallback=5.0)
+        self.idle_fps = config_manager.getfloat('Capture', 'idle_fps', fallback=1.0)
+        self.motion_ratio = config_manager.getfloat('Capture', 'motion_ratio', fallback=0.002)
+        
+        # เชื่อมต่อสตรีมใหม่อัตโนมัติเมื่อไม่ได้รับเฟรมนานเกิน stall_timeout วินาที
+        self.stall_timeout = config_manager.getfloat('Capture', 'stall_timeout', fallback=5.0)
+        self.reconnect_initial_delay = config_manager.getfloat('Capture', 'reconnect_initial_delay', fallback=1.0)
+        self.reconnect_max_delay = config_manager.getfloat('Capture', 'reconnect_max_delay', fallback=60.0)
+        
+        # แยกการตรวจจับของแต่ละกล้องไปทำใน process ของตัวเอง (ไม่ติด GIL ร่วมกัน)
+        self.use_detection_processes = config_manager.getboolean('Detection', 'worker_processes', fallback=False)
+        
+        # จำนวนเฟรมที่ track ยังถูกจำไว้เมื่อตรวจจับไม่พบ
+        self.track_max_missed = config_manager.getint('Detection', 'track_max_missed', fallback=5)
+        
         # ตรวจสอบการตั้งค่ากล้องหลายตัว
         self.multi_cameras_enabled = config_manager.getboolean('MultiCameras', 'enabled', fallback=False)
         self.cameras = []
@@ -59,12 +94,20 @@ class CameraCounter:
         self.exit_count = 0
         self.current_frame = None
         
+        # หมายเลขลำดับเฟรมรวมของทุกกล้อง และ condition สำหรับให้ผู้ใช้เฟรมรอเฟรมใหม่
+        self.frame_seq = 0
+        self.frame_condition = threading.Condition()
+        
+        # หมายเลขลำดับการเปลี่ยนแปลงของตัวนับ/สถานะกล้อง สำหรับส่งข้อมูลแบบ push
+        self.status_seq = 0
+        self.status_condition = threading.Condition()
+        
         # ตั้งค่ากล้อง
         if self.multi_cameras_enabled:
             self._setup_multiple_cameras(video_source)
         else:
             self._setup_single_camera(video_source)
-            
+        
         self.logger.info(f"ตัวนับลูกค้าจากกล้องถูกเริ่มต้นแล้ว สำหรับสาขา: {self.branch_id}")
     
     def _load_thai_font(self, size):
@@ -153,17 +196,31 @@ class CameraCounter:
                     'height': height,
                     'detection_line': detection_line,
                     'detection_angle': self.config_manager.getint(camera_section, 'detection_angle', fallback=0),
-                    'min_area': self.config_manager.getint(camera_section, 'min_area', 
+                    'min_area': self.config_manager.getint(camera_section, 'min_area',
                                                       fallback=self.config_manager.getint('Detection', 'min_area', fallback=500)),
+                    'profile': self._build_detection_profile(camera_section),
+                    'capture_options': load_capture_options(self.config_manager, camera_section),
+                    'roi_margin': self.config_manager.getint(camera_section, 'roi_margin',
+                                                         fallback=self.config_manager.getint('Detection', 'roi_margin', fallback=150)),
+                    'line': None,
                     'cap': None,
+                    'backend': None,
+                    'start_time': None,
+                    'cold_start_seconds': None,
+                    'grabber': None,
+                    'scheduler': None,
+                    'motion_gate': None,
+                    'detector': None,
                     'running': False,
                     'thread': None,
                     'people_in_store': 0,
                     'entry_count': 0,
                     'exit_count': 0,
-                    'previous_centers': [],
+                    'tracker': CentroidTracker(max_missed=self.track_max_missed),
                     'last_record_time': time.time(),
-                    'current_frame': None
+                    'current_frame': None,
+                    'frame_seq': 0,
+                    'broadcaster': self._create_broadcaster(cam_name)
                 })
         
         # ถ้าไม่มีกล้องที่ตั้งค่าไว้ ให้ใช้กล้องเริ่มต้น
@@ -195,52 +252,174 @@ class CameraCounter:
             'detection_line': detection_line,
             'detection_angle': self.config_manager.getint('Camera', 'detection_angle', fallback=0),
             'min_area': self.config_manager.getint('Detection', 'min_area', fallback=500),
+            'profile': self._build_detection_profile('Camera'),
+            'capture_options': load_capture_options(self.config_manager, 'Camera'),
+            'roi_margin': self.config_manager.getint('Camera', 'roi_margin',
+                                                 fallback=self.config_manager.getint('Detection', 'roi_margin', fallback=150)),
+            'line': None,
             'cap': None,
+            'backend': None,
+            'start_time': None,
+            'cold_start_seconds': None,
+            'grabber': None,
+            'scheduler': None,
+            'motion_gate': None,
+            'detector': None,
             'running': False,
             'thread': None,
             'people_in_store': 0,
             'entry_count': 0,
             'exit_count': 0,
-            'previous_centers': [],
+            'tracker': CentroidTracker(max_missed=self.track_max_missed),
             'last_record_time': time.time(),
-            'current_frame': None
+            'current_frame': None,
+            'frame_seq': 0,
+            'broadcaster': self._create_broadcaster('Default Camera')
         })
     
-def start(self):
-    try:
-        logger.info("กำลังเริ่มกล้อง...")
-        if self.video_source is None:
-            # ถ้าใช้หลายกล้อง ให้เริ่มกล้องทุกตัว
-            if self.use_multiple_cameras:
-                logger.info(f"เริ่มกล้องหลายตัว จำนวน {len(self.cameras)} ตัว")
-                for cam in self.cameras:
-                    cam_id = cam['id']
-                    logger.info(f"กำลังเริ่มกล้อง {cam_id}: {cam['name']}")
-                    
-                    # ตรวจสอบว่ามี URL หรือไม่
-                    if 'url' not in cam or not cam['url']:
-                        logger.error(f"ไม่พบ URL สำหรับกล้อง {cam_id}")
-                        continue
-                        
-                    # ทดสอบการเปิดกล้อง
-                    logger.info(f"ทดสอบเปิดกล้อง {cam_id} ด้วย URL: {cam['url']}")
-                    test_cap = cv2.VideoCapture(cam['url'])
-                    if test_cap.isOpened():
-                        ret, frame = test_cap.read()
-                        test_cap.release()
-                        if ret:
-                            logger.info(f"เปิดกล้อง {cam_id} และอ่านเฟรมสำเร็จ")
-                        else:
-                            logger.error(f"เปิดกล้อง {cam_id} ได้ แต่ไม่สามารถอ่านเฟรมได้")
-                    else:
-                        logger.error(f"ไม่สามารถเปิดกล้อง {cam_id} ได้")
+    def _build_detection_profile(self, camera_section):
+        """สร้างโปรไฟล์การตรวจจับจากส่วน [Detection] และส่วนของกล้อง (อ่านการตั้งค่าครั้งเดียว)"""
+        # สัดส่วนการย่อภาพก่อนตรวจจับ (1.0 = ตรวจจับที่ความละเอียดเต็มของสตรีม)
+        scale = self.config_manager.getfloat(camera_section, 'detection_scale',
+                                             fallback=self.config_manager.getfloat('Detection', 'detection_scale', fallback=1.0))
+        scale = min(1.0, max(0.1, scale))
+        
+        # ขนาด blur ถูกย่อตามสัดส่วนของภาพที่ใช้ตรวจจับ
+        blur_size = max(1, int(round(self.config_manager.getint('Detection', 'blur_size', fallback=21) * scale)))
+        if blur_size % 2 == 0:  # ต้องเป็นเลขคี่
+            blur_size += 1
+        
+        min_area = self.config_manager.getint(camera_section, 'min_area',
+                                              fallback=self.config_manager.getint('Detection', 'min_area', fallback=500))
+        
+        return DetectionProfile(
+            blur_size=blur_size,
+            threshold=self.config_manager.getint('Detection', 'threshold', fallback=20),
+            min_area=min_area,
+            direction_threshold=self.config_manager.getint('Detection', 'direction_threshold', fallback=10),
+            scale=scale,
+            scaled_min_area=min_area * scale * scale
+        )
+    
+    def reload_detection_profiles(self):
+        """สร้างโปรไฟล์การตรวจจับของทุกกล้องใหม่จากการตั้งค่าปัจจุบัน และสลับเข้าใช้งานทันที"""
+        for camera in self.cameras:
+            camera_section = f"Camera_{camera['id']}" if camera['id'] > 0 else "Camera"
+            profile = self._build_detection_profile(camera_section)
+            
+            # แทนที่ทั้งโปรไฟล์ในครั้งเดียว เธรดประมวลผลจะเห็นค่าชุดเก่าหรือชุดใหม่ทั้งชุดเท่านั้น
+            camera['min_area'] = profile.min_area
+            camera['profile'] = profile
+        
+        self.logger.info(f"โหลดโปรไฟล์การตรวจจับใหม่สำหรับ {len(self.cameras)} กล้อง")
+    
+    def _create_broadcaster(self, camera_name):
+        """สร้างตัวกระจายเฟรมสำหรับกล้องหนึ่งตัว"""
+        return FrameBroadcaster(
+            camera_name,
+            max_fps=self.stream_max_fps,
+            quality=self.stream_quality,
+            resize_factor=self.stream_resize_factor
+        )
+    
+    def start(self):
+        """เริ่มการทำงานของกล้องทั้งหมด"""
+        if self.camera_running:
+            self.logger.warning("กล้องกำลังทำงานอยู่แล้ว")
+            return False
+        
+        self.logger.info(f"กำลังเริ่มกล้อง จำนวน {len(self.cameras)} ตัว")
+        
+        # เริ่มกล้องทุกตัวพร้อมกัน (สตรีมถูกเปิดในเธรดอ่านเฟรมของแต่ละกล้อง) กล้องที่เชื่อมต่อไม่ได้
+        # จะไม่หน่วงกล้องตัวอื่นเท่ากับ timeout ของมัน และกล้องแต่ละตัวเริ่มนับทันทีที่สตรีมของตัวเองพร้อม
+        with ThreadPoolExecutor(max_workers=max(1, len(self.cameras)), thread_name_prefix='camera-start') as pool:
+            started_count = sum(1 for started in pool.map(self._start_camera, self.cameras) if started)
+        
+        if started_count == 0:
+            self.logger.error("ไม่สามารถเริ่มกล้องได้เลย")
+            return False
         
-        # เรียกฟังก์ชันเดิม
         self.camera_running = True
+        self._notify_status_changed()
+        self.logger.info(f"เริ่มการทำงานของกล้อง {started_count}/{len(self.cameras)} ตัวสำเร็จ")
         return True
-    except Exception as e:
-        logger.error(f"เกิดข้อผิดพลาดในการเริ่มกล้อง: {str(e)}", exc_info=True)
-        return False
+    
+    def _start_camera(self, camera):
+        """เปิดการเชื่อมต่อและเริ่มเธรดประมวลผลของกล้องหนึ่งตัว"""
+        if camera['running']:
+            return True
+        
+        try:
+            self.logger.info(f"กำลังเริ่มกล้อง {camera['id']}: {camera['name']}")
+            
+            # เวลาเริ่ม สำหรับวัดเวลาตั้งแต่สั่งเริ่มจนประมวลผลเฟรมแรกได้ (cold start)
+            camera['start_time'] = time.time()
+            camera['cold_start_seconds'] = None
+            
+            camera['running'] = True
+            camera['tracker'].reset()
+            
+            # เริ่มเธรดอ่านเฟรม แยกจากเธรดประมวลผล เพื่อไม่ให้ buffer ของ decoder ค้าง
+            # เธรดนี้เปิดสตรีมครั้งแรกเอง และเชื่อมต่อใหม่ (พร้อม backoff) เมื่อเปิดไม่ได้ หลุด หรือค้าง
+            # กล้องที่ยังไม่พร้อมตอนเริ่มระบบจึงเริ่มนับได้เองเมื่อกล้องกลับมา
+            camera['grabber'] = FrameGrabber(
+                camera['name'],
+                lambda: self._open_camera_capture(camera),
+                stall_timeout=self.stall_timeout,
+                backoff_initial=self.reconnect_initial_delay,
+                backoff_max=self.reconnect_max_delay
+            )
+            camera['grabber'].start()
+            
+            camera['scheduler'] = AdaptiveFrameScheduler(
+                target_load=self.skip_target_load,
+                max_skip=self.max_frame_skip,
+                enabled=self.adaptive_skip
+            )
+            
+            if self.motion_gate_enabled:
+                camera['motion_gate'] = MotionGate(
+                    motion_ratio=self.motion_ratio,
+                    idle_after=self.idle_after_seconds,
+                    idle_fps=self.idle_fps
+                )
+            else:
+                camera['motion_gate'] = None
+            
+            # เริ่ม process ตรวจจับแยก (ถ้าเปิดใช้งาน)
+            if self.use_detection_processes:
+                try:
+                    camera['detector'] = DetectionProcess(camera['name'], max_missed=self.track_max_missed)
+                except Exception as e:
+                    self.logger.warning(f"ไม่สามารถเริ่ม process ตรวจจับของกล้อง {camera['name']} ใช้การตรวจจับในเธรดแทน: {str(e)}")
+                    camera['detector'] = None
+            
+            # เริ่มเธรดประมวลผลของกล้องนี้
+            camera['thread'] = threading.Thread(target=self._process_camera, args=(camera,), daemon=True)
+            camera['thread'].start()
+            
+            self.logger.info(f"เริ่มกล้อง {camera['name']} สำเร็จ")
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"เกิดข้อผิดพลาดในการเริ่มกล้อง {camera['name']}: {str(e)}", exc_info=True)
+            camera['running'] = False
+            return False
+    
+    def _open_camera_capture(self, camera):
+        """เปิดสตรีมของกล้องตามตัวเลือก capture ส่งคืน cap หรือ None ถ้าเปิดไม่ได้"""
+        cap, backend = open_capture(camera['source'], camera['capture_options'], camera['name'])
+        if not cap.isOpened():
+            cap.release()
+            return None
+        
+        options = camera['capture_options']
+        self.logger.info(f"กล้อง {camera['name']} ใช้ backend {backend} "
+                         f"(ตั้งค่า: {options.backend}, transport: {options.rtsp_transport}, "
+                         f"buffer: {options.decoder_buffer}, low_delay: {options.low_delay}, hw_accel: {options.hw_accel})")
+        
+        camera['backend'] = backend
+        return cap
     
     def stop(self):
         """หยุดการทำงานของกล้อง"""
@@ -255,23 +434,36 @@ def start(self):
             try:
                 # หยุดเธรด
                 camera['running'] = False
+                if camera['grabber']:
+                    camera['grabber'].stop()
                 if camera['thread']:
                     camera['thread'].join(timeout=1.0)
                 
-                # ปิดกล้อง
-                if camera['cap'] and camera['cap'].isOpened():
-                    camera['cap'].release()
+                # หยุด process ตรวจจับ
+                if camera['detector']:
+                    camera['detector'].stop()
+                    camera['detector'] = None
                 
-                self.logger.info(f"หยุดการทำงานของกล้อง {camera['name']} สำเร็จ")
+                # เธรดอ่านเฟรมปิดสตรีมเองเมื่อหยุด
+                camera['cap'] = None
                 
+                # ล้างเฟรมที่แชร์ให้ผู้ชม
+                camera['current_frame'] = None
+                camera['broadcaster'].clear()
+                
+                self.logger.info(f"หยุดการทำงานของกล้อง {camera['name']} สำเร็จ")
+            
             except Exception as e:
                 self.logger.error(f"เกิดข้อผิดพลาดในการหยุดกล้อง {camera['name']}: {str(e)}")
         
         # ล้างข้อมูลเฟรมปัจจุบัน
         self.current_frame = None
         
-        # อัพเดตสถานะการทำงาน
+        # อัพเดตสถานะการทำงาน และปลุกผู้ใช้เฟรมที่รออยู่ให้ตรวจสอบสถานะใหม่
         self.camera_running = False
+        with self.frame_condition:
+            self.frame_condition.notify_all()
+        self._notify_status_changed()
         
         # ปิดหน้าต่างแสดงผล
         if self.display_video:
@@ -282,6 +474,10 @@ def start(self):
     
     def reset_counters(self):
         """รีเซ็ตตัวนับทั้งหมด"""
+        # บันทึกจำนวนที่นับได้ก่อนรีเซ็ต เพื่อไม่ให้จำนวนตั้งแต่การบันทึกครั้งก่อนหายไป
+        if self.data_manager:
+            self._record_customer_count()
+        
         for camera in self.cameras:
             camera['people_in_store'] = 0
             camera['entry_count'] = 0
@@ -292,6 +488,11 @@ def start(self):
         self.entry_count = 0
         self.exit_count = 0
         
+        # แจ้งตัวจัดการข้อมูลให้นับจำนวนที่เพิ่มขึ้นถัดไปจาก 0
+        if self.data_manager:
+            self.data_manager.reset_count_deltas(self.branch_id)
+        
+        self._notify_status_changed()
         self.logger.info("รีเซ็ตตัวนับลูกค้าทั้งหมด")
     
     def get_status(self):
@@ -313,16 +514,55 @@ def start(self):
                 'running': cam['running'],
                 'people_in_store': cam['people_in_store'],
                 'entry_count': cam['entry_count'],
-                'exit_count': cam['exit_count']
+                'exit_count': cam['exit_count'],
+                **(cam['grabber'].get_stats() if cam['grabber']
+                   else {'captured_frames': 0, 'dropped_frames': 0, 'read_failures': 0,
+                         'capture_state': 'stopped', 'reconnects': 0, 'downtime_seconds': 0.0}),
+                **(cam['scheduler'].get_stats() if cam['scheduler'] and cam['running']
+                   else {'processed_fps': 0.0, 'frame_skip': 1, 'processing_ms': 0.0}),
+                'idle': bool(cam['running'] and cam['motion_gate'] and cam['motion_gate'].idle),
+                'backend': cam['backend'],
+                'cold_start_seconds': cam['cold_start_seconds']
             } for cam in self.cameras]
         }
     
+    def get_counts(self):
+        """ส่งคืนตัวนับและสถานะแบบย่อของทุกกล้อง (สำหรับส่งการเปลี่ยนแปลงแบบ push)"""
+        self._update_total_counts()
+        
+        return {
+            'running': self.camera_running,
+            'people_in_store': self.people_in_store,
+            'entry_count': self.entry_count,
+            'exit_count': self.exit_count,
+            'cameras': {
+                str(cam['id']): {
+                    'running': cam['running'],
+                    'people_in_store': cam['people_in_store'],
+                    'entry_count': cam['entry_count'],
+                    'exit_count': cam['exit_count']
+                } for cam in self.cameras
+            }
+        }
+    
     def _update_total_counts(self):
         """อัพเดตตัวนับรวมจากทุกกล้อง"""
         self.people_in_store = sum(cam['people_in_store'] for cam in self.cameras)
         self.entry_count = sum(cam['entry_count'] for cam in self.cameras)
         self.exit_count = sum(cam['exit_count'] for cam in self.cameras)
     
+    def _notify_status_changed(self):
+        """แจ้งผู้ที่รออยู่ว่าตัวนับหรือสถานะกล้องเปลี่ยนแปลง"""
+        with self.status_condition:
+            self.status_seq += 1
+            self.status_condition.notify_all()
+    
+    def wait_for_status_change(self, last_seq, timeout=None):
+        """รอจนกว่าตัวนับหรือสถานะกล้องจะเปลี่ยน (status_seq ต่างจาก last_seq) แล้วส่งคืน status_seq ล่าสุด"""
+        with self.status_condition:
+            self.status_condition.wait_for(lambda: self.status_seq != last_seq, timeout)
+            return self.status_seq
+    
     def _process_camera(self, camera):
         """ประมวลผลภาพจากกล้อง (เรียกจากเธรดแยก)"""
         self.logger.info(f"เริ่มการประมวลผลภาพจากกล้อง {camera['name']}")
@@ -330,24 +570,35 @@ def start(self):
         # สร้าง background subtractor สำหรับกล้องนี้
         fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
         
-        while camera['running'] and camera['cap'] and camera['cap'].isOpened():
+        grabber = camera['grabber']
+        scheduler = camera['scheduler']
+        motion_gate = camera['motion_gate']
+        frame_seq = 0
+        
+        while camera['running'] and grabber.running:
             try:
-                # อ่านเฟรมจากกล้อง
-                ret, frame = camera['cap'].read()
-                if not ret or frame is None:
-                    self.logger.error(f"ไม่สามารถอ่านเฟรมจากกล้อง {camera['name']}")
-                    time.sleep(0.5)  # หน่วงเวลาเพื่อไม่ให้ทำงานซ้ำเร็วเกินไป
+                # ดึงเฟรมล่าสุดจากเธรดอ่านภาพ โดยข้ามเฟรมตามที่ตัวจัดรอบกำหนด
+                seq, frame = grabber.get_latest(scheduler.next_seq(frame_seq), timeout=1.0)
+                if frame is None:
+                    continue
+                frame_seq = seq
+                
+                # ข้ามการตรวจจับถ้าอยู่ในโหมดพัก (ไม่มีการเคลื่อนไหวใน ROI) แต่ยังเผยแพร่เฟรมดิบให้ผู้ชมเห็นภาพสด
+                if motion_gate is not None and not motion_gate.check(frame, self._get_line_geometry(camera, frame)):
+                    self._publish_frame(camera, frame)
                     continue
                 
-                # ประมวลผลภาพเพื่อนับจำนวนลูกค้า
-                self._process_frame(camera, frame, fgbg)
+                # ประมวลผลภาพเพื่อนับจำนวนลูกค้า และบันทึกเวลาที่ใช้
+                process_start = time.time()
+                frame = self._process_frame(camera, frame, fgbg)
+                scheduler.record(frame_seq, time.time() - process_start)
                 
-                # เก็บเฟรมปัจจุบัน
-                camera['current_frame'] = frame.copy()
+                if camera['cold_start_seconds'] is None:
+                    camera['cold_start_seconds'] = round(time.time() - camera['start_time'], 2)
+                    self.logger.info(f"กล้อง {camera['name']} พร้อมใช้งานใน {camera['cold_start_seconds']} วินาที")
                 
-                # เก็บเฟรมปัจจุบันของกล้องแรกเป็นเฟรมหลักสำหรับแสดงผล
-                if camera['id'] == self.cameras[0]['id']:
-                    self.current_frame = frame.copy()
+                # เผยแพร่เฟรมปัจจุบันให้ผู้ชมทุกคน
+                self._publish_frame(camera, frame)
                 
                 # แสดงภาพ (ถ้าเปิดใช้งาน)
                 if self.display_video:
@@ -383,7 +634,7 @@ def start(self):
                 if current_time - camera['last_record_time'] > self.recording_interval:
                     self._record_customer_count(camera)
                     camera['last_record_time'] = current_time
-                    
+            
             except Exception as e:
                 self.logger.error(f"เกิดข้อผิดพลาดในการประมวลผลกล้อง {camera['name']}: {str(e)}")
                 time.sleep(1)  # หน่วงเวลาเพื่อไม่ให้ทำงานซ้ำเร็วเกินไป
@@ -394,122 +645,103 @@ def start(self):
         
         self.logger.info(f"หยุดการประมวลผลภาพจากกล้อง {camera['name']}")
     
+    def _publish_frame(self, camera, frame):
+        """เผยแพร่เฟรมใหม่พร้อมหมายเลขลำดับ และปลุกผู้ใช้เฟรมที่รออยู่"""
+        # เฟรมนี้จะไม่ถูกแก้ไขอีก จึงแชร์ได้โดยไม่ต้องคัดลอก
+        camera['current_frame'] = frame
+        camera['broadcaster'].publish(frame)
+        
+        # เก็บเฟรมปัจจุบันของกล้องแรกเป็นเฟรมหลักสำหรับแสดงผล
+        if camera['id'] == self.cameras[0]['id']:
+            self.current_frame = frame
+        
+        with self.frame_condition:
+            self.frame_seq += 1
+            camera['frame_seq'] = self.frame_seq
+            self.frame_condition.notify_all()
+    
+    def wait_for_frame(self, last_seq, timeout=None):
+        """รอจนกว่าจะมีเฟรมใหม่จากกล้องใดก็ได้ (frame_seq มากกว่า last_seq) แล้วส่งคืน frame_seq ล่าสุด"""
+        with self.frame_condition:
+            self.frame_condition.wait_for(lambda: self.frame_seq != last_seq, timeout)
+            return self.frame_seq
+    
     def _process_frame(self, camera, frame, fgbg):
-        """ประมวลผลเฟรมเพื่อตรวจจับและนับลูกค้า"""
+        """ประมวลผลเฟรมเพื่อตรวจจับและนับลูกค้า ส่งคืนสำเนาของเฟรมที่วาดผลการตรวจจับแล้ว
+        
+        เฟรมต้นฉบับยังถูกอ้างอิงโดยเธรดอ่านเฟรม จึงไม่วาดลงบนเฟรมนั้นโดยตรง
+        """
         try:
-            # แปลงเป็นสีเทา
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # อ่านโปรไฟล์ครั้งเดียวต่อเฟรม (อาจถูกสลับเป็นชุดใหม่ระหว่างทำงาน)
+            profile = camera['profile']
+            line = self._get_line_geometry(camera, frame)
             
-            # ทำ Gaussian blur เพื่อลดสัญญาณรบกวน
-            blur_size = self.config_manager.getint('Detection', 'blur_size', fallback=21)
-            if blur_size % 2 == 0:  # ต้องเป็นเลขคี่
-                blur_size += 1
-            gray = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+            # ตรวจจับใน process แยกถ้ามี ไม่เช่นนั้นตรวจจับในเธรดนี้
+            detector = camera['detector']
+            detected = None
+            if detector is not None and detector.is_alive():
+                try:
+                    detected = detector.process(frame, profile, line)
+                except RuntimeError:
+                    # process ที่ไม่ตอบสนองจะถูกหยุดไปแล้ว ให้ตรวจจับเฟรมนี้ในเธรดแทน ส่วนข้อผิดพลาดอื่นส่งต่อตามเดิม
+                    if detector.is_alive():
+                        raise
             
-            # ใช้ Background Subtraction เพื่อตรวจจับวัตถุเคลื่อนไหว
-            fgmask = fgbg.apply(gray)
+            if detected is None:
+                if detector is not None:
+                    self.logger.warning(f"process ตรวจจับของกล้อง {camera['name']} หยุดทำงาน ใช้การตรวจจับในเธรดแทน")
+                    camera['detector'] = None
+                detected = detect_frame(frame, fgbg, camera['tracker'], profile, line)
+            boxes, centers, track_ids, events = detected
             
-            # กรองสัญญาณรบกวน
-            thresh = cv2.threshold(fgmask, self.config_manager.getint('Detection', 'threshold', fallback=20), 255, cv2.THRESH_BINARY)[1]
-            thresh = cv2.dilate(thresh, None, iterations=2)
+            for event in events:
+                self._apply_count_event(camera, event)
             
-            # หา contours ของวัตถุ
-            contours, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            frame = frame.copy()
             
             # วาดเส้นตรวจจับตามแนวตั้ง (แบบปรับมุมได้)
-            height, width = frame.shape[:2]
-            
-            # สำหรับแนวตั้ง ใช้จุดกลางตามแนวนอน
-            center_x = camera.get('detection_line', width // 2)  # ใช้ค่า detection_line เป็นตำแหน่ง x
-            center_y = height // 2
-            
-            # ดึงมุมจากการตั้งค่า (หรือใช้ค่าเริ่มต้น 90 องศาสำหรับเส้นตรงแนวตั้ง)
-            angle = camera.get('detection_angle', 90)
-            
-            # คำนวณความยาวของเส้นให้ครอบคลุมทั้งภาพ
-            line_length = max(width, height) * 2
-            
-            # คำนวณจุดปลายของเส้นโดยใช้มุม
-            import math
-            angle_rad = math.radians(angle)
-            cos_angle = math.cos(angle_rad)
-            sin_angle = math.sin(angle_rad)
-            
-            # คำนวณจุดปลายของเส้น
-            x1 = int(center_x - line_length * cos_angle)
-            y1 = int(center_y - line_length * sin_angle)
-            x2 = int(center_x + line_length * cos_angle)
-            y2 = int(center_y + line_length * sin_angle)
-            
-            # วาดเส้น
-            cv2.line(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            # เพิ่มฟังก์ชันตรวจสอบจุดอยู่ด้านไหนของเส้น
-            def is_left_of_line(point_x, point_y, line_x1, line_y1, line_x2, line_y2):
-                # ค่าเป็นบวกถ้าจุดอยู่ทางซ้ายของเส้น ลบถ้าอยู่ทางขวา
-                return (line_y2 - line_y1) * point_x + (line_x1 - line_x2) * point_y + (line_x2 * line_y1 - line_x1 * line_y2) > 0
-            
-            # ตรวจสอบแต่ละ contour
-            centers = []
-            for contour in contours:
-                # คำนวณพื้นที่ของ contour
-                area = cv2.contourArea(contour)
-                
-                # ตรวจสอบว่าพื้นที่มากกว่าค่าขั้นต่ำหรือไม่
-                if area > camera['min_area']:
-                    # หากมีขนาดใหญ่พอ จะถือว่าเป็นคน
-                    (x, y, w, h) = cv2.boundingRect(contour)
-                    
-                    # วาดกรอบรอบตัวคน
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    
-                    # คำนวณจุดศูนย์กลาง
-                    center_x_point = x + w // 2
-                    center_y_point = y + h // 2
-                    centers.append((center_x_point, center_y_point))
-                    
-                    # วาดจุดที่จุดศูนย์กลาง
-                    cv2.circle(frame, (center_x_point, center_y_point), 4, (0, 0, 255), -1)
-                    
-                    # ตรวจสอบการเคลื่อนที่ผ่านเส้น
-                    direction_threshold = self.config_manager.getint('Detection', 'direction_threshold', fallback=10)
-                    
-                    for prev_center in camera['previous_centers']:
-                        prev_x, prev_y = prev_center
-                        
-                        # คำนวณระยะทางระหว่างจุดศูนย์กลางปัจจุบันและก่อนหน้า
-                        distance = np.sqrt((center_x_point - prev_x) ** 2 + (center_y_point - prev_y) ** 2)
-                        
-                        # ตรวจสอบว่าเป็นวัตถุเดียวกันหรือไม่
-                        if distance < 50:  # ระยะห่างสำหรับพิจารณาว่าเป็นวัตถุเดียวกัน
-                            # ตรวจสอบการเคลื่อนที่ผ่านเส้น
-                            prev_is_left = is_left_of_line(prev_x, prev_y, x1, y1, x2, y2)
-                            curr_is_left = is_left_of_line(center_x_point, center_y_point, x1, y1, x2, y2)
-                            
-                            # ถ้ามีการเคลื่อนที่ข้ามเส้น และระยะทางมากกว่าค่า threshold
-                            if prev_is_left != curr_is_left and distance > direction_threshold:
-                                if prev_is_left and not curr_is_left:
-                                    # เคลื่อนที่จากซ้ายไปขวา (คนเดินเข้า)
-                                    camera['entry_count'] += 1
-                                    camera['people_in_store'] += 1
-                                    self.logger.info(f"กล้อง {camera['name']} ตรวจพบคนเข้า (ซ้ายไปขวา) - คนในร้าน: {camera['people_in_store']}")
-                                    
-                                    # อัพเดตตัวนับรวม
-                                    self._update_total_counts()
-                                elif not prev_is_left and curr_is_left:
-                                    # เคลื่อนที่จากขวาไปซ้าย (คนเดินออก)
-                                    camera['exit_count'] += 1
-                                    camera['people_in_store'] = max(0, camera['people_in_store'] - 1)  # ป้องกันค่าติดลบ
-                                    self.logger.info(f"กล้อง {camera['name']} ตรวจพบคนออก (ขวาไปซ้าย) - คนในร้าน: {camera['people_in_store']}")
-                                    
-                                    # อัพเดตตัวนับรวม
-                                    self._update_total_counts()
-            
-            # บันทึกตำแหน่งจุดศูนย์กลางปัจจุบันสำหรับการตรวจสอบครั้งต่อไป
-            camera['previous_centers'] = centers
+            cv2.line(frame, (line.x1, line.y1), (line.x2, line.y2), (0, 255, 0), 2)
             
+            # วาดกรอบรอบตัวคน จุดศูนย์กลาง และหมายเลข track
+            for (x, y, w, h), (center_x_point, center_y_point), track_id in zip(boxes, centers, track_ids):
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                cv2.circle(frame, (center_x_point, center_y_point), 4, (0, 0, 255), -1)
+                if track_id >= 0:
+                    cv2.putText(frame, str(track_id), (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+        
         except Exception as e:
             self.logger.error(f"เกิดข้อผิดพลาดในการประมวลผลเฟรมจากกล้อง {camera['name']}: {str(e)}")
+        
+        return frame
+    
+    def _get_line_geometry(self, camera, frame):
+        """ส่งคืนเรขาคณิตของเส้นตรวจจับที่คำนวณไว้ (คำนวณใหม่เมื่อถูกล้างหรือขนาดภาพเปลี่ยน)"""
+        height, width = frame.shape[:2]
+        line = camera['line']
+        if line is None or line.width != width or line.height != height:
+            line = LineGeometry.build(width, height, camera.get('detection_line'), camera.get('detection_angle', 90),
+                                      roi_margin=camera['roi_margin'])
+            camera['line'] = line
+        return line
+    
+    def _apply_count_event(self, camera, event):
+        """ปรับตัวนับตามเหตุการณ์การข้ามเส้น ('entry' หรือ 'exit')"""
+        if event == 'entry':
+            # เคลื่อนที่จากซ้ายไปขวา (คนเดินเข้า)
+            camera['entry_count'] += 1
+            camera['people_in_store'] += 1
+            self.logger.info(f"กล้อง {camera['name']} ตรวจพบคนเข้า (ซ้ายไปขวา) - คนในร้าน: {camera['people_in_store']}")
+        elif event == 'exit':
+            # เคลื่อนที่จากขวาไปซ้าย (คนเดินออก)
+            camera['exit_count'] += 1
+            camera['people_in_store'] = max(0, camera['people_in_store'] - 1)  # ป้องกันค่าติดลบ
+            self.logger.info(f"กล้อง {camera['name']} ตรวจพบคนออก (ขวาไปซ้าย) - คนในร้าน: {camera['people_in_store']}")
+        else:
+            return
+        
+        # อัพเดตตัวนับรวม และแจ้งผู้ที่รอการเปลี่ยนแปลง
+        self._update_total_counts()
+        self._notify_status_changed()
     
     def _record_customer_count(self, camera=None):
         """บันทึกจำนวนลูกค้าลงฐานข้อมูล"""
@@ -523,18 +755,20 @@ def start(self):
             # บันทึกข้อมูลผ่านตัวจัดการข้อมูล
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             self.data_manager.record_customer_count(
-                timestamp=timestamp, 
-                entries=self.entry_count, 
-                exits=self.exit_count, 
+                timestamp=timestamp,
+                entries=self.entry_count,
+                exits=self.exit_count,
                 total_in_store=self.people_in_store,
-                branch_id=self.branch_id
+                branch_id=self.branch_id,
+                camera_counts={cam['id']: (cam['entry_count'], cam['exit_count'], cam['people_in_store'])
+                               for cam in self.cameras}
             )
             
             self.logger.info(f"บันทึกข้อมูลจำนวนลูกค้ารวม: เข้า {self.entry_count}, ออก {self.exit_count}, ในร้าน {self.people_in_store}")
             
             # บันทึกเวลาล่าสุด
             self.last_record_time = time.time()
-                
+        
         except Exception as e:
             self.logger.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูลจำนวนลูกค้า: {str(e)}")
     
@@ -554,6 +788,7 @@ def start(self):
         
         for camera in cameras_to_adjust:
             camera['detection_angle'] = angle
+            camera['line'] = None  # คำนวณเส้นใหม่ในเฟรมถัดไป
             camera_section = f"Camera_{camera['id']}" if camera['id'] > 0 else "Camera"
             self.config_manager.set(camera_section, 'detection_angle', str(angle))
         
@@ -571,13 +806,13 @@ def start(self):
                     return
                 camera = self.cameras[0]
             
-            if not camera['running'] or not camera['cap'] or not camera['cap'].isOpened():
+            if not camera['running'] or not camera['grabber']:
                 self.logger.error(f"กล้อง {camera['name']} ไม่พร้อมสำหรับบันทึกภาพ snapshot")
                 return
             
-            # อ่านเฟรมจากกล้อง
-            ret, frame = camera['cap'].read()
-            if not ret or frame is None:
+            # ใช้เฟรมล่าสุดจากเธรดอ่านภาพ (ห้ามอ่านจาก cap ซ้อนกับเธรดนั้น)
+            frame = camera['grabber'].peek_latest()
+            if frame is None:
                 self.logger.error(f"ไม่สามารถอ่านเฟรมจากกล้อง {camera['name']} สำหรับบันทึกภาพ snapshot")
                 return
             
@@ -610,7 +845,7 @@ def start(self):
             self.logger.info(f"บันทึกภาพ snapshot จากกล้อง {camera['name']}: {filename}")
             
             return filename
-            
+        
         except Exception as e:
             self.logger.error(f"เกิดข้อผิดพลาดในการบันทึกภาพ snapshot: {str(e)}")
             return None
@@ -630,7 +865,7 @@ def start(self):
             camera = self.cameras[0]
         
         # ตรวจสอบสถานะกล้อง
-        if not camera['running'] or not camera['cap'] or not camera['cap'].isOpened():
+        if not camera['running'] or not camera['grabber']:
             self.logger.error(f"กล้อง {camera['name']} ไม่พร้อมสำหรับถ่ายภาพ")
             return None
         
@@ -657,13 +892,13 @@ def start(self):
             
             return frame
         
-        # หรือถ่ายภาพใหม่
+        # หรือใช้เฟรมล่าสุดจากเธรดอ่านภาพ
         try:
-            ret, frame = camera['cap'].read()
-            if not ret or frame is None:
+            frame = camera['grabber'].peek_latest()
+            if frame is None:
                 self.logger.error(f"ไม่สามารถอ่านเฟรมจากกล้อง {camera['name']}")
                 return None
-                
+            
             # เพิ่มข้อมูลลงในภาพด้วย PIL
             pil_img = PIL.Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
             draw = PIL.ImageDraw.Draw(pil_img)
@@ -681,7 +916,7 @@ def start(self):
             frame = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
             
             return frame
-            
+        
         except Exception as e:
             self.logger.error(f"เกิดข้อผิดพลาดในการถ่ายภาพจากกล้อง {camera['name']}: {str(e)}")
             return None
@@ -737,6 +972,10 @@ def start(self):
         
         # บันทึกค่าลงไฟล์
         self.config_manager.save()
+        
+        # ค่าใน [Detection] ใช้ร่วมกันทุกกล้อง จึงสร้างโปรไฟล์ใหม่ให้ทุกกล้อง
+        self.reload_detection_profiles()
+        
         self.logger.info(f"ปรับพารามิเตอร์การตรวจจับสำหรับ {len(cameras_to_adjust)} กล้องแล้ว")
         return True
     
@@ -757,6 +996,7 @@ def start(self):
         for camera in cameras_to_adjust:
             if position > 0:
                 camera['detection_line'] = position
+                camera['line'] = None  # คำนวณเส้นใหม่ในเฟรมถัดไป
                 camera_section = f"Camera_{camera['id']}" if camera['id'] > 0 else "Camera"
                 self.config_manager.set(camera_section, 'detection_line', str(position))
         
@@ -781,6 +1021,7 @@ def start(self):
         for camera in cameras_to_adjust:
             if position > 0:
                 camera['detection_line'] = position
+                camera['line'] = None  # คำนวณเส้นใหม่ในเฟรมถัดไป
                 camera_section = f"Camera_{camera['id']}" if camera['id'] > 0 else "Camera"
                 self.config_manager.set(camera_section, 'detection_line', str(position))
         
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# camera_probe.py - ทดสอบการเชื่อมต่อกล้องในเธรดพื้นหลัง เพื่อไม่ให้คำขอเว็บค้างรอ RTSP timeout
+import threading
+import time
+import uuid
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+from capture_backend import CaptureOptions, open_capture
+
+# สถานะของงานทดสอบ
+PROBE_PENDING = 'pending'
+PROBE_RUNNING = 'running'
+PROBE_DONE = 'done'
+PROBE_TIMEOUT = 'timeout'
+PROBE_BUSY = 'busy'
+
+class CameraProbeService:
+    """บริการทดสอบการเชื่อมต่อกล้องด้วย thread pool ขนาดเล็ก
+    
+    submit() ส่งคืนรหัสงานทันที แล้วเปิดสตรีมและอ่านเฟรมแรกในเธรดของ pool
+    ผลล่าสุดของแต่ละ URL ถูกเก็บไว้ cache_seconds วินาที (รวมผลที่ล้มเหลว) และถ้ามีงานของ URL
+    เดียวกันกำลังทำอยู่จะใช้รหัสงานเดิม งานที่เกิน deadline จะถูกรายงานเป็น timeout
+    
+    งานที่หมดเวลายังยึดเธรดของ pool ไว้จนกว่า backend จะคืนการควบคุม จึงจำกัดจำนวนงานที่ค้างอยู่
+    (รอคิวหรือกำลังทำ รวมงานที่หมดเวลาแล้วแต่ยังไม่จบ) ไว้ที่ max_pending งานที่ส่งเกินจากนี้
+    จะได้สถานะ busy ทันที แทนที่จะรอคิวจนหมดเวลา
+    """
+    
+    def __init__(self, max_workers=2, deadline=8.0, cache_seconds=30.0, job_ttl=300.0, max_pending=None):
+        """กำหนดค่าเริ่มต้นสำหรับบริการทดสอบ (max_pending เริ่มต้นเป็นสองเท่าของ max_workers)"""
+        self.logger = logging.getLogger("CameraProbe")
+        self.deadline = deadline
+        self.cache_seconds = cache_seconds
+        self.job_ttl = job_ttl
+        
+        max_workers = max(1, max_workers)
+        self.max_pending = max(max_workers, max_pending or max_workers * 2)
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='camera-probe')
+        self._lock = threading.Lock()
+        
+        # จำนวนงานที่ส่งเข้า pool แล้วแต่ยังไม่จบ
+        self._in_flight = 0
+        
+        # รหัสงาน -> ข้อมูลงาน
+        self._jobs = {}
+        
+        # (url, ตัวเลือก, ต้องการภาพ) -> รหัสงานล่าสุดของ URL นั้น
+        self._latest_by_key = {}
+    
+    @classmethod
+    def from_config(cls, config_manager):
+        """สร้างบริการจากส่วน [Capture] ของไฟล์ตั้งค่า"""
+        return cls(
+            max_workers=config_manager.getint('Capture', 'probe_workers', fallback=2),
+            deadline=config_manager.getfloat('Capture', 'probe_timeout', fallback=8.0),
+            cache_seconds=config_manager.getfloat('Capture', 'probe_cache_seconds', fallback=30.0),
+            max_pending=config_manager.getint('Capture', 'probe_max_pending', fallback=0) or None
+        )
+    
+    def submit(self, url, options=None, snapshot=False):
+        """ส่งงานทดสอบ URL และส่งคืนรหัสงาน (ใช้ผลใน cache หรืองานที่กำลังทำอยู่ถ้ามี)
+        
+        ถ้ามีงานค้างอยู่ครบ max_pending แล้ว งานที่ส่งคืนจะมีสถานะ busy (ไม่ถูกเก็บเป็นผลของ URL นี้)
+        """
+        options = options or CaptureOptions()
+        key = (url, options, snapshot)
+        now = time.time()
+        
+        with self._lock:
+            self._prune(now)
+            
+            job_id = self._latest_by_key.get(key)
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._check_deadline(job, now)
+                if job['status'] in (PROBE_PENDING, PROBE_RUNNING):
+                    return job_id
+                if job['status'] == PROBE_DONE and now - job['finished_at'] < self.cache_seconds:
+                    return job_id
+            
+            job_id = uuid.uuid4().hex
+            if self._in_flight >= self.max_pending:
+                self._jobs[job_id] = {
+                    'job_id': job_id,
+                    'status': PROBE_BUSY,
+                    'success': False,
+                    'message': f"มีการทดสอบการเชื่อมต่อค้างอยู่ {self._in_flight} งาน กรุณาลองใหม่ภายหลัง",
+                    'backend': None,
+                    'snapshot': None,
+                    'created_at': now,
+                    'started_at': None,
+                    'finished_at': now
+                }
+                self.logger.warning(f"ไม่รับงานทดสอบการเชื่อมต่อใหม่ เนื่องจากมีงานค้างอยู่ {self._in_flight} งาน")
+                return job_id
+            
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': PROBE_PENDING,
+                'success': False,
+                'message': 'กำลังทดสอบการเชื่อมต่อ',
+                'backend': None,
+                'snapshot': None,
+                'created_at': now,
+                'started_at': None,
+                'finished_at': None
+            }
+            self._latest_by_key[key] = job_id
+            self._in_flight += 1
+        
+        self._executor.submit(self._run_probe, job_id, url, options, snapshot)
+        return job_id
+    
+    def get_job(self, job_id):
+        """ส่งคืนสำเนาข้อมูลงาน (หรือ None ถ้าไม่พบ)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._check_deadline(job, time.time())
+            return self._describe(job)
+    
+    def wait(self, job_id, timeout):
+        """รอผลของงานไม่เกิน timeout วินาที แล้วส่งคืนข้อมูลงานล่าสุด"""
+        end_time = time.time() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job is None or job['status'] in (PROBE_DONE, PROBE_TIMEOUT, PROBE_BUSY) or time.time() >= end_time:
+                return job
+            time.sleep(0.05)
+    
+    def shutdown(self):
+        """หยุดรับงานใหม่ (งานที่กำลังเปิดสตรีมอยู่จะจบเองตาม timeout ของ backend)"""
+        self._executor.shutdown(wait=False)
+    
+    def _run_probe(self, job_id, url, options, snapshot):
+        """ทำงานทดสอบหนึ่งงาน และนับว่างานจบเมื่อ backend คืนการควบคุม (เรียกจากเธรดของ pool)"""
+        try:
+            self._probe(job_id, url, options, snapshot)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+    
+    def _probe(self, job_id, url, options, snapshot):
+        """เปิดสตรีมและอ่านเฟรมแรก"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = PROBE_RUNNING
+            job['started_at'] = time.time()
+        
+        # จำกัดเวลาเปิด/อ่านของ backend ให้อยู่ภายใน deadline ของงาน
+        deadline_ms = int(self.deadline * 1000)
+        options = options._replace(
+            open_timeout_ms=min(options.open_timeout_ms, deadline_ms),
+            read_timeout_ms=min(options.read_timeout_ms, deadline_ms)
+        )
+        
+        success = False
+        backend = None
+        image = None
+        cap = None
+        try:
+            cap, backend = open_capture(url, options)
+            if cap.isOpened():
+                ret, frame = cap.read()
+                if ret and frame is not None:
+                    success = True
+                    message = 'เชื่อมต่อกับกล้องสำเร็จ'
+                    if snapshot:
+                        _, buffer = cv2.imencode('.jpg', frame)
+                        image = base64.b64encode(buffer).decode('utf-8')
+                else:
+                    message = 'เปิดการเชื่อมต่อได้ แต่ไม่สามารถอ่านเฟรมได้'
+            else:
+                message = 'ไม่สามารถเชื่อมต่อกับกล้องได้'
+        except Exception as e:
+            self.logger.error(f"เกิดข้อผิดพลาดในการทดสอบการเชื่อมต่อกับกล้อง: {str(e)}")
+            message = f"เกิดข้อผิดพลาด: {str(e)}"
+        finally:
+            if cap is not None:
+                cap.release()
+        
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update({
+                'status': PROBE_DONE,
+                'success': success,
+                'message': message,
+                'backend': backend,
+                'snapshot': image,
+                'finished_at': time.time()
+            })
+        
+        self.logger.info(f"ทดสอบการเชื่อมต่อเสร็จ ({backend}): {message}")
+    
+    def _check_deadline(self, job, now):
+        """เปลี่ยนสถานะงานที่ยังไม่เสร็จภายใน deadline เป็น timeout (ต้องถือ lock อยู่)"""
+        if job['status'] not in (PROBE_PENDING, PROBE_RUNNING):
+            return
+        
+        # นับ deadline ตั้งแต่เริ่มทำงานจริง และเผื่อเวลารอคิวใน pool อีกหนึ่ง deadline
+        started_at = job['started_at'] or job['created_at'] + self.deadline
+        if now - started_at > self.deadline + 1.0:
+            job.update({
+                'status': PROBE_TIMEOUT,
+                'success': False,
+                'message': f"หมดเวลาทดสอบการเชื่อมต่อ ({self.deadline:.0f} วินาที)",
+                'finished_at': now
+            })
+    
+    def _prune(self, now):
+        """ลบงานที่เก่ากว่า job_ttl (ต้องถือ lock อยู่)"""
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] is not None and now - job['finished_at'] > self.job_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        
+        if expired:
+            self._latest_by_key = {key: job_id for key, job_id in self._latest_by_key.items() if job_id in self._jobs}
+    
+    def _describe(self, job):
+        """ข้อมูลงานสำหรับส่งกลับให้ผู้เรียก"""
+        result = {
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'success': job['success'],
+            'message': job['message'],
+            'backend': job['backend'],
+            'snapshot': job['snapshot']
+        }
+        if job['finished_at'] is not None:
+            result['age_seconds'] = round(time.time() - job['finished_at'], 1)
+        return result
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# capture_backend.py - เลือก backend สำหรับเปิดสตรีมกล้อง (FFmpeg/GStreamer) พร้อมตัวเลือกการถอดรหัส
+import os
+import threading
+import logging
+from typing import NamedTuple
+import cv2
+
+logger = logging.getLogger("CaptureBackend")
+
+# OpenCV อ่านตัวเลือกของ FFmpeg จากตัวแปรสภาพแวดล้อมตอนเปิดสตรีม จึงต้องกันไม่ให้ค่าถูกเปลี่ยนระหว่างเปิด
+# การเปิดที่ใช้ตัวเลือกเดียวกันทำพร้อมกันได้ (เช่นตอนเริ่มกล้องหลายตัวพร้อมกัน) ส่วนตัวเลือกอื่นต้องรอให้เปิดเสร็จก่อน
+_ffmpeg_env_condition = threading.Condition()
+_ffmpeg_env_value = None
+_ffmpeg_env_users = 0
+_ffmpeg_env_previous = None
+
+class CaptureOptions(NamedTuple):
+    """ตัวเลือกการเปิดสตรีมของกล้องหนึ่งตัว"""
+    backend: str = 'auto'        # auto, ffmpeg, gstreamer
+    rtsp_transport: str = 'tcp'  # tcp หรือ udp
+    decoder_buffer: int = 1      # จำนวนเฟรมที่ decoder เก็บไว้ (น้อย = หน่วงน้อย)
+    low_delay: bool = True       # ปิดการบัฟเฟอร์ของ demuxer/decoder
+    decode_threads: int = 0      # จำนวนเธรดถอดรหัส (0 = ให้ไลบรารีเลือก)
+    hw_accel: bool = False       # ขอใช้ตัวถอดรหัสฮาร์ดแวร์ถ้ามี
+    open_timeout_ms: int = 5000
+    read_timeout_ms: int = 5000
+
+def load_capture_options(config_manager, camera_section=None):
+    """อ่านตัวเลือกจาก [Capture] และแทนที่ด้วยค่าในส่วนของกล้อง (ถ้ามี)"""
+    def get(getter, option, default):
+        value = getter('Capture', option, fallback=default)
+        if camera_section and config_manager.has_option(camera_section, option):
+            value = getter(camera_section, option, fallback=value)
+        return value
+    
+    return CaptureOptions(
+        backend=get(config_manager.get, 'backend', 'auto').strip().lower(),
+        rtsp_transport=get(config_manager.get, 'rtsp_transport', 'tcp').strip().lower(),
+        decoder_buffer=get(config_manager.getint, 'decoder_buffer', 1),
+        low_delay=get(config_manager.getboolean, 'low_delay', True),
+        decode_threads=get(config_manager.getint, 'decode_threads', 0),
+        hw_accel=get(config_manager.getboolean, 'hw_accel', False),
+        open_timeout_ms=get(config_manager.getint, 'open_timeout_ms', 5000),
+        read_timeout_ms=get(config_manager.getint, 'read_timeout_ms', 5000)
+    )
+
+def _is_stream_url(source):
+    """ตรวจสอบว่าแหล่งภาพเป็น URL ของสตรีม (ไม่ใช่หมายเลขอุปกรณ์หรือไฟล์)"""
+    return isinstance(source, str) and source.lower().startswith(('rtsp://', 'rtsps://', 'http://', 'https://'))
+
+def _ffmpeg_options(options):
+    """สร้างค่าสำหรับ OPENCV_FFMPEG_CAPTURE_OPTIONS"""
+    parts = [f"rtsp_transport;{options.rtsp_transport}"]
+    if options.low_delay:
+        parts += ["fflags;nobuffer", "flags;low_delay", "max_delay;0"]
+    if options.decode_threads > 0:
+        parts.append(f"threads;{options.decode_threads}")
+    return '|'.join(parts)
+
+def _timeout_params(options):
+    """พารามิเตอร์เวลาเปิด/อ่านสตรีม และการถอดรหัสฮาร์ดแวร์สำหรับ cv2.VideoCapture"""
+    params = [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, options.open_timeout_ms,
+        cv2.CAP_PROP_READ_TIMEOUT_MSEC, options.read_timeout_ms
+    ]
+    if options.hw_accel:
+        params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    return params
+
+def _open_ffmpeg(source, options):
+    """เปิดสตรีมด้วย FFmpeg พร้อมตัวเลือก transport และ low delay"""
+    global _ffmpeg_env_value, _ffmpeg_env_users, _ffmpeg_env_previous
+    
+    value = _ffmpeg_options(options)
+    with _ffmpeg_env_condition:
+        _ffmpeg_env_condition.wait_for(lambda: _ffmpeg_env_users == 0 or _ffmpeg_env_value == value)
+        if _ffmpeg_env_users == 0:
+            _ffmpeg_env_value = value
+            _ffmpeg_env_previous = os.environ.get('OPENCV_FFMPEG_CAPTURE_OPTIONS')
+            os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = value
+        _ffmpeg_env_users += 1
+    
+    try:
+        return cv2.VideoCapture(source, cv2.CAP_FFMPEG, _timeout_params(options))
+    finally:
+        with _ffmpeg_env_condition:
+            _ffmpeg_env_users -= 1
+            if _ffmpeg_env_users == 0:
+                if _ffmpeg_env_previous is None:
+                    os.environ.pop('OPENCV_FFMPEG_CAPTURE_OPTIONS', None)
+                else:
+                    os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = _ffmpeg_env_previous
+                _ffmpeg_env_value = None
+                _ffmpeg_env_condition.notify_all()
+
+def _open_gstreamer(source, options):
+    """เปิดสตรีม RTSP ด้วย pipeline ของ GStreamer (decodebin เลือกตัวถอดรหัสฮาร์ดแวร์ให้เองถ้าติดตั้งไว้)"""
+    latency = 0 if options.low_delay else 200
+    pipeline = (
+        f"rtspsrc location=\"{source}\" protocols={options.rtsp_transport} latency={latency} "
+        f"! decodebin ! videoconvert ! video/x-raw,format=BGR "
+        f"! appsink drop=true max-buffers={max(1, options.decoder_buffer)} sync=false"
+    )
+    return cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+
+def open_capture(source, options=None, camera_name=None):
+    """เปิดแหล่งภาพตาม backend ที่เลือก แล้วส่งคืน (cap, ชื่อ backend)
+    
+    ถ้าเปิดด้วย GStreamer ไม่ได้จะลอง FFmpeg และถ้า backend ไม่รู้จักหรือเกิดข้อผิดพลาด
+    จะเปิดด้วยค่าเริ่มต้นของ OpenCV แทน
+    """
+    options = options or CaptureOptions()
+    label = camera_name or source
+    cap = None
+    
+    # กล้อง USB/ไฟล์ ใช้ค่าเริ่มต้นของ OpenCV
+    if not _is_stream_url(source):
+        cap = cv2.VideoCapture(source)
+    else:
+        try:
+            if options.backend == 'gstreamer' and source.lower().startswith(('rtsp://', 'rtsps://')):
+                cap = _open_gstreamer(source, options)
+            elif options.backend in ('auto', 'ffmpeg'):
+                cap = _open_ffmpeg(source, options)
+        except Exception as e:
+            logger.warning(f"ไม่สามารถเปิด {label} ด้วย backend {options.backend}: {str(e)}")
+            cap = None
+        
+        if cap is not None and not cap.isOpened() and options.backend == 'gstreamer':
+            # OpenCV บางชุดไม่ได้คอมไพล์ GStreamer มาด้วย ให้ลอง FFmpeg แทน
+            cap.release()
+            logger.warning(f"GStreamer เปิด {label} ไม่สำเร็จ ลองใช้ FFmpeg แทน")
+            cap = _open_ffmpeg(source, options)
+        elif cap is None:
+            cap = cv2.VideoCapture(source)
+    
+    if cap.isOpened():
+        try:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, options.decoder_buffer)
+        except Exception:
+            pass
+    
+    return cap, backend_name_of(cap)
+
+def backend_name_of(cap):
+    """ชื่อ backend ที่ OpenCV ใช้จริงกับสตรีมนี้"""
+    try:
+        return cap.getBackendName()
+    except Exception:
+        return 'unknown'
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# centroid_tracker.py - ติดตามวัตถุข้ามเฟรมด้วยหมายเลข track และนับการข้ามเส้นครั้งเดียวต่อการข้าม
+import numpy as np
+
+# ระยะห่างสูงสุดสำหรับพิจารณาว่าเป็นวัตถุเดียวกันระหว่างสองเฟรม (พิกเซล)
+MATCH_DISTANCE = 50
+
+def associate_centroids(centers, previous_centers, max_distance=MATCH_DISTANCE):
+    """จับคู่จุดศูนย์กลางปัจจุบันกับจุดศูนย์กลางก่อนหน้าแบบหนึ่งต่อหนึ่ง
+    
+    สร้างตารางระยะทางทั้งหมดด้วย NumPy ครั้งเดียว แล้วเลือกคู่ที่ใกล้ที่สุดก่อนแบบ greedy
+    จุดหนึ่งจึงถูกจับคู่ได้เพียงครั้งเดียว ส่งคืน (index ปัจจุบัน, index ก่อนหน้า, ระยะทาง)
+    """
+    if len(centers) == 0 or len(previous_centers) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0)
+    
+    current = np.asarray(centers, dtype=np.float64)
+    previous = np.asarray(previous_centers, dtype=np.float64)
+    
+    # ตารางระยะทาง (จำนวนจุดปัจจุบัน x จำนวนจุดก่อนหน้า)
+    distances = np.linalg.norm(current[:, None, :] - previous[None, :, :], axis=2)
+    
+    # เลือกเฉพาะคู่ที่อยู่ใกล้พอ แล้วเรียงจากใกล้ไปไกล
+    rows, cols = np.nonzero(distances < max_distance)
+    order = np.argsort(distances[rows, cols], kind='stable')
+    
+    matched_rows = []
+    matched_cols = []
+    used_rows = set()
+    used_cols = set()
+    for k in order:
+        row, col = rows[k], cols[k]
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    
+    matched_rows = np.array(matched_rows, dtype=np.intp)
+    matched_cols = np.array(matched_cols, dtype=np.intp)
+    return matched_rows, matched_cols, distances[matched_rows, matched_cols]
+
+class CentroidTracker:
+    """ตัวติดตามจุดศูนย์กลางแบบหลายวัตถุที่เก็บข้อมูลใน array ขนาดคงที่
+    
+    แต่ละ track มีหมายเลขถาวร จำตำแหน่งไว้ได้แม้ตรวจจับไม่พบบางเฟรม (ไม่เกิน max_missed เฟรม)
+    และเก็บฝั่งของเส้นที่ยืนยันแล้ว จึงนับการข้ามเส้นได้ครั้งเดียวต่อการข้ามจริงหนึ่งครั้ง
+    หน่วยความจำและเวลาต่อเฟรมถูกจำกัดด้วย max_tracks
+    """
+    
+    def __init__(self, max_tracks=64, max_missed=5, max_distance=MATCH_DISTANCE):
+        """กำหนดค่าเริ่มต้นสำหรับตัวติดตาม"""
+        self.max_tracks = max_tracks
+        self.max_missed = max_missed
+        self.max_distance = max_distance
+        
+        # ข้อมูลของแต่ละช่อง (slot) ของ track
+        self.active = np.zeros(max_tracks, dtype=bool)
+        self.ids = np.zeros(max_tracks, dtype=np.int64)
+        self.positions = np.zeros((max_tracks, 2), dtype=np.float64)  # ตำแหน่งล่าสุด
+        self.anchors = np.zeros((max_tracks, 2), dtype=np.float64)    # ตำแหน่งที่ยืนยันฝั่งของเส้นครั้งล่าสุด
+        self.sides = np.zeros(max_tracks, dtype=bool)                 # True = อยู่ทางซ้ายของเส้น
+        self.missed = np.zeros(max_tracks, dtype=np.int32)            # จำนวนเฟรมที่ตรวจไม่พบติดกัน
+        
+        self._next_id = 1
+        self._line = None
+    
+    def reset(self):
+        """ล้าง track ทั้งหมด"""
+        self.active[:] = False
+        self._line = None
+    
+    @property
+    def track_count(self):
+        """จำนวน track ที่ยังติดตามอยู่"""
+        return int(np.count_nonzero(self.active))
+    
+    def update(self, centers, line, direction_threshold):
+        """อัพเดต track ด้วยจุดศูนย์กลางของเฟรมปัจจุบัน
+        
+        ส่งคืน (track_ids, events) โดย track_ids เรียงตาม centers (-1 ถ้าไม่มีช่องว่างให้ track ใหม่)
+        และ events เป็นรายการ 'entry' หรือ 'exit' ของ track ที่ข้ามเส้นในเฟรมนี้
+        """
+        points = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        track_ids = np.full(len(points), -1, dtype=np.int64)
+        events = []
+        
+        # ถ้าเส้นตรวจจับเปลี่ยน ให้ยืนยันฝั่งของทุก track ใหม่จากตำแหน่งปัจจุบัน (ไม่นับเป็นการข้ามเส้น)
+        if line != self._line:
+            live = np.flatnonzero(self.active)
+            self.sides[live] = line.is_left_many(self.positions[live])
+            self.anchors[live] = self.positions[live]
+            self._line = line
+        
+        # จับคู่จุดศูนย์กลางกับ track ที่มีอยู่
+        slots = np.flatnonzero(self.active)
+        rows, cols, _ = associate_centroids(points, self.positions[slots], self.max_distance)
+        matched = slots[cols]
+        
+        if len(rows):
+            matched_points = points[rows]
+            self.positions[matched] = matched_points
+            self.missed[matched] = 0
+            track_ids[rows] = self.ids[matched]
+            
+            # ข้ามเส้นเมื่ออยู่คนละฝั่งกับฝั่งที่ยืนยันไว้ และเคลื่อนที่จากจุดยืนยันมากกว่าค่า threshold
+            is_left = line.is_left_many(matched_points)
+            moved = np.linalg.norm(matched_points - self.anchors[matched], axis=1)
+            crossed = (is_left != self.sides[matched]) & (moved > direction_threshold)
+            
+            if crossed.any():
+                crossed_slots = matched[crossed]
+                
+                # ซ้ายไปขวา = คนเดินเข้า, ขวาไปซ้าย = คนเดินออก
+                events = ['entry' if was_left else 'exit' for was_left in self.sides[crossed_slots]]
+                
+                self.sides[crossed_slots] = is_left[crossed]
+                self.anchors[crossed_slots] = matched_points[crossed]
+        
+        # track ที่ไม่พบในเฟรมนี้ จะถูกลบเมื่อหายไปเกิน max_missed เฟรม
+        unmatched = np.setdiff1d(slots, matched, assume_unique=True)
+        self.missed[unmatched] += 1
+        self.active[unmatched[self.missed[unmatched] > self.max_missed]] = False
+        
+        # สร้าง track ใหม่สำหรับจุดที่ไม่ถูกจับคู่ เท่าที่มีช่องว่าง
+        new_rows = np.setdiff1d(np.arange(len(points)), rows, assume_unique=True)
+        free = np.flatnonzero(~self.active)[:len(new_rows)]
+        new_rows = new_rows[:len(free)]
+        
+        if len(new_rows):
+            new_points = points[new_rows]
+            new_ids = np.arange(self._next_id, self._next_id + len(new_rows))
+            self._next_id += len(new_rows)
+            
+            self.active[free] = True
+            self.ids[free] = new_ids
+            self.positions[free] = new_points
+            self.anchors[free] = new_points
+            self.sides[free] = line.is_left_many(new_points)
+            self.missed[free] = 0
+            track_ids[new_rows] = new_ids
+        
+        return track_ids.tolist(), events
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# count_journal.py - ไฟล์บันทึกแบบต่อท้าย (append-only) สำหรับเก็บข้อมูลจำนวนลูกค้าที่เขียนลงฐานข้อมูลไม่ได้
+import os
+import json
+import zlib
+import threading
+import time
+import logging
+
+class CountJournal:
+    """ไฟล์บันทึกที่เก็บหนึ่งรายการต่อหนึ่งบรรทัด ในรูปแบบ '<crc32 เลขฐาน 16> <JSON>'
+    
+    รายการถูกต่อท้ายไฟล์เดียวเสมอ จึงไม่มีการเขียนทับกัน และ fsync เป็นชุด (อย่างมากทุก
+    fsync_interval วินาที) เพื่อไม่ให้การเขียนทีละรายการต้องรอดิสก์ทุกครั้ง
+    ตอนกู้คืน บรรทัดที่ checksum ไม่ตรงหรือเขียนไม่ครบ (เช่นไฟดับระหว่างเขียน) จะถูกข้าม
+    """
+    
+    def __init__(self, path='cache/customer_counts.journal', fsync_interval=1.0):
+        """เปิดไฟล์บันทึกสำหรับต่อท้าย"""
+        self.logger = logging.getLogger("CountJournal")
+        self.path = path
+        self.replay_path = f"{path}.replay"
+        self.fsync_interval = fsync_interval
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._last_sync = 0.0
+        self._sync_timer = None
+        
+        # สถิติ
+        self.appended_records = 0
+        self.sync_count = 0
+    
+    def append(self, records):
+        """ต่อท้ายรายการ (dict ที่แปลงเป็น JSON ได้) และ fsync ถ้าถึงรอบ ไม่เช่นนั้นตั้งเวลา fsync ไว้"""
+        if not records:
+            return
+        
+        lines = []
+        for record in records:
+            payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            lines.append(b'%08x %s\n' % (zlib.crc32(payload), payload))
+        
+        with self._lock:
+            if self._file is None:
+                self._file = self._open_for_append()
+            self._file.write(b''.join(lines))
+            self._file.flush()
+            self._dirty = True
+            self.appended_records += len(records)
+            
+            if time.time() - self._last_sync >= self.fsync_interval:
+                self._sync_locked()
+            elif self._sync_timer is None:
+                self._sync_timer = threading.Timer(self.fsync_interval, self.sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+    
+    def _open_for_append(self):
+        """เปิดไฟล์สำหรับต่อท้าย ถ้าบรรทัดสุดท้ายเขียนไม่ครบ ให้ปิดบรรทัดก่อน เพื่อไม่ให้รายการใหม่ต่อเข้ากับบรรทัดที่เสีย"""
+        f = open(self.path, 'ab')
+        if f.tell() > 0:
+            with open(self.path, 'rb') as reader:
+                reader.seek(-1, os.SEEK_END)
+                if reader.read(1) != b'\n':
+                    f.write(b'\n')
+        return f
+    
+    def sync(self):
+        """บังคับเขียนข้อมูลที่ค้างอยู่ลงดิสก์"""
+        with self._lock:
+            self._sync_locked()
+    
+    def _sync_locked(self):
+        """fsync ไฟล์ (ต้องถือ lock อยู่)"""
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        
+        if self._file is not None and self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self.sync_count += 1
+        self._last_sync = time.time()
+    
+    def begin_replay(self):
+        """ย้ายไฟล์บันทึกปัจจุบันไปเป็นไฟล์กู้คืน แล้วส่งคืนรายการทั้งหมดที่ต้องนำกลับไปเขียน
+        
+        ถ้ามีไฟล์กู้คืนค้างจากครั้งก่อน (เขียนลงฐานข้อมูลไม่สำเร็จ) จะรวมรายการเข้าไปด้วย
+        รายการใหม่ที่ต่อท้ายระหว่างกู้คืนจะไปอยู่ในไฟล์บันทึกใหม่ และไม่ปนกับชุดที่กำลังกู้คืน
+        """
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            
+            if os.path.exists(self.path):
+                if os.path.exists(self.replay_path):
+                    # ต่อไฟล์บันทึกเข้ากับไฟล์กู้คืนที่ค้างอยู่ เพื่อไม่ให้รายการใดหาย
+                    with open(self.path, 'rb') as source, open(self.replay_path, 'ab') as target:
+                        for chunk in iter(lambda: source.read(65536), b''):
+                            target.write(chunk)
+                        target.flush()
+                        os.fsync(target.fileno())
+                    os.remove(self.path)
+                else:
+                    os.replace(self.path, self.replay_path)
+        
+        if not os.path.exists(self.replay_path):
+            return []
+        return self._read_records(self.replay_path)
+    
+    def finish_replay(self):
+        """ลบไฟล์กู้คืนหลังจากเขียนรายการทั้งหมดลงฐานข้อมูลสำเร็จ"""
+        if os.path.exists(self.replay_path):
+            os.remove(self.replay_path)
+    
+    def _read_records(self, path):
+        """อ่านรายการที่ checksum ถูกต้องจากไฟล์"""
+        records = []
+        skipped = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                # บรรทัดสุดท้ายที่ไม่มี newline คือรายการที่เขียนไม่ครบ
+                if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b' ':
+                    skipped += 1
+                    continue
+                
+                payload = line[9:-1]
+                try:
+                    if int(line[:8], 16) != zlib.crc32(payload):
+                        skipped += 1
+                        continue
+                    records.append(json.loads(payload.decode('utf-8')))
+                except ValueError:
+                    skipped += 1
+        
+        if skipped:
+            self.logger.warning(f"ข้ามรายการที่เสียหายในไฟล์บันทึก {path}: {skipped} รายการ")
+        return records
+    
+    def close(self):
+        """fsync และปิดไฟล์บันทึก"""
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def get_stats(self):
+        """ส่งคืนสถิติของไฟล์บันทึก"""
+        return {
+            'appended_records': self.appended_records,
+            'sync_count': self.sync_count,
+            'size_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        }
@@ -1,17 +1,31 @@
 #!/usr/bin/env python3
 # data_manager.py - จัดการข้อมูลของระบบนับลูกค้าและจัดการพนักงาน
-import sqlite3
 import datetime
 import logging
 import os
-import csv
 import json
-import shutil
 import time
+import threading
+import itertools
+
+from db_connection import ConnectionManager
+from write_behind import WriteBehindQueue
+from traffic_rollup import BRANCH_TOTAL, CounterDeltas, create_rollup_tables, backfill_rollups, rollup_samples, write_rollups
+from query_cache import QueryCache
+from stream_export import EXPORT_DATASETS, encode_export
+from count_journal import CountJournal
 
 class DataManager:
     """คลาสสำหรับจัดการข้อมูลของระบบ"""
     
+    # ลำดับการปรับโครงสร้างฐานข้อมูล (เวอร์ชัน, คำอธิบาย, ชื่อเมธอด) เวอร์ชันปัจจุบันเก็บใน PRAGMA user_version
+    # ไฟล์ฐานข้อมูลเดิมจะถูกปรับทีละเวอร์ชันที่ยังไม่ได้ทำ ห้ามแก้เมธอดของเวอร์ชันที่ออกไปแล้ว ให้เพิ่มเวอร์ชันใหม่แทน
+    SCHEMA_MIGRATIONS = [
+        (1, 'ตารางหลัก', '_create_tables'),
+        (2, 'ดัชนีข้อมูลที่ยังไม่ซิงค์และดัชนีตามช่วงเวลา', '_create_sync_and_time_indexes'),
+        (3, 'ตารางสรุปรายชั่วโมงและราย 15 นาที', '_create_traffic_rollups')
+    ]
+    
     def __init__(self, config_manager, branch_id=None):
         """กำหนดค่าเริ่มต้นสำหรับตัวจัดการข้อมูล"""
         # ตั้งค่าระบบบันทึก log
@@ -24,6 +38,14 @@ class DataManager:
         # กำหนดพาธของฐานข้อมูล
         self.db_name = config_manager.get('Database', 'db_name', fallback='shop_tracking.db')
         
+        # การเชื่อมต่อถาวร: ตัวเขียนหนึ่งตัวและ pool ของตัวอ่าน ในโหมด WAL
+        self.db = ConnectionManager(
+            self.db_name,
+            read_connections=config_manager.getint('Database', 'read_connections', fallback=4),
+            synchronous=config_manager.get('Database', 'synchronous', fallback='NORMAL'),
+            cache_size_kb=config_manager.getint('Database', 'cache_size_kb', fallback=8192)
+        )
+        
         # สร้างฐานข้อมูล
         self._setup_database()
         
@@ -33,6 +55,32 @@ class DataManager:
         # รอบเวลาสำรองฐานข้อมูล (วินาที)
         self.backup_interval = config_manager.getint('Database', 'backup_interval', fallback=86400)  # 24 ชั่วโมง
         
+        # แปลงตัวนับสะสมเป็นจำนวนที่เพิ่มขึ้นสำหรับตารางสรุป (ล็อกไว้ให้ลำดับในคิวตรงกับลำดับที่คำนวณ)
+        self.count_deltas = CounterDeltas()
+        self._record_lock = threading.Lock()
+        
+        # แคชผลลัพธ์ของหน้าสถิติ ถูกล้างเมื่อมีการเขียนจำนวนลูกค้าใหม่
+        self.stats_cache = QueryCache(
+            max_entries=config_manager.getint('Database', 'stats_cache_size', fallback=128),
+            ttl=config_manager.getfloat('Database', 'stats_cache_ttl', fallback=300.0)
+        )
+        
+        # ไฟล์บันทึกสำรองสำหรับข้อมูลที่เขียนลงฐานข้อมูลไม่ได้ หรือล้นคิว
+        self.journal = CountJournal(
+            os.path.join('cache', 'customer_counts.journal'),
+            fsync_interval=config_manager.getfloat('Database', 'journal_fsync_interval', fallback=1.0)
+        )
+        
+        # คิวเขียนข้อมูลจำนวนลูกค้า: เธรดกล้องไม่ต้องรอการเขียนลงดิสก์ และหลายรายการถูกเขียนในหนึ่ง transaction
+        self.count_queue = WriteBehindQueue(
+            'customer_counts',
+            flush_func=self._write_count_records,
+            overflow_func=self._cache_count_records,
+            max_size=config_manager.getint('Database', 'write_queue_size', fallback=1000),
+            batch_size=config_manager.getint('Database', 'write_batch_size', fallback=200),
+            flush_interval=config_manager.getfloat('Database', 'flush_interval', fallback=1.0)
+        )
+        
         # ตรวจสอบและลองนำข้อมูลจากแคชมาใช้
         self._check_cached_data()
         
@@ -43,207 +91,268 @@ class DataManager:
         os.makedirs(export_path, exist_ok=True)
     
     def _setup_database(self):
-        """สร้างฐานข้อมูลและตารางที่จำเป็น"""
+        """สร้างฐานข้อมูลและปรับโครงสร้างให้เป็นเวอร์ชันล่าสุด"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
+            with self.db.write() as conn:
+                current_version = conn.execute("PRAGMA user_version").fetchone()[0]
             
-            # สร้างตารางพนักงาน
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                position TEXT NOT NULL,
-                status TEXT DEFAULT 'available'
-            )
-            ''')
-            
-            # สร้างตารางการนัดหมาย
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS appointments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_name TEXT NOT NULL,
-                phone TEXT,
-                date TEXT NOT NULL,
-                time TEXT NOT NULL,
-                service TEXT NOT NULL,
-                employee_id INTEGER,
-                status TEXT DEFAULT 'scheduled',
-                notes TEXT,
-                synced BOOLEAN DEFAULT 0,
-                FOREIGN KEY (employee_id) REFERENCES employees (id)
-            )
-            ''')
-            
-            # สร้างตารางบันทึกจำนวนลูกค้า
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customer_counts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                branch_id TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                entries INTEGER NOT NULL,
-                exits INTEGER NOT NULL,
-                total_in_store INTEGER NOT NULL,
-                synced BOOLEAN DEFAULT 0
-            )
-            ''')
-            
-            # สร้างตารางสถิติประจำวัน
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS daily_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                branch_id TEXT NOT NULL,
-                date TEXT NOT NULL,
-                total_entries INTEGER NOT NULL,
-                total_exits INTEGER NOT NULL,
-                peak_time TEXT,
-                peak_count INTEGER,
-                notes TEXT,
-                synced BOOLEAN DEFAULT 0,
-                UNIQUE(branch_id, date)
-            )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            for version, description, method_name in self.SCHEMA_MIGRATIONS:
+                if version <= current_version:
+                    continue
+                
+                # แต่ละเวอร์ชันทำใน transaction ของตัวเอง ถ้าล้มเหลวจะไม่มีการเปลี่ยนแปลงใดค้างอยู่
+                with self.db.write() as conn:
+                    conn.execute("BEGIN")
+                    getattr(self, method_name)(conn.cursor())
+                    conn.execute(f"PRAGMA user_version = {int(version)}")
+                
+                current_version = version
+                self.logger.info(f"ปรับโครงสร้างฐานข้อมูลเป็นเวอร์ชัน {version}: {description}")
             
-            self.logger.info(f"เตรียมฐานข้อมูล: {self.db_name}")
+            self.logger.info(f"เตรียมฐานข้อมูล: {self.db_name} (เวอร์ชัน {current_version}, journal: {self.db.journal_mode})")
             return True
             
         except Exception as e:
             self.logger.error(f"เกิดข้อผิดพลาดในการเตรียมฐานข้อมูล: {str(e)}")
             return False
     
-    def record_customer_count(self, timestamp, entries, exits, total_in_store, branch_id=None):
-        """บันทึกจำนวนลูกค้าลงฐานข้อมูล"""
-        try:
-            # ใช้ branch_id ที่ส่งมา หรือใช้ค่าเริ่มต้น
-            branch_id = branch_id or self.branch_id
-            
-            conn = sqlite3.connect(self.db_name)
+    def _create_tables(self, cursor):
+        """สร้างตารางหลักของระบบ (ถ้ายังไม่มี)"""
+        # สร้างตารางพนักงาน
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            position TEXT NOT NULL,
+            status TEXT DEFAULT 'available'
+        )
+        ''')
+        
+        # สร้างตารางการนัดหมาย
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_name TEXT NOT NULL,
+            phone TEXT,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            service TEXT NOT NULL,
+            employee_id INTEGER,
+            status TEXT DEFAULT 'scheduled',
+            notes TEXT,
+            synced BOOLEAN DEFAULT 0,
+            FOREIGN KEY (employee_id) REFERENCES employees (id)
+        )
+        ''')
+        
+        # สร้างตารางบันทึกจำนวนลูกค้า
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customer_counts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            branch_id TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            entries INTEGER NOT NULL,
+            exits INTEGER NOT NULL,
+            total_in_store INTEGER NOT NULL,
+            synced BOOLEAN DEFAULT 0
+        )
+        ''')
+        
+        # สร้างตารางสถิติประจำวัน
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            branch_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            total_entries INTEGER NOT NULL,
+            total_exits INTEGER NOT NULL,
+            peak_time TEXT,
+            peak_count INTEGER,
+            notes TEXT,
+            synced BOOLEAN DEFAULT 0,
+            UNIQUE(branch_id, date)
+        )
+        ''')
+    
+    def _create_sync_and_time_indexes(self, cursor):
+        """ดัชนีบางส่วน (partial) สำหรับแถวที่ยังไม่ซิงค์ และดัชนีสำหรับค้นหาตามช่วงเวลา"""
+        # get_unsync_data ค้นหา WHERE synced = 0 ORDER BY ... ดัชนีจึงเก็บเฉพาะแถวที่ยังไม่ซิงค์ และเล็กอยู่เสมอ
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_customer_counts_unsynced ON customer_counts (timestamp) WHERE synced = 0")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_stats_unsynced ON daily_stats (date) WHERE synced = 0")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_unsynced ON appointments (date, time) WHERE synced = 0")
+        
+        # ค้นหาและส่งออกตามช่วงเวลาของแต่ละสาขา
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_customer_counts_branch_time ON customer_counts (branch_id, timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments (date, employee_id)")
+    
+    def _create_traffic_rollups(self, cursor):
+        """ตารางสรุปจำนวนคนเข้า/ออกตามช่วงเวลา พร้อมเติมยอดรวมของสาขาจากข้อมูลดิบที่มีอยู่"""
+        create_rollup_tables(cursor)
+        row_count = backfill_rollups(cursor)
+        if row_count:
+            self.logger.info(f"สร้างข้อมูลสรุปตามช่วงเวลาจากข้อมูลเดิม {row_count} รายการ")
+    
+    def record_customer_count(self, timestamp, entries, exits, total_in_store, branch_id=None, camera_counts=None):
+        """ส่งจำนวนลูกค้าเข้าคิวเขียน (ไม่รอการเขียนลงดิสก์) ส่งคืน False ถ้าต้องเก็บลงแคชแทน
+        
+        camera_counts คือ {camera_id: (entries, exits, people_in_store)} ของแต่ละกล้อง (ถ้ามี)
+        ใช้สำหรับตารางสรุปรายกล้อง
+        """
+        branch_id = branch_id or self.branch_id
+        
+        # บันทึกวันและเวลาตอนรับข้อมูล เพื่อไม่ให้การเขียนที่หน่วงไปทำให้วันที่ของ daily_stats คลาดเคลื่อน
+        now = datetime.datetime.now()
+        
+        with self._record_lock:
+            # จำนวนที่เพิ่มขึ้นตั้งแต่ครั้งก่อน ของทั้งสาขาและของแต่ละกล้อง แบ่งตามช่วงเวลาที่เพิ่มขึ้น
+            pieces = self.count_deltas.advance((branch_id, BRANCH_TOTAL), entries, exits, now)
+            rollup = rollup_samples(branch_id, BRANCH_TOTAL, pieces, total_in_store)
+            for camera_id, (camera_entries, camera_exits, camera_in_store) in (camera_counts or {}).items():
+                pieces = self.count_deltas.advance((branch_id, str(camera_id)), camera_entries, camera_exits, now)
+                rollup.extend(rollup_samples(branch_id, str(camera_id), pieces, camera_in_store))
+            
+            record = {
+                'branch_id': branch_id,
+                'timestamp': timestamp,
+                'entries': entries,
+                'exits': exits,
+                'total_in_store': total_in_store,
+                'date': now.strftime("%Y-%m-%d"),
+                'time': now.strftime("%H:%M"),
+                'rollup': rollup
+            }
+            return self.count_queue.put(record)
+    
+    def reset_count_deltas(self, branch_id=None):
+        """แจ้งว่าตัวนับสะสมของสาขาถูกรีเซ็ตเป็น 0 เพื่อให้ตารางสรุปนับจำนวนที่เพิ่มขึ้นถัดไปจาก 0"""
+        with self._record_lock:
+            self.count_deltas.reset(branch_id or self.branch_id)
+    
+    def flush(self, timeout=None):
+        """รอจนข้อมูลที่อยู่ในคิวเขียนถูกบันทึกลงฐานข้อมูลหมด"""
+        return self.count_queue.flush(timeout)
+    
+    def _write_count_records(self, records):
+        """เขียนข้อมูลจำนวนลูกค้าหลายรายการในหนึ่ง transaction (เรียกจากเธรดเขียนของคิว)"""
+        # รวมการอัพเดต daily_stats ของแต่ละสาขาและวัน: ยอดรวมใช้ค่าล่าสุด ส่วน peak ใช้ค่าสูงสุด
+        daily = {}
+        for record in records:
+            key = (record['branch_id'], record['date'])
+            summary = daily.get(key)
+            if summary is None:
+                daily[key] = summary = {'peak_count': record['total_in_store'], 'peak_time': record['time']}
+            elif record['total_in_store'] > summary['peak_count']:
+                summary['peak_count'] = record['total_in_store']
+                summary['peak_time'] = record['time']
+            summary['entries'] = record['entries']
+            summary['exits'] = record['exits']
+        
+        with self.db.write() as conn:
             cursor = conn.cursor()
             
             # บันทึกข้อมูลลงตาราง customer_counts
-            cursor.execute(
+            cursor.executemany(
                 "INSERT INTO customer_counts (branch_id, timestamp, entries, exits, total_in_store, synced) VALUES (?, ?, ?, ?, ?, ?)",
-                (branch_id, timestamp, entries, exits, total_in_store, 0)
+                [(r['branch_id'], r['timestamp'], r['entries'], r['exits'], r['total_in_store'], 0) for r in records]
             )
             
-            # อัพเดตหรือเพิ่มข้อมูลลงตาราง daily_stats
-            today = datetime.datetime.now().strftime("%Y-%m-%d")
-            
-            # ตรวจสอบว่ามีข้อมูลของวันนี้หรือไม่
-            cursor.execute("SELECT id, total_entries, total_exits, peak_count FROM daily_stats WHERE branch_id = ? AND date = ?", (branch_id, today))
-            daily_record = cursor.fetchone()
-            
-            if daily_record:
-                # อัพเดตข้อมูลที่มีอยู่
-                record_id, total_entries, total_exits, peak_count = daily_record
-                
-                # อัพเดตยอดรวม
-                cursor.execute(
-                    "UPDATE daily_stats SET total_entries = ?, total_exits = ?, synced = ? WHERE id = ?",
-                    (entries, exits, 0, record_id)
-                )
-                
-                # อัพเดตช่วงเวลาที่มีลูกค้ามากที่สุด ถ้าจำนวนปัจจุบันมากกว่า
-                if total_in_store > peak_count:
-                    peak_time = datetime.datetime.now().strftime("%H:%M")
-                    cursor.execute(
-                        "UPDATE daily_stats SET peak_time = ?, peak_count = ? WHERE id = ?",
-                        (peak_time, total_in_store, record_id)
-                    )
-            else:
-                # เพิ่มข้อมูลใหม่
-                peak_time = datetime.datetime.now().strftime("%H:%M")
-                cursor.execute(
-                    "INSERT INTO daily_stats (branch_id, date, total_entries, total_exits, peak_time, peak_count, synced) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (branch_id, today, entries, exits, peak_time, total_in_store, 0)
-                )
-            
-            conn.commit()
-            conn.close()
-            
-            # ตรวจสอบและสำรองฐานข้อมูลถ้าถึงเวลา
-            self._check_backup()
-            
-            return True
+            # อัพเดตหรือเพิ่มข้อมูลลงตาราง daily_stats ในคำสั่งเดียว (ยอดรวมใช้ค่าล่าสุด peak ใช้ค่าสูงสุด)
+            # ค่าทางขวาของ SET อ้างถึงแถวเดิมทั้งหมด peak_time จึงเปรียบเทียบกับ peak_count ก่อนอัพเดต
+            cursor.executemany(
+                """
+                INSERT INTO daily_stats (branch_id, date, total_entries, total_exits, peak_time, peak_count, synced)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+                ON CONFLICT (branch_id, date) DO UPDATE SET
+                    total_entries = excluded.total_entries,
+                    total_exits = excluded.total_exits,
+                    peak_time = CASE WHEN daily_stats.peak_count IS NULL OR excluded.peak_count > daily_stats.peak_count
+                                     THEN excluded.peak_time ELSE daily_stats.peak_time END,
+                    peak_count = MAX(COALESCE(daily_stats.peak_count, excluded.peak_count), excluded.peak_count),
+                    synced = 0
+                """,
+                [(branch_id, date, summary['entries'], summary['exits'], summary['peak_time'], summary['peak_count'])
+                 for (branch_id, date), summary in daily.items()]
+            )
             
-        except Exception as e:
-            self.logger.error(f"เกิดข้อผิดพลาดในการบันทึกข้อมูลจำนวนลูกค้า: {str(e)}")
-            # แคชข้อมูลเพื่อใช้ในกรณีที่ฐานข้อมูลมีปัญหา
-            self._cache_customer_data(timestamp, entries, exits, total_in_store, branch_id)
-            return False
+            # เพิ่มจำนวนที่เพิ่มขึ้นเข้าตารางสรุปตามช่วงเวลา ใน transaction เดียวกัน
+            write_rollups(cursor, [sample for r in records for sample in r.get('rollup') or []])
+        
+        # ล้างผลสถิติในแคชที่ครอบคลุมวันที่ถูกเขียน (ช่วงที่จบก่อนหน้านั้นยังใช้ได้)
+        first_date = min(min([r['date']] + [sample[2][:10] for sample in r.get('rollup') or []]) for r in records)
+        self.stats_cache.invalidate(lambda key: key[2] >= first_date)
+        
+        # ตรวจสอบและสำรองฐานข้อมูลถ้าถึงเวลา
+        self._check_backup()
     
-    def _cache_customer_data(self, timestamp, entries, exits, total_in_store, branch_id):
-        """แคชข้อมูลลูกค้าในกรณีที่ฐานข้อมูลมีปัญหา"""
+    def _cache_count_records(self, records):
+        """เก็บข้อมูลที่เขียนลงฐานข้อมูลไม่ได้ หรือล้นคิว ลงไฟล์บันทึกสำรอง (นำกลับมาเขียนตอนเริ่มโปรแกรมครั้งถัดไป)"""
         try:
-            # สร้างโฟลเดอร์แคช
-            cache_dir = 'cache'
-            os.makedirs(cache_dir, exist_ok=True)
-            
-            # สร้างชื่อไฟล์
-            filename = f"{cache_dir}/customer_data_{int(time.time())}.json"
-            
-            # เตรียมข้อมูล
-            data = {
-                'branch_id': branch_id or self.branch_id,
-                'timestamp': timestamp,
-                'entries': entries,
-                'exits': exits,
-                'total_in_store': total_in_store
-            }
-            
-            # บันทึกข้อมูล
-            with open(filename, 'w') as f:
-                json.dump(data, f)
-            
-            self.logger.info(f"แคชข้อมูลลูกค้าไปยัง: {filename}")
-            return True
-            
+            self.journal.append(records)
+            self.logger.info(f"เก็บข้อมูลลูกค้า {len(records)} รายการลงไฟล์บันทึกสำรอง: {self.journal.path}")
         except Exception as e:
-            self.logger.error(f"เกิดข้อผิดพลาดในการแคชข้อมูลลูกค้า: {str(e)}")
-            return False
+            self.logger.error(f"เกิดข้อผิดพลาดในการเก็บข้อมูลลูกค้าลงไฟล์บันทึกสำรอง: {str(e)}")
     
     def _check_cached_data(self):
-        """ตรวจสอบและนำข้อมูลจากแคชมาใช้ถ้ามี"""
+        """นำข้อมูลจากไฟล์บันทึกสำรอง (และไฟล์แคชรุ่นเก่า) กลับมาเขียนลงฐานข้อมูลใน transaction เดียว"""
         try:
-            cache_dir = 'cache'
-            if not os.path.exists(cache_dir):
-                return
-            
-            # ตรวจสอบไฟล์ในโฟลเดอร์แคช
-            cached_files = [f for f in os.listdir(cache_dir) if f.startswith('customer_data_') and f.endswith('.json')]
-            
-            if not cached_files:
-                return
+            records = self.journal.begin_replay()
             
-            self.logger.info(f"พบข้อมูลแคช {len(cached_files)} รายการ กำลังนำมาใช้...")
-            
-            # นำข้อมูลจากแคชมาใช้
-            for filename in cached_files:
+            # ไฟล์แคชรุ่นเก่า (หนึ่งไฟล์ JSON ต่อหนึ่งรายการ)
+            cache_dir = os.path.dirname(self.journal.path)
+            legacy_files = sorted(
+                os.path.join(cache_dir, f) for f in os.listdir(cache_dir)
+                if f.startswith('customer_data_') and f.endswith('.json')
+            )
+            replayed_files = []
+            for filename in legacy_files:
                 try:
-                    # อ่านข้อมูล
-                    with open(os.path.join(cache_dir, filename), 'r') as f:
+                    with open(filename, 'r') as f:
                         data = json.load(f)
                     
-                    # บันทึกลงฐานข้อมูล
-                    self.record_customer_count(
-                        data['timestamp'],
-                        data['entries'],
-                        data['exits'],
-                        data['total_in_store'],
-                        data['branch_id']
-                    )
-                    
-                    # ลบไฟล์แคช
-                    os.remove(os.path.join(cache_dir, filename))
+                    # ใช้วันเวลาของรายการเอง (ไม่ใช่เวลาที่กู้คืน) ถ้าอ่านไม่ได้ใช้เวลาที่เขียนไฟล์แคช
+                    try:
+                        recorded_at = datetime.datetime.fromisoformat(str(data['timestamp']))
+                    except ValueError:
+                        recorded_at = datetime.datetime.fromtimestamp(os.path.getmtime(filename))
                     
+                    records.append({
+                        'branch_id': data['branch_id'],
+                        'timestamp': data['timestamp'],
+                        'entries': data['entries'],
+                        'exits': data['exits'],
+                        'total_in_store': data['total_in_store'],
+                        'date': recorded_at.strftime("%Y-%m-%d"),
+                        'time': recorded_at.strftime("%H:%M"),
+                        'rollup': data.get('rollup')
+                    })
+                    replayed_files.append(filename)
                 except Exception as e:
-                    self.logger.error(f"เกิดข้อผิดพลาดในการนำข้อมูลแคชมาใช้ ({filename}): {str(e)}")
+                    self.logger.error(f"เกิดข้อผิดพลาดในการอ่านข้อมูลแคช ({filename}): {str(e)}")
+            
+            if not records:
+                self.journal.finish_replay()
+                return
+            
+            self.logger.info(f"พบข้อมูลสำรอง {len(records)} รายการ กำลังนำมาใช้...")
+            
+            # เขียนทั้งหมดในหนึ่ง transaction ถ้าไม่สำเร็จไฟล์กู้คืนจะยังอยู่ และถูกนำมาใช้ในครั้งถัดไป
+            self._write_count_records(records)
+            
+            self.journal.finish_replay()
+            for filename in replayed_files:
+                os.remove(filename)
+            
+            self.logger.info(f"นำข้อมูลสำรองกลับมาบันทึกแล้ว {len(records)} รายการ")
             
         except Exception as e:
-            self.logger.error(f"เกิดข้อผิดพลาดในการตรวจสอบข้อมูลแคช: {str(e)}")
+            self.logger.error(f"เกิดข้อผิดพลาดในการนำข้อมูลสำรองกลับมาใช้: {str(e)}")
+    
+    def close(self):
+        """เขียนข้อมูลที่ค้างในคิว แล้วปิดการเชื่อมต่อฐานข้อมูลทั้งหมด (เรียกเมื่อปิดโปรแกรม)"""
+        self.count_queue.close()
+        self.journal.close()
+        self.db.close()
+        self.logger.info("ปิดการเชื่อมต่อฐานข้อมูลแล้ว")
     
     def _check_backup(self):
         """ตรวจสอบและสำรองฐานข้อมูลถ้าถึงเวลา"""
@@ -263,8 +372,8 @@ class DataManager:
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_file = f"{backup_dir}/{self.branch_id}_{timestamp}.db"
             
-            # สำรองฐานข้อมูล
-            shutil.copy2(self.db_name, backup_file)
+            # สำรองฐานข้อมูลด้วย backup API (การคัดลอกไฟล์ตรง ๆ จะไม่รวมข้อมูลที่ยังอยู่ในไฟล์ WAL)
+            self.db.backup(backup_file)
             
             self.logger.info(f"สำรองฐานข้อมูลไปยัง: {backup_file}")
             
@@ -295,40 +404,37 @@ class DataManager:
     def get_unsync_data(self, limit=100):
         """ดึงข้อมูลที่ยังไม่ได้ซิงค์กับเซิร์ฟเวอร์"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            conn.row_factory = sqlite3.Row  # เพื่อให้ผลลัพธ์เป็น dict
-            cursor = conn.cursor()
-            
-            # ดึงข้อมูลลูกค้าที่ยังไม่ได้ซิงค์
-            cursor.execute(
-                "SELECT id, branch_id, timestamp, entries, exits, total_in_store FROM customer_counts WHERE synced = 0 ORDER BY timestamp LIMIT ?",
-                (limit,)
-            )
-            customer_counts = [dict(row) for row in cursor.fetchall()]
-            
-            # ดึงข้อมูลสถิติประจำวันที่ยังไม่ได้ซิงค์
-            cursor.execute(
-                "SELECT id, branch_id, date, total_entries, total_exits, peak_time, peak_count, notes FROM daily_stats WHERE synced = 0 ORDER BY date LIMIT ?",
-                (limit,)
-            )
-            daily_stats = [dict(row) for row in cursor.fetchall()]
-            
-            # ดึงข้อมูลการนัดหมายที่ยังไม่ได้ซิงค์
-            cursor.execute(
-                """
-                SELECT a.id, a.customer_name, a.phone, a.date, a.time, a.service, a.employee_id, a.status, a.notes, 
-                       e.name as employee_name
-                FROM appointments a
-                LEFT JOIN employees e ON a.employee_id = e.id
-                WHERE a.synced = 0
-                ORDER BY a.date, a.time
-                LIMIT ?
-                """,
-                (limit,)
-            )
-            appointments = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
+            with self.db.read() as conn:
+                cursor = conn.cursor()
+                
+                # ดึงข้อมูลลูกค้าที่ยังไม่ได้ซิงค์
+                cursor.execute(
+                    "SELECT id, branch_id, timestamp, entries, exits, total_in_store FROM customer_counts WHERE synced = 0 ORDER BY timestamp LIMIT ?",
+                    (limit,)
+                )
+                customer_counts = [dict(row) for row in cursor.fetchall()]
+                
+                # ดึงข้อมูลสถิติประจำวันที่ยังไม่ได้ซิงค์
+                cursor.execute(
+                    "SELECT id, branch_id, date, total_entries, total_exits, peak_time, peak_count, notes FROM daily_stats WHERE synced = 0 ORDER BY date LIMIT ?",
+                    (limit,)
+                )
+                daily_stats = [dict(row) for row in cursor.fetchall()]
+                
+                # ดึงข้อมูลการนัดหมายที่ยังไม่ได้ซิงค์
+                cursor.execute(
+                    """
+                    SELECT a.id, a.customer_name, a.phone, a.date, a.time, a.service, a.employee_id, a.status, a.notes, 
+                           e.name as employee_name
+                    FROM appointments a
+                    LEFT JOIN employees e ON a.employee_id = e.id
+                    WHERE a.synced = 0
+                    ORDER BY a.date, a.time
+                    LIMIT ?
+                    """,
+                    (limit,)
+                )
+                appointments = [dict(row) for row in cursor.fetchall()]
             
             return {
                 'customer_counts': customer_counts,
@@ -350,17 +456,14 @@ class DataManager:
             return True
         
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # สร้างพารามิเตอร์สำหรับ IN clause
-            placeholders = ','.join(['?'] * len(ids))
-            
-            # อัพเดตสถานะซิงค์
-            cursor.execute(f"UPDATE {table} SET synced = 1 WHERE id IN ({placeholders})", ids)
-            
-            conn.commit()
-            conn.close()
+            with self.db.write() as conn:
+                cursor = conn.cursor()
+                
+                # สร้างพารามิเตอร์สำหรับ IN clause
+                placeholders = ','.join(['?'] * len(ids))
+                
+                # อัพเดตสถานะซิงค์
+                cursor.execute(f"UPDATE {table} SET synced = 1 WHERE id IN ({placeholders})", ids)
             
             self.logger.info(f"ทำเครื่องหมายข้อมูลในตาราง {table} จำนวน {len(ids)} รายการว่าซิงค์แล้ว")
             return True
@@ -372,14 +475,12 @@ class DataManager:
     def add_employee(self, name, position):
         """เพิ่มพนักงานใหม่"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            cursor.execute("INSERT INTO employees (name, position) VALUES (?, ?)", (name, position))
-            
-            employee_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self.db.write() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("INSERT INTO employees (name, position) VALUES (?, ?)", (name, position))
+                
+                employee_id = cursor.lastrowid
             
             self.logger.info(f"เพิ่มพนักงาน {name} (ID: {employee_id}) สำเร็จ")
             return employee_id
@@ -391,41 +492,37 @@ class DataManager:
     def update_employee(self, employee_id, name=None, position=None, status=None):
         """อัพเดตข้อมูลพนักงาน"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # สร้างชุดคำสั่ง SQL สำหรับอัพเดต
-            updates = []
-            params = []
-            
-            if name is not None:
-                updates.append("name = ?")
-                params.append(name)
+            with self.db.write() as conn:
+                cursor = conn.cursor()
                 
-            if position is not None:
-                updates.append("position = ?")
-                params.append(position)
+                # สร้างชุดคำสั่ง SQL สำหรับอัพเดต
+                updates = []
+                params = []
                 
-            if status is not None:
-                updates.append("status = ?")
-                params.append(status)
-            
-            # ถ้าไม่มีข้อมูลที่จะอัพเดต
-            if not updates:
-                conn.close()
-                return False
-            
-            # เพิ่ม ID เข้าไปใน params
-            params.append(employee_id)
-            
-           # สร้างคำสั่ง SQL
-            sql = f"UPDATE employees SET {', '.join(updates)} WHERE id = ?"
-            
-            # ทำการอัพเดต
-            cursor.execute(sql, params)
-            
-            conn.commit()
-            conn.close()
+                if name is not None:
+                    updates.append("name = ?")
+                    params.append(name)
+                    
+                if position is not None:
+                    updates.append("position = ?")
+                    params.append(position)
+                    
+                if status is not None:
+                    updates.append("status = ?")
+                    params.append(status)
+                
+                # ถ้าไม่มีข้อมูลที่จะอัพเดต
+                if not updates:
+                    return False
+                
+                # เพิ่ม ID เข้าไปใน params
+                params.append(employee_id)
+                
+               # สร้างคำสั่ง SQL
+                sql = f"UPDATE employees SET {', '.join(updates)} WHERE id = ?"
+                
+                # ทำการอัพเดต
+                cursor.execute(sql, params)
             
             self.logger.info(f"อัพเดตพนักงาน ID: {employee_id} สำเร็จ")
             return True
@@ -437,14 +534,12 @@ class DataManager:
     def get_employees(self):
         """ดึงรายชื่อพนักงานทั้งหมด"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT id, name, position, status FROM employees ORDER BY name")
-            employees = [dict(row) for row in cursor.fetchall()]
+            with self.db.read() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("SELECT id, name, position, status FROM employees ORDER BY name")
+                employees = [dict(row) for row in cursor.fetchall()]
             
-            conn.close()
             return employees
             
         except Exception as e:
@@ -462,26 +557,23 @@ class DataManager:
                 self.logger.error("รูปแบบวันที่หรือเวลาไม่ถูกต้อง")
                 return None
             
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # ตรวจสอบว่าพนักงานมีอยู่หรือไม่
-            if employee_id:
-                cursor.execute("SELECT id FROM employees WHERE id = ?", (employee_id,))
-                if not cursor.fetchone():
-                    conn.close()
-                    self.logger.error(f"ไม่พบพนักงาน ID: {employee_id}")
-                    return None
-            
-            # เพิ่มการนัดหมายใหม่
-            cursor.execute("""
-                INSERT INTO appointments (customer_name, phone, date, time, service, employee_id, notes, synced) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (customer_name, phone, date, time, service, employee_id, notes, 0))
-            
-            appointment_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self.db.write() as conn:
+                cursor = conn.cursor()
+                
+                # ตรวจสอบว่าพนักงานมีอยู่หรือไม่
+                if employee_id:
+                    cursor.execute("SELECT id FROM employees WHERE id = ?", (employee_id,))
+                    if not cursor.fetchone():
+                        self.logger.error(f"ไม่พบพนักงาน ID: {employee_id}")
+                        return None
+                
+                # เพิ่มการนัดหมายใหม่
+                cursor.execute("""
+                    INSERT INTO appointments (customer_name, phone, date, time, service, employee_id, notes, synced) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (customer_name, phone, date, time, service, employee_id, notes, 0))
+                
+                appointment_id = cursor.lastrowid
             
             self.logger.info(f"เพิ่มการนัดหมาย ID: {appointment_id} สำหรับลูกค้า: {customer_name} สำเร็จ")
             return appointment_id
@@ -499,21 +591,17 @@ class DataManager:
                 self.logger.error(f"สถานะไม่ถูกต้อง: {status} กรุณาเลือกจาก {', '.join(valid_statuses)}")
                 return False
             
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # ตรวจสอบว่ามีการนัดหมายนี้หรือไม่
-            cursor.execute("SELECT id FROM appointments WHERE id = ?", (appointment_id,))
-            if not cursor.fetchone():
-                conn.close()
-                self.logger.error(f"ไม่พบการนัดหมาย ID: {appointment_id}")
-                return False
-            
-            # อัพเดตสถานะและตั้งค่า synced = 0 เพื่อให้ซิงค์ข้อมูลใหม่
-            cursor.execute("UPDATE appointments SET status = ?, synced = 0 WHERE id = ?", (status, appointment_id))
-            
-            conn.commit()
-            conn.close()
+            with self.db.write() as conn:
+                cursor = conn.cursor()
+                
+                # ตรวจสอบว่ามีการนัดหมายนี้หรือไม่
+                cursor.execute("SELECT id FROM appointments WHERE id = ?", (appointment_id,))
+                if not cursor.fetchone():
+                    self.logger.error(f"ไม่พบการนัดหมาย ID: {appointment_id}")
+                    return False
+                
+                # อัพเดตสถานะและตั้งค่า synced = 0 เพื่อให้ซิงค์ข้อมูลใหม่
+                cursor.execute("UPDATE appointments SET status = ?, synced = 0 WHERE id = ?", (status, appointment_id))
             
             self.logger.info(f"อัพเดตสถานะการนัดหมาย ID: {appointment_id} เป็น '{status}' สำเร็จ")
             return True
@@ -525,33 +613,31 @@ class DataManager:
     def get_appointments(self, date=None, employee_id=None):
         """ดึงรายการนัดหมาย"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            query = """
-                SELECT a.id, a.customer_name, a.phone, a.date, a.time, a.service, 
-                       a.employee_id, e.name as employee_name, a.status, a.notes
-                FROM appointments a
-                LEFT JOIN employees e ON a.employee_id = e.id
-                WHERE 1=1
-            """
-            params = []
-            
-            if date:
-                query += " AND a.date = ?"
-                params.append(date)
-            
-            if employee_id:
-                query += " AND a.employee_id = ?"
-                params.append(employee_id)
-            
-            query += " ORDER BY a.date, a.time"
-            
-            cursor.execute(query, params)
-            appointments = [dict(row) for row in cursor.fetchall()]
+            with self.db.read() as conn:
+                cursor = conn.cursor()
+                
+                query = """
+                    SELECT a.id, a.customer_name, a.phone, a.date, a.time, a.service, 
+                           a.employee_id, e.name as employee_name, a.status, a.notes
+                    FROM appointments a
+                    LEFT JOIN employees e ON a.employee_id = e.id
+                    WHERE 1=1
+                """
+                params = []
+                
+                if date:
+                    query += " AND a.date = ?"
+                    params.append(date)
+                
+                if employee_id:
+                    query += " AND a.employee_id = ?"
+                    params.append(employee_id)
+                
+                query += " ORDER BY a.date, a.time"
+                
+                cursor.execute(query, params)
+                appointments = [dict(row) for row in cursor.fetchall()]
             
-            conn.close()
             return appointments
             
         except Exception as e:
@@ -561,66 +647,166 @@ class DataManager:
     def get_daily_stats(self, date=None, days=7):
         """ดึงสถิติประจำวัน"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            if date:
-                # ดึงข้อมูลของวันที่ระบุ
-                cursor.execute(
-                    "SELECT * FROM daily_stats WHERE branch_id = ? AND date = ?",
-                    (self.branch_id, date)
-                )
-                stats = [dict(row) for row in cursor.fetchall()]
-            else:
-                # ดึงข้อมูลของ x วันล่าสุด
-                cursor.execute(
-                    """
-                    SELECT * FROM daily_stats 
-                    WHERE branch_id = ? 
-                    ORDER BY date DESC LIMIT ?
-                    """,
-                    (self.branch_id, days)
-                )
-                stats = [dict(row) for row in cursor.fetchall()]
+            with self.db.read() as conn:
+                cursor = conn.cursor()
+                
+                if date:
+                    # ดึงข้อมูลของวันที่ระบุ
+                    cursor.execute(
+                        "SELECT * FROM daily_stats WHERE branch_id = ? AND date = ?",
+                        (self.branch_id, date)
+                    )
+                    stats = [dict(row) for row in cursor.fetchall()]
+                else:
+                    # ดึงข้อมูลของ x วันล่าสุด
+                    cursor.execute(
+                        """
+                        SELECT * FROM daily_stats 
+                        WHERE branch_id = ? 
+                        ORDER BY date DESC LIMIT ?
+                        """,
+                        (self.branch_id, days)
+                    )
+                    stats = [dict(row) for row in cursor.fetchall()]
             
-            conn.close()
             return stats
             
         except Exception as e:
             self.logger.error(f"เกิดข้อผิดพลาดในการดึงสถิติประจำวัน: {str(e)}")
             return []
     
-    def export_daily_stats(self, start_date=None, end_date=None):
-        """ส่งออกสถิติประจำวันเป็นไฟล์ CSV"""
+    def get_traffic_buckets(self, start_date, end_date, bucket_minutes=60, camera_id=None):
+        """ดึงจำนวนคนเข้า/ออกตามช่วงเวลา (60 หรือ 15 นาที) ระหว่างวันที่ที่ระบุ จากตารางสรุป"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            conn.row_factory = sqlite3.Row
+            return self._query_traffic_buckets(start_date, end_date, bucket_minutes, camera_id)
+        
+        except Exception as e:
+            self.logger.error(f"เกิดข้อผิดพลาดในการดึงข้อมูลตามช่วงเวลา: {str(e)}")
+            return []
+    
+    def _query_traffic_buckets(self, start_date, end_date, bucket_minutes, camera_id):
+        """อ่านข้อมูลตามช่วงเวลาจากตารางสรุป (ส่งต่อข้อผิดพลาดให้ผู้เรียก)"""
+        table = 'traffic_15min' if bucket_minutes == 15 else 'traffic_hourly'
+        with self.db.read() as conn:
             cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT bucket_start, entries, exits, max_occupancy FROM {table}
+                WHERE branch_id = ? AND camera_id = ? AND bucket_start BETWEEN ? AND ?
+                ORDER BY bucket_start
+                """,
+                (self.branch_id, self._rollup_camera_id(camera_id), f"{start_date} 00:00", f"{end_date} 23:59")
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_traffic_profile(self, start_date, end_date, group_by='hour', camera_id=None):
+        """ดึงค่าเฉลี่ยจำนวนคนเข้า/ออกตามชั่วโมงของวัน (group_by='hour') หรือวันในสัปดาห์ (group_by='weekday', 0 = อาทิตย์)"""
+        slot_format = '%w' if group_by == 'weekday' else '%H'
+        try:
+            with self.db.read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"""
+                    SELECT CAST(strftime('{slot_format}', bucket_start) AS INTEGER) AS slot,
+                           COUNT(DISTINCT substr(bucket_start, 1, 10)) AS days,
+                           SUM(entries) AS total_entries,
+                           SUM(exits) AS total_exits,
+                           MAX(max_occupancy) AS max_occupancy
+                    FROM traffic_hourly
+                    WHERE branch_id = ? AND camera_id = ? AND bucket_start BETWEEN ? AND ?
+                    GROUP BY slot
+                    ORDER BY slot
+                    """,
+                    (self.branch_id, self._rollup_camera_id(camera_id), f"{start_date} 00:00", f"{end_date} 23:59")
+                )
+                
+                profile = []
+                for row in cursor.fetchall():
+                    item = dict(row)
+                    item['avg_entries'] = round(item['total_entries'] / item['days'], 1)
+                    item['avg_exits'] = round(item['total_exits'] / item['days'], 1)
+                    profile.append(item)
+                return profile
+        
+        except Exception as e:
+            self.logger.error(f"เกิดข้อผิดพลาดในการดึงข้อมูลตามช่วงเวลา: {str(e)}")
+            return []
+    
+    def get_stats_series(self, start_date, end_date, granularity='day', camera_id=None):
+        """ดึงสถิติระหว่างวันที่ที่ระบุ แบ่งตาม granularity (hour, day, week, month) ผ่านแคช
+        
+        แต่ละรายการมี date (จุดเริ่มต้นของช่วง), total_entries, total_exits, peak_time และ peak_count
+        ทุก granularity รวมจากตารางสรุปรายชั่วโมง (จำนวนที่เพิ่มขึ้นในแต่ละชั่วโมง) ทั้งของสาขาและรายกล้อง
+        ยอดรายวันจึงตรงกับผลรวมของรายชั่วโมงเสมอ
+        """
+        key = (self.branch_id, start_date, end_date, granularity, self._rollup_camera_id(camera_id))
+        try:
+            return self.stats_cache.get_or_compute(
+                key, lambda: self._query_stats_series(start_date, end_date, granularity, camera_id)
+            )
+        
+        except Exception as e:
+            # ผลลัพธ์ว่างจากข้อผิดพลาดไม่ถูกเก็บในแคช การเรียกครั้งถัดไปจะอ่านจากฐานข้อมูลใหม่
+            self.logger.error(f"เกิดข้อผิดพลาดในการดึงสถิติ: {str(e)}")
+            return []
+    
+    def _query_stats_series(self, start_date, end_date, granularity, camera_id):
+        """อ่านสถิติจากฐานข้อมูลสำหรับ get_stats_series (ส่งต่อข้อผิดพลาด เพื่อไม่ให้ผลลัพธ์ว่างถูกแคช)"""
+        hourly = [{
+            'date': row['bucket_start'],
+            'total_entries': row['entries'],
+            'total_exits': row['exits'],
+            'peak_time': row['bucket_start'][11:],
+            'peak_count': row['max_occupancy']
+        } for row in self._query_traffic_buckets(start_date, end_date, 60, camera_id)]
+        
+        if granularity == 'hour':
+            return hourly
+        daily = self._group_stats(hourly, lambda day: day[:10])
+        
+        if granularity == 'week':
+            # สัปดาห์เริ่มวันจันทร์
+            return self._group_stats(daily, self._week_start, dated_peak=True)
+        if granularity == 'month':
+            return self._group_stats(daily, lambda day: day[:7], dated_peak=True)
+        return daily
+    
+    def _week_start(self, day):
+        """วันจันทร์ของสัปดาห์ที่ day ('YYYY-MM-DD') อยู่"""
+        date = datetime.date.fromisoformat(day[:10])
+        return (date - datetime.timedelta(days=date.weekday())).isoformat()
+    
+    def _group_stats(self, rows, group_key, dated_peak=False):
+        """รวมรายการสถิติที่เรียงตามเวลาแล้วเป็นช่วงที่ยาวขึ้น (ยอดรวมบวกกัน peak ใช้ค่าสูงสุด)
+        
+        ถ้า dated_peak เป็นจริง peak_time จะระบุวันที่ด้วย (สำหรับช่วงที่ยาวกว่าหนึ่งวัน)
+        """
+        groups = {}
+        for row in rows:
+            label = group_key(row['date'])
+            group = groups.get(label)
+            if group is None:
+                groups[label] = group = {'date': label, 'total_entries': 0, 'total_exits': 0, 'peak_time': None, 'peak_count': 0}
+            group['total_entries'] += row['total_entries'] or 0
+            group['total_exits'] += row['total_exits'] or 0
+            if group['peak_time'] is None or (row['peak_count'] or 0) > group['peak_count']:
+                group['peak_count'] = row['peak_count'] or 0
+                group['peak_time'] = f"{row['date'][:10]} {row['peak_time'] or ''}".strip() if dated_peak else row['peak_time']
+        return list(groups.values())
+    
+    def _rollup_camera_id(self, camera_id):
+        """camera_id ในตารางสรุป (None = ยอดรวมทั้งสาขา)"""
+        return BRANCH_TOTAL if camera_id is None else str(camera_id)
+    
+    def export_daily_stats(self, start_date=None, end_date=None):
+        """ส่งออกสถิติประจำวันเป็นไฟล์ CSV (เขียนทีละชุดจาก cursor)"""
+        try:
+            columns = EXPORT_DATASETS['daily'].columns
+            row_chunks = self.iter_export('daily', start_date, end_date)
             
-            query = """
-                SELECT branch_id, date, total_entries, total_exits, peak_time, peak_count, notes
-                FROM daily_stats
-                WHERE branch_id = ?
-            """
-            params = [self.branch_id]
-            
-            if start_date:
-                query += " AND date >= ?"
-                params.append(start_date)
-            
-            if end_date:
-                query += " AND date <= ?"
-                params.append(end_date)
-            
-            query += " ORDER BY date"
-            
-            cursor.execute(query, params)
-            stats = [dict(row) for row in cursor.fetchall()]
-            
-            conn.close()
-            
-            if not stats:
+            # อ่านชุดแรกก่อน เพื่อไม่สร้างไฟล์เปล่าเมื่อไม่มีข้อมูล
+            first_chunk = next(row_chunks, None)
+            if first_chunk is None:
                 self.logger.warning("ไม่พบข้อมูลสถิติสำหรับส่งออก")
                 return None
             
@@ -630,13 +816,9 @@ class DataManager:
             filename = f"{export_path}/daily_stats_{self.branch_id}_{timestamp}.csv"
             
             # เขียนไฟล์ CSV
-            with open(filename, 'w', newline='') as csvfile:
-                fieldnames = ['branch_id', 'date', 'total_entries', 'total_exits', 'peak_time', 'peak_count', 'notes']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for stat in stats:
-                    writer.writerow(stat)
+            with open(filename, 'wb') as csvfile:
+                for data in encode_export(columns, itertools.chain([first_chunk], row_chunks), 'csv'):
+                    csvfile.write(data)
             
             self.logger.info(f"ส่งออกสถิติประจำวันไปยัง: {filename}")
             return filename
@@ -645,71 +827,106 @@ class DataManager:
             self.logger.error(f"เกิดข้อผิดพลาดในการส่งออกสถิติประจำวัน: {str(e)}")
             return None
     
+    def iter_export(self, dataset, start_date=None, end_date=None, camera_id=None, chunk_size=1000):
+        """อ่านข้อมูลชุด dataset ('raw', 'hourly', 'daily') ของสาขานี้ทีละ chunk_size แถว (generator ของรายการ tuple)
+        
+        ชุดข้อมูลที่แยกตามกล้องจะส่งออกเฉพาะ camera_id ที่ระบุ หรือยอดรวมทั้งสาขาเมื่อ camera_id เป็น None
+        
+        ใช้การเชื่อมต่ออ่านของตัวเองนอก pool ตลอดการส่งออก (การดาวน์โหลดที่ช้าจึงไม่ยึดตัวอ่านของคำค้นอื่น)
+        และปิดเมื่ออ่านครบหรือผู้รับหยุดกลางทาง
+        """
+        definition = EXPORT_DATASETS[dataset]
+        
+        query = f"SELECT {', '.join(name for name, _ in definition.columns)} FROM {definition.table} WHERE branch_id = ?"
+        params = [self.branch_id]
+        
+        if start_date:
+            query += f" AND {definition.time_column} >= ?"
+            params.append(start_date)
+        
+        if end_date:
+            # ครอบคลุมทั้งวันสุดท้าย สำหรับคอลัมน์ที่มีเวลาต่อท้ายวันที่
+            query += f" AND {definition.time_column} < ?"
+            params.append((datetime.date.fromisoformat(end_date) + datetime.timedelta(days=1)).isoformat())
+        
+        if definition.has_camera:
+            # ไม่ระบุกล้อง = ยอดรวมทั้งสาขาเท่านั้น ไม่ปนกับแถวรายกล้อง (ผลรวมของไฟล์จึงไม่ถูกนับซ้ำ)
+            query += " AND camera_id = ?"
+            params.append(self._rollup_camera_id(camera_id))
+        
+        query += f" ORDER BY {definition.order_by}"
+        
+        with self.db.read_dedicated() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+    
     def import_data(self, employees=None, appointments=None):
         """นำเข้าข้อมูลพนักงานและการนัดหมายจากเซิร์ฟเวอร์"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # นำเข้าข้อมูลพนักงาน
-            if employees:
-                for employee in employees:
-                    # ตรวจสอบว่ามีพนักงานนี้อยู่แล้วหรือไม่
-                    cursor.execute("SELECT id FROM employees WHERE id = ?", (employee['id'],))
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        # อัพเดตข้อมูลพนักงาน
-                        cursor.execute(
-                            "UPDATE employees SET name = ?, position = ?, status = ? WHERE id = ?",
-                            (employee['name'], employee['position'], employee['status'], employee['id'])
-                        )
-                    else:
-                        # เพิ่มพนักงานใหม่
-                        cursor.execute(
-                            "INSERT INTO employees (id, name, position, status) VALUES (?, ?, ?, ?)",
-                            (employee['id'], employee['name'], employee['position'], employee['status'])
-                        )
-            
-            # นำเข้าข้อมูลการนัดหมาย
-            if appointments:
-                for appointment in appointments:
-                    # ตรวจสอบว่ามีการนัดหมายนี้อยู่แล้วหรือไม่
-                    cursor.execute("SELECT id FROM appointments WHERE id = ?", (appointment['id'],))
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        # อัพเดตข้อมูลการนัดหมาย
-                        cursor.execute(
-                            """
-                            UPDATE appointments 
-                            SET customer_name = ?, phone = ?, date = ?, time = ?, service = ?, 
-                                employee_id = ?, status = ?, notes = ?, synced = 1
-                            WHERE id = ?
-                            """,
-                            (
-                                appointment['customer_name'], appointment['phone'], appointment['date'], 
-                                appointment['time'], appointment['service'], appointment['employee_id'], 
-                                appointment['status'], appointment['notes'], appointment['id']
+            with self.db.write() as conn:
+                cursor = conn.cursor()
+                
+                # นำเข้าข้อมูลพนักงาน
+                if employees:
+                    for employee in employees:
+                        # ตรวจสอบว่ามีพนักงานนี้อยู่แล้วหรือไม่
+                        cursor.execute("SELECT id FROM employees WHERE id = ?", (employee['id'],))
+                        existing = cursor.fetchone()
+                        
+                        if existing:
+                            # อัพเดตข้อมูลพนักงาน
+                            cursor.execute(
+                                "UPDATE employees SET name = ?, position = ?, status = ? WHERE id = ?",
+                                (employee['name'], employee['position'], employee['status'], employee['id'])
                             )
-                        )
-                    else:
-                        # เพิ่มการนัดหมายใหม่
-                        cursor.execute(
-                            """
-                            INSERT INTO appointments 
-                            (id, customer_name, phone, date, time, service, employee_id, status, notes, synced) 
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
-                            """,
-                            (
-                                appointment['id'], appointment['customer_name'], appointment['phone'], 
-                                appointment['date'], appointment['time'], appointment['service'], 
-                                appointment['employee_id'], appointment['status'], appointment['notes']
+                        else:
+                            # เพิ่มพนักงานใหม่
+                            cursor.execute(
+                                "INSERT INTO employees (id, name, position, status) VALUES (?, ?, ?, ?)",
+                                (employee['id'], employee['name'], employee['position'], employee['status'])
+                            )
+                
+                # นำเข้าข้อมูลการนัดหมาย
+                if appointments:
+                    for appointment in appointments:
+                        # ตรวจสอบว่ามีการนัดหมายนี้อยู่แล้วหรือไม่
+                        cursor.execute("SELECT id FROM appointments WHERE id = ?", (appointment['id'],))
+                        existing = cursor.fetchone()
+                        
+                        if existing:
+                            # อัพเดตข้อมูลการนัดหมาย
+                            cursor.execute(
+                                """
+                                UPDATE appointments 
+                                SET customer_name = ?, phone = ?, date = ?, time = ?, service = ?, 
+                                    employee_id = ?, status = ?, notes = ?, synced = 1
+                                WHERE id = ?
+                                """,
+                                (
+                                    appointment['customer_name'], appointment['phone'], appointment['date'], 
+                                    appointment['time'], appointment['service'], appointment['employee_id'], 
+                                    appointment['status'], appointment['notes'], appointment['id']
+                                )
+                            )
+                        else:
+                            # เพิ่มการนัดหมายใหม่
+                            cursor.execute(
+                                """
+                                INSERT INTO appointments 
+                                (id, customer_name, phone, date, time, service, employee_id, status, notes, synced) 
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+                                """,
+                                (
+                                    appointment['id'], appointment['customer_name'], appointment['phone'], 
+                                    appointment['date'], appointment['time'], appointment['service'], 
+                                    appointment['employee_id'], appointment['status'], appointment['notes']
+                                )
                             )
-                        )
-            
-            conn.commit()
-            conn.close()
             
             if employees:
                 self.logger.info(f"นำเข้าข้อมูลพนักงาน {len(employees)} รายการสำเร็จ")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# db_connection.py - จัดการการเชื่อมต่อ SQLite แบบถาวร (ตัวเขียนหนึ่งตัว และ pool ของตัวอ่าน) ในโหมด WAL
+import sqlite3
+import threading
+import queue
+import logging
+from contextlib import contextmanager
+
+class ConnectionManager:
+    """คลาสสำหรับแชร์การเชื่อมต่อฐานข้อมูลระหว่างเธรด
+    
+    การเขียนทั้งหมดผ่านการเชื่อมต่อตัวเขียนตัวเดียวที่ล็อกไว้ (SQLite เขียนได้ทีละหนึ่งอยู่แล้ว)
+    ส่วนการอ่านยืมการเชื่อมต่อจาก pool โหมด WAL ทำให้ตัวอ่านเห็นข้อมูลที่ commit แล้วได้
+    โดยไม่ต้องรอการเขียนของเธรดกล้อง
+    """
+    
+    def __init__(self, db_name, read_connections=4, synchronous='NORMAL', cache_size_kb=8192, busy_timeout_ms=5000):
+        """เปิดการเชื่อมต่อตัวเขียนและตั้งค่า WAL"""
+        self.logger = logging.getLogger("ConnectionManager")
+        self.db_name = db_name
+        self.synchronous = synchronous.upper()
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        
+        self._write_lock = threading.RLock()
+        self._writer = self._connect()
+        self.journal_mode = self._writer.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if self.journal_mode.lower() != 'wal':
+            self.logger.warning(f"ไม่สามารถเปิดโหมด WAL ได้ ใช้โหมด {self.journal_mode} แทน")
+        
+        # ตัวอ่านถูกสร้างเมื่อจำเป็น และคืนกลับเข้า pool หลังใช้งาน
+        self._max_readers = max(1, read_connections)
+        self._readers = queue.Queue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._closed = False
+    
+    def _connect(self):
+        """สร้างการเชื่อมต่อใหม่พร้อม pragma ที่ใช้ร่วมกัน"""
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout_ms / 1000.0, check_same_thread=False)
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={-int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+    
+    @contextmanager
+    def write(self):
+        """ยืมการเชื่อมต่อตัวเขียนหนึ่ง transaction (commit เมื่อสำเร็จ และ rollback เมื่อเกิดข้อผิดพลาด)"""
+        with self._write_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("ฐานข้อมูลถูกปิดแล้ว")
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+    
+    @contextmanager
+    def read(self):
+        """ยืมการเชื่อมต่อสำหรับอ่านจาก pool (ผลลัพธ์เป็น sqlite3.Row)"""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            # จบ transaction การอ่าน เพื่อไม่ให้ snapshot เก่าค้างอยู่และไม่ขวาง checkpoint
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+    
+    @contextmanager
+    def read_dedicated(self):
+        """เปิดการเชื่อมต่อสำหรับอ่านตัวใหม่นอก pool และปิดเมื่อใช้เสร็จ
+        
+        สำหรับการอ่านที่ใช้เวลานาน (เช่น การส่งออกที่ดาวน์โหลดช้า) เพื่อไม่ให้ยึดตัวอ่านใน pool
+        จนคำค้นอื่นต้องรอ
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("ฐานข้อมูลถูกปิดแล้ว")
+        
+        conn = self._open_reader()
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def _acquire_reader(self):
+        """หยิบตัวอ่านที่ว่าง หรือสร้างใหม่ถ้ายังไม่ครบจำนวน"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("ฐานข้อมูลถูกปิดแล้ว")
+        
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._reader_lock:
+            if self._reader_count < self._max_readers:
+                self._reader_count += 1
+                try:
+                    return self._open_reader()
+                except Exception:
+                    self._reader_count -= 1
+                    raise
+        
+        # ตัวอ่านถูกใช้ครบแล้ว รอจนมีตัวที่ว่าง ไม่เกินเวลาเดียวกับ busy_timeout
+        try:
+            return self._readers.get(timeout=self.busy_timeout_ms / 1000.0)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"ไม่มีการเชื่อมต่อสำหรับอ่านที่ว่างภายใน {self.busy_timeout_ms} ms (ใช้งานอยู่ {self._max_readers} ตัว)"
+            )
+    
+    def _open_reader(self):
+        """สร้างการเชื่อมต่อแบบอ่านอย่างเดียว (ผลลัพธ์เป็น sqlite3.Row)"""
+        conn = self._connect()
+        conn.execute("PRAGMA query_only=1")
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def backup(self, filename):
+        """สำรองฐานข้อมูลด้วย backup API ของ SQLite (รวมข้อมูลที่ยังอยู่ในไฟล์ WAL)"""
+        target = sqlite3.connect(filename)
+        try:
+            with self._write_lock:
+                self._writer.backup(target)
+        finally:
+            target.close()
+    
+    def close(self):
+        """checkpoint ไฟล์ WAL และปิดการเชื่อมต่อทั้งหมด"""
+        with self._write_lock:
+            if self._closed:
+                return
+            self._closed = True
+            
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            
+            try:
+                self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                self.logger.warning(f"ไม่สามารถ checkpoint ฐานข้อมูลได้: {str(e)}")
+            self._writer.close()
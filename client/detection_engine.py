@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# detection_engine.py - ตรวจจับคนและการข้ามเส้น (ใช้ได้ทั้งในเธรดและใน process แยก)
+import math
+import logging
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import NamedTuple
+import cv2
+import numpy as np
+
+from centroid_tracker import CentroidTracker
+
+class DetectionProfile(NamedTuple):
+    """พารามิเตอร์การตรวจจับของกล้องหนึ่งตัว (สร้างครั้งเดียวและไม่ถูกแก้ไข จะถูกแทนที่ทั้งก้อนเมื่อมีการเปลี่ยนค่า)"""
+    blur_size: int  # เป็นเลขคี่เสมอ (ที่ความละเอียดของภาพที่ใช้ตรวจจับ)
+    threshold: int
+    min_area: int  # พื้นที่ขั้นต่ำที่ความละเอียดเต็มของสตรีม
+    direction_threshold: int
+    scale: float = 1.0  # สัดส่วนการย่อภาพก่อนตรวจจับ
+    scaled_min_area: float = 0.0  # min_area ที่ความละเอียดของภาพที่ใช้ตรวจจับ
+
+def line_endpoints(width, height, detection_line, detection_angle):
+    """คำนวณจุดปลายของเส้นตรวจจับให้ครอบคลุมทั้งภาพ"""
+    # สำหรับแนวตั้ง ใช้จุดกลางตามแนวนอน
+    center_x = detection_line if detection_line is not None else width // 2
+    center_y = height // 2
+    
+    # คำนวณความยาวของเส้นให้ครอบคลุมทั้งภาพ
+    line_length = max(width, height) * 2
+    
+    angle_rad = math.radians(detection_angle)
+    cos_angle = math.cos(angle_rad)
+    sin_angle = math.sin(angle_rad)
+    
+    x1 = int(center_x - line_length * cos_angle)
+    y1 = int(center_y - line_length * sin_angle)
+    x2 = int(center_x + line_length * cos_angle)
+    y2 = int(center_y + line_length * sin_angle)
+    return x1, y1, x2, y2
+
+class LineGeometry(NamedTuple):
+    """เส้นตรวจจับที่คำนวณไว้ล่วงหน้าสำหรับขนาดภาพหนึ่ง ๆ
+    
+    เก็บเวกเตอร์ตั้งฉาก (normal_x, normal_y) และค่า offset ของสมการเส้น
+    การตรวจสอบว่าจุดอยู่ด้านไหนของเส้นจึงเหลือเพียง dot product เดียว
+    และเก็บพื้นที่สนใจ (ROI) รอบเส้นที่ใช้ตรวจจับ
+    """
+    width: int
+    height: int
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    normal_x: int
+    normal_y: int
+    offset: int
+    roi_x: int
+    roi_y: int
+    roi_w: int
+    roi_h: int
+    
+    @classmethod
+    def build(cls, width, height, detection_line, detection_angle, roi_margin=0):
+        """สร้างเรขาคณิตของเส้นจากตำแหน่งและมุมของเส้นตรวจจับ
+        
+        ROI คือกรอบสี่เหลี่ยมที่ครอบส่วนของเส้นที่อยู่ในภาพ ขยายออกไปข้างละ roi_margin พิกเซล
+        ถ้า roi_margin เป็น 0 หรือเส้นไม่ผ่านภาพ จะใช้ทั้งภาพ
+        """
+        x1, y1, x2, y2 = line_endpoints(width, height, detection_line, detection_angle)
+        
+        roi = (0, 0, width, height)
+        if roi_margin > 0:
+            inside, (cx1, cy1), (cx2, cy2) = cv2.clipLine((0, 0, width, height), (x1, y1), (x2, y2))
+            if inside:
+                left = max(0, min(cx1, cx2) - roi_margin)
+                top = max(0, min(cy1, cy2) - roi_margin)
+                right = min(width, max(cx1, cx2) + roi_margin + 1)
+                bottom = min(height, max(cy1, cy2) + roi_margin + 1)
+                roi = (left, top, right - left, bottom - top)
+        
+        return cls(width, height, x1, y1, x2, y2, y2 - y1, x1 - x2, x2 * y1 - x1 * y2, *roi)
+    
+    def is_left(self, point_x, point_y):
+        """ตรวจสอบว่าจุดอยู่ทางซ้ายของเส้นหรือไม่"""
+        return self.normal_x * point_x + self.normal_y * point_y + self.offset > 0
+    
+    def is_left_many(self, points):
+        """ตรวจสอบหลายจุดพร้อมกัน (points เป็น array ขนาด N x 2) ส่งคืน array ของ bool"""
+        return points @ np.array([self.normal_x, self.normal_y]) + self.offset > 0
+
+def detect_frame(frame, fgbg, tracker, profile, line):
+    """ตรวจจับวัตถุเคลื่อนไหวในเฟรมและหาการข้ามเส้นตรวจจับ
+    
+    ประมวลผลเฉพาะ ROI รอบเส้นตรวจจับ (ย่อเป็นภาพสีเทาตาม profile.scale)
+    แล้วแปลงพิกัดกลับเป็นพิกัดของภาพความละเอียดเต็ม
+    ฟังก์ชันนี้ไม่แก้ไขเฟรม จึงใช้กับเฟรมใน shared memory ได้โดยตรง
+    ส่งคืน (boxes, centers, track_ids, events) โดย events เป็นรายการ 'entry' หรือ 'exit'
+    """
+    # ตัดเฉพาะ ROI (เป็น view ของเฟรม ไม่มีการคัดลอก)
+    roi = frame[line.roi_y:line.roi_y + line.roi_h, line.roi_x:line.roi_x + line.roi_w]
+    
+    # แปลงเป็นสีเทา
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    
+    # ย่อภาพสีเทาสำหรับการตรวจจับ (ภาพความละเอียดเต็มยังใช้แสดงผลและ snapshot ตามเดิม)
+    scale = profile.scale
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    # ทำ Gaussian blur เพื่อลดสัญญาณรบกวน
+    gray = cv2.GaussianBlur(gray, (profile.blur_size, profile.blur_size), 0)
+    
+    # ใช้ Background Subtraction เพื่อตรวจจับวัตถุเคลื่อนไหว
+    fgmask = fgbg.apply(gray)
+    
+    # กรองสัญญาณรบกวน
+    thresh = cv2.threshold(fgmask, profile.threshold, 255, cv2.THRESH_BINARY)[1]
+    thresh = cv2.dilate(thresh, None, iterations=2)
+    
+    # หา contours ของวัตถุ
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    boxes = []
+    centers = []
+    for contour in contours:
+        # ตรวจสอบว่าพื้นที่มากกว่าค่าขั้นต่ำหรือไม่ (หากมีขนาดใหญ่พอ จะถือว่าเป็นคน)
+        if cv2.contourArea(contour) <= profile.scaled_min_area:
+            continue
+        
+        # แปลงพิกัดจากภาพย่อใน ROI กลับเป็นพิกัดของทั้งภาพ
+        (x, y, w, h) = cv2.boundingRect(contour)
+        if scale < 1.0:
+            x, y, w, h = int(x / scale), int(y / scale), int(w / scale), int(h / scale)
+        x += line.roi_x
+        y += line.roi_y
+        boxes.append((x, y, w, h))
+        
+        # คำนวณจุดศูนย์กลาง
+        centers.append((x + w // 2, y + h // 2))
+    
+    # ติดตามวัตถุข้ามเฟรม และหาการข้ามเส้นของแต่ละ track
+    track_ids, events = tracker.update(centers, line, profile.direction_threshold)
+    
+    return boxes, centers, track_ids, events
+
+def _detection_worker_main(conn, camera_name, max_missed):
+    """ลูปหลักของ process ตรวจจับสำหรับกล้องหนึ่งตัว"""
+    logger = logging.getLogger("DetectionWorker")
+    
+    # background subtractor และตัวติดตามอยู่ใน process นี้ตลอดอายุการทำงาน
+    fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+    tracker = CentroidTracker(max_missed=max_missed)
+    shm = None
+    
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            
+            if message[0] == 'stop':
+                break
+            
+            _, seq, shm_name, shape, dtype, profile, line = message
+            try:
+                # เปิด shared memory ใหม่เมื่อ process หลักสร้างบล็อกใหม่ (เช่น ขนาดเฟรมเปลี่ยน)
+                if shm is None or shm.name != shm_name:
+                    if shm is not None:
+                        shm.close()
+                    shm = shared_memory.SharedMemory(name=shm_name)
+                
+                frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                result = detect_frame(frame, fgbg, tracker, profile, line)
+                del frame
+                
+                conn.send(('ok', seq) + result)
+            except Exception as e:
+                logger.error(f"เกิดข้อผิดพลาดในการตรวจจับของกล้อง {camera_name}: {str(e)}")
+                conn.send(('error', seq, str(e)))
+    finally:
+        if shm is not None:
+            shm.close()
+        conn.close()
+
+class DetectionProcess:
+    """ตัวจัดการ process ตรวจจับของกล้องหนึ่งตัว
+    
+    เฟรมถูกคัดลอกลง shared memory ครั้งเดียว แล้วส่งเฉพาะชื่อบล็อก ขนาด โปรไฟล์และเส้นตรวจจับ
+    ผ่าน pipe ส่วน process ตรวจจับส่งกลับมาเฉพาะกรอบ จุดศูนย์กลาง หมายเลข track และเหตุการณ์การนับ
+    """
+    
+    def __init__(self, camera_name, max_missed=5, timeout=5.0):
+        """เริ่ม process ตรวจจับ"""
+        self.logger = logging.getLogger("DetectionProcess")
+        self.camera_name = camera_name
+        self.timeout = timeout
+        
+        self._shm = None
+        self._shm_shape = None
+        
+        # หมายเลขลำดับของเฟรมที่ส่งไป ใช้จับคู่คำตอบกับเฟรม
+        self._seq = 0
+        self.discarded_replies = 0
+        
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_detection_worker_main,
+            args=(child_conn, camera_name, max_missed),
+            name=f"detection-{camera_name}",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        
+        self.logger.info(f"เริ่ม process ตรวจจับสำหรับกล้อง {camera_name} (pid {self._process.pid})")
+    
+    def is_alive(self):
+        """process ตรวจจับยังทำงานอยู่หรือไม่"""
+        return self._process.is_alive()
+    
+    def process(self, frame, profile, line):
+        """ส่งเฟรมไปตรวจจับใน process แยก แล้วส่งคืน (boxes, centers, track_ids, events)
+        
+        ถ้า process ตรวจจับไม่ตอบภายใน timeout จะถูกหยุดทันทีและไม่ถูกใช้อีก (is_alive() เป็น False)
+        เพราะอาจยังอ่านบล็อก shared memory อยู่ ผู้เรียกต้องเปลี่ยนไปตรวจจับในเธรดแทน
+        """
+        if not self.is_alive():
+            raise RuntimeError(f"process ตรวจจับของกล้อง {self.camera_name} หยุดทำงานแล้ว")
+        
+        # สร้างบล็อก shared memory ใหม่เมื่อขนาดเฟรมเปลี่ยน
+        if self._shm is None or self._shm_shape != (frame.shape, frame.dtype.str):
+            self._release_shm()
+            self._shm = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            self._shm_shape = (frame.shape, frame.dtype.str)
+        
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._shm.buf)[:] = frame
+        self._seq += 1
+        seq = self._seq
+        self._conn.send(('frame', seq, self._shm.name, frame.shape, frame.dtype.str, profile, line))
+        
+        # รอผลโดยไม่ถือ GIL ทำให้หลายกล้องประมวลผลพร้อมกันได้ตามจำนวนคอร์
+        deadline = time.time() + self.timeout
+        while True:
+            if not self._conn.poll(max(0.0, deadline - time.time())):
+                # ห้ามเขียนเฟรมถัดไปลงบล็อกเดิมขณะที่ process อาจยังอ่านอยู่ จึงหยุด process ก่อนคืนหน่วยความจำ
+                self.logger.error(f"process ตรวจจับของกล้อง {self.camera_name} ไม่ตอบสนองภายใน {self.timeout} วินาที หยุด process")
+                self._process.kill()
+                self.stop()
+                raise RuntimeError(f"process ตรวจจับของกล้อง {self.camera_name} ไม่ตอบสนอง")
+            
+            result = self._conn.recv()
+            if result[1] == seq:
+                break
+            
+            # คำตอบที่มาช้าของเฟรมก่อนหน้า (ที่หมดเวลารอไปแล้ว) ทิ้งไป เพื่อไม่ให้ผลลัพธ์เลื่อนไปหนึ่งเฟรม
+            self.discarded_replies += 1
+            self.logger.debug(f"ทิ้งคำตอบที่มาช้าของเฟรม {result[1]} จากกล้อง {self.camera_name}")
+        
+        if result[0] != 'ok':
+            raise RuntimeError(result[2])
+        
+        return result[2:]
+    
+    def stop(self):
+        """หยุด process ตรวจจับและคืนหน่วยความจำที่แชร์"""
+        try:
+            self._conn.send(('stop',))
+        except (BrokenPipeError, OSError):
+            pass
+        
+        self._process.join(timeout=2.0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout=1.0)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        
+        self._conn.close()
+        self._release_shm()
+        self.logger.info(f"หยุด process ตรวจจับสำหรับกล้อง {self.camera_name}")
+    
+    def _release_shm(self):
+        """ปิดและลบบล็อก shared memory ปัจจุบัน"""
+        if self._shm is None:
+            return
+        
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+        self._shm_shape = None
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# frame_broadcaster.py - แชร์เฟรมที่เข้ารหัส JPEG แล้วให้ผู้ชมทุกคนของกล้องเดียวกัน
+import threading
+import time
+import logging
+import cv2
+
+class FrameBroadcaster:
+    """คลาสสำหรับกระจายเฟรมของกล้องหนึ่งตัวไปยังผู้ชมทุกคน
+    
+    เฟรมใหม่จะถูกเข้ารหัสเป็น JPEG เพียงครั้งเดียว (ไม่เกินหนึ่งครั้งต่อรอบ max_fps)
+    แล้วใช้ bytes ชุดเดียวกันกับ MJPEG stream, /api/frame และ GUI ทุกตัว
+    """
+    
+    def __init__(self, camera_name, max_fps=15, quality=80, resize_factor=1.0):
+        """กำหนดค่าเริ่มต้นสำหรับตัวกระจายเฟรม"""
+        self.logger = logging.getLogger("FrameBroadcaster")
+        self.camera_name = camera_name
+        
+        # การตั้งค่าการเข้ารหัส
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.quality = quality
+        self.resize_factor = resize_factor
+        
+        self._lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        
+        # ผู้ชมรอเฟรมใหม่ผ่าน condition นี้แทนการวนตรวจสอบ
+        self._condition = threading.Condition(self._lock)
+        
+        # เฟรมดิบล่าสุดที่กล้องส่งมา (ห้ามแก้ไขหลังจาก publish แล้ว)
+        self._frame = None
+        self._frame_seq = 0
+        
+        # JPEG ที่เข้ารหัสแล้วล่าสุด
+        self._jpeg = None
+        self._jpeg_seq = 0
+        self._last_encode_time = 0.0
+    
+    def publish(self, frame):
+        """รับเฟรมใหม่จากเธรดของกล้อง (ไม่มีการเข้ารหัสในขั้นตอนนี้)"""
+        with self._condition:
+            self._frame = frame
+            self._frame_seq += 1
+            self._condition.notify_all()
+    
+    def clear(self):
+        """ล้างเฟรมทั้งหมดเมื่อกล้องหยุดทำงาน และปลุกผู้ชมที่รออยู่"""
+        with self._condition:
+            self._frame = None
+            self._jpeg = None
+            self._condition.notify_all()
+    
+    def wait_for_frame(self, last_seq, timeout=None):
+        """รอจนกว่าจะมีเฟรมดิบที่ใหม่กว่า last_seq แล้วส่งคืนหมายเลขลำดับล่าสุด"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._frame is not None and self._frame_seq != last_seq, timeout)
+            return self._frame_seq
+    
+    def wait_for_jpeg(self, last_seq, timeout=None):
+        """รอ JPEG ที่ใหม่กว่า last_seq โดยเคารพรอบ max_fps แล้วส่งคืน (seq, bytes)
+        
+        ถ้าหมดเวลาโดยไม่มีเฟรมใหม่ จะส่งคืน (seq เดิม, None)
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._frame is not None and self._frame_seq != last_seq, timeout):
+                return last_seq, None
+        
+        # รอให้ครบรอบ max_fps ก่อนเข้ารหัสเฟรมถัดไป
+        delay = self._last_encode_time + self.min_interval - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        
+        return self.get_jpeg()
+    
+    @property
+    def seq(self):
+        """หมายเลขลำดับของเฟรมดิบล่าสุด"""
+        return self._frame_seq
+    
+    def get_frame(self):
+        """ส่งคืนเฟรมดิบล่าสุดที่แชร์ร่วมกัน (ผู้เรียกต้องไม่แก้ไขเฟรมนี้)"""
+        return self._frame
+    
+    def get_jpeg(self):
+        """ส่งคืน (seq, bytes) ของ JPEG ล่าสุด โดยเข้ารหัสใหม่เฉพาะเมื่อมีเฟรมใหม่และครบรอบ max_fps"""
+        # ใช้ล็อกแยกสำหรับการเข้ารหัส เพื่อไม่ให้เธรดกล้องต้องรอระหว่าง publish
+        with self._encode_lock:
+            with self._lock:
+                frame, frame_seq = self._frame, self._frame_seq
+            
+            if frame is None:
+                return self._jpeg_seq, None
+            
+            now = time.time()
+            stale = self._jpeg is None or self._jpeg_seq != frame_seq
+            if stale and (self._jpeg is None or now - self._last_encode_time >= self.min_interval):
+                try:
+                    self._jpeg = self._encode(frame)
+                    self._jpeg_seq = frame_seq
+                    self._last_encode_time = now
+                except Exception as e:
+                    self.logger.error(f"เกิดข้อผิดพลาดในการเข้ารหัสเฟรมของกล้อง {self.camera_name}: {str(e)}")
+            
+            return self._jpeg_seq, self._jpeg
+    
+    def _encode(self, frame):
+        """ปรับขนาดและเข้ารหัสเฟรมเป็น JPEG"""
+        if self.resize_factor < 1.0:
+            h, w = frame.shape[:2]
+            frame = cv2.resize(frame, (int(w * self.resize_factor), int(h * self.resize_factor)))
+        
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer.tobytes()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# frame_grabber.py - อ่านเฟรมจากกล้องในเธรดแยก และเก็บเฉพาะเฟรมล่าสุดไว้
+import threading
+import random
+import time
+import logging
+
+# สถานะของการเชื่อมต่อกล้อง
+STATE_CONNECTING = 'connecting'
+STATE_STREAMING = 'streaming'
+STATE_STALLED = 'stalled'
+STATE_BACKOFF = 'backoff'
+STATE_STOPPED = 'stopped'
+
+class FrameGrabber:
+    """คลาสสำหรับอ่านเฟรมจากกล้องหนึ่งตัวอย่างต่อเนื่องในเธรดของตัวเอง
+    
+    เธรดนี้ดึงเฟรมออกจาก decoder ให้เร็วที่สุดเท่าที่กล้องส่งมา และเก็บไว้เพียง
+    เฟรมล่าสุดเฟรมเดียว ตัวตรวจจับจึงได้เฟรมที่ใหม่ที่สุดเสมอ แม้การประมวลผล
+    จะช้ากว่ากล้อง (เฟรมที่ถูกข้ามไปจะนับเป็น dropped_frames)
+    
+    การเชื่อมต่อถูกดูแลด้วย state machine (connecting, streaming, stalled, backoff)
+    ถ้าไม่ได้รับเฟรมนานเกิน stall_timeout วินาที จะปิดสตรีมแล้วเปิดใหม่ด้วย open_func
+    โดยเว้นระยะแบบ exponential backoff ที่มีการสุ่ม (jitter) ระหว่างแต่ละครั้ง
+    """
+    
+    def __init__(self, camera_name, open_func, cap=None,
+                 stall_timeout=5.0, backoff_initial=1.0, backoff_max=60.0):
+        """กำหนดค่าเริ่มต้นสำหรับตัวอ่านเฟรม
+        
+        open_func คือฟังก์ชันที่เปิดสตรีมใหม่และส่งคืน cap (หรือ None ถ้าเปิดไม่ได้)
+        ถ้าส่ง cap ที่เปิดแล้วมาด้วย จะเริ่มอ่านจาก cap นั้นทันที
+        """
+        self.logger = logging.getLogger("FrameGrabber")
+        self.camera_name = camera_name
+        self.open_func = open_func
+        self.cap = cap
+        
+        # (seq, frame) ของเฟรมล่าสุด เฟรมก่อนหน้าที่ยังไม่ถูกหยิบไปจะถูกแทนที่
+        self._latest = None
+        self._condition = threading.Condition()
+        
+        self._running = False
+        self._thread = None
+        self._stop_event = threading.Event()
+        
+        # การตั้งค่าการเชื่อมต่อใหม่
+        self.stall_timeout = stall_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        
+        # สถิติการอ่านเฟรม
+        self.captured_frames = 0
+        self.dropped_frames = 0
+        self.read_failures = 0
+        self._last_taken_seq = 0
+        
+        # สถานะและสถิติการเชื่อมต่อ
+        self.state = STATE_STOPPED
+        self.reconnect_count = 0
+        self.total_downtime = 0.0
+        self.last_frame_time = None
+        self._down_since = None
+        self._backoff_attempt = 0
+        self._streaming_since = None
+    
+    def start(self):
+        """เริ่มเธรดอ่านเฟรม"""
+        if self._running:
+            return
+        
+        self._running = True
+        self._stop_event.clear()
+        self.last_frame_time = time.time()
+        self._thread = threading.Thread(target=self._grab_loop, daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout=1.0):
+        """หยุดเธรดอ่านเฟรม และปลุกผู้ที่รอเฟรมอยู่ (เธรดจะปิด cap เองเมื่อออกจากลูป)"""
+        self._running = False
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+    
+    @property
+    def running(self):
+        """เธรดอ่านเฟรมยังทำงานอยู่หรือไม่"""
+        return self._running
+    
+    def _grab_loop(self):
+        """วนอ่านเฟรมจากกล้องและเก็บเป็นเฟรมล่าสุด พร้อมเชื่อมต่อใหม่อัตโนมัติ (เรียกจากเธรดแยก)"""
+        self.logger.info(f"เริ่มเธรดอ่านเฟรมจากกล้อง {self.camera_name}")
+        
+        while self._running:
+            try:
+                # เปิดสตรีมถ้ายังไม่มีหรือถูกปิดไปแล้ว
+                if self.cap is None or not self.cap.isOpened():
+                    if not self._connect():
+                        self._wait_backoff()
+                        continue
+                
+                ret, frame = self.cap.read()
+                now = time.time()
+                
+                if not ret or frame is None:
+                    self.read_failures += 1
+                    
+                    # ไม่ได้รับเฟรมนานเกินกำหนด ถือว่าสตรีมค้าง ให้ปิดแล้วเปิดใหม่
+                    if now - (self.last_frame_time or now) > self.stall_timeout or not self.cap.isOpened():
+                        self._mark_down(STATE_STALLED, f"ไม่ได้รับเฟรมจากกล้อง {self.camera_name} นานเกิน {self.stall_timeout} วินาที")
+                        self._release_cap()
+                        self._wait_backoff()
+                        continue
+                    
+                    self._stop_event.wait(0.1)
+                    continue
+                
+                self._mark_streaming(now)
+                
+                with self._condition:
+                    self.captured_frames += 1
+                    self._latest = (self.captured_frames, frame)
+                    self._condition.notify_all()
+            
+            except Exception as e:
+                self.logger.error(f"เกิดข้อผิดพลาดในการอ่านเฟรมจากกล้อง {self.camera_name}: {str(e)}")
+                self._mark_down(STATE_STALLED, None)
+                self._release_cap()
+                self._wait_backoff()
+        
+        self._release_cap()
+        self.state = STATE_STOPPED
+        with self._condition:
+            self._condition.notify_all()
+        
+        self.logger.info(f"หยุดเธรดอ่านเฟรมจากกล้อง {self.camera_name}")
+    
+    def _connect(self):
+        """เปิดสตรีมใหม่ด้วย open_func ส่งคืน True ถ้าสำเร็จ"""
+        self.state = STATE_CONNECTING
+        try:
+            cap = self.open_func()
+        except Exception as e:
+            self.logger.error(f"เกิดข้อผิดพลาดในการเปิดกล้อง {self.camera_name}: {str(e)}")
+            cap = None
+        
+        if cap is None or not cap.isOpened():
+            if cap is not None:
+                cap.release()
+            self._mark_down(STATE_BACKOFF, None)
+            return False
+        
+        self.cap = cap
+        
+        # นับเวลาค้างใหม่ตั้งแต่ตอนเชื่อมต่อได้
+        self.last_frame_time = time.time()
+        if self._down_since is not None:
+            self.reconnect_count += 1
+            self.logger.info(f"เชื่อมต่อกล้อง {self.camera_name} ใหม่สำเร็จ (ครั้งที่ {self.reconnect_count})")
+        return True
+    
+    def _mark_streaming(self, now):
+        """บันทึกว่าได้รับเฟรมแล้ว และปิดช่วงเวลาที่กล้องขาดการเชื่อมต่อ
+        
+        ลดระยะ backoff กลับเป็นค่าเริ่มต้นเมื่อสตรีมส่งเฟรมต่อเนื่องนานเกิน stall_timeout แล้วเท่านั้น
+        กล้องที่ส่งเฟรมได้ไม่กี่เฟรมแล้วหลุดซ้ำ ๆ จึงยังถูกเว้นระยะนานขึ้นเรื่อย ๆ
+        """
+        self.last_frame_time = now
+        if self.state == STATE_STREAMING:
+            if self._backoff_attempt and now - self._streaming_since > self.stall_timeout:
+                self._backoff_attempt = 0
+            return
+        
+        self.state = STATE_STREAMING
+        self._streaming_since = now
+        if self._down_since is not None:
+            self.total_downtime += now - self._down_since
+            self._down_since = None
+    
+    def _mark_down(self, state, message):
+        """เปลี่ยนสถานะเป็นขาดการเชื่อมต่อ (log เฉพาะครั้งแรกของแต่ละช่วง เพื่อไม่ให้ log ท่วม)"""
+        if self._down_since is None:
+            self._down_since = time.time()
+            if message:
+                self.logger.warning(message)
+        self.state = state
+    
+    def _wait_backoff(self):
+        """รอก่อนเชื่อมต่อใหม่แบบ exponential backoff พร้อม jitter (หยุดรอทันทีเมื่อสั่งหยุด)"""
+        self.state = STATE_BACKOFF
+        delay = min(self.backoff_max, self.backoff_initial * (2 ** self._backoff_attempt))
+        delay *= random.uniform(0.5, 1.0)
+        self._backoff_attempt += 1
+        
+        self.logger.info(f"จะลองเชื่อมต่อกล้อง {self.camera_name} ใหม่ในอีก {delay:.1f} วินาที")
+        self._stop_event.wait(delay)
+    
+    def _release_cap(self):
+        """ปิด cap ปัจจุบัน"""
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            except Exception:
+                pass
+            self.cap = None
+    
+    def get_latest(self, last_seq=0, timeout=None):
+        """รอเฟรมที่ใหม่กว่า last_seq แล้วส่งคืน (seq, frame) ของเฟรมล่าสุด
+        
+        เฟรมระหว่าง last_seq กับเฟรมที่ได้รับจะถูกนับเป็น dropped_frames
+        ถ้าหมดเวลาหรือเธรดหยุดทำงาน จะส่งคืน (last_seq, None)
+        """
+        with self._condition:
+            ready = self._condition.wait_for(
+                lambda: not self._running or (self._latest is not None and self._latest[0] > last_seq),
+                timeout
+            )
+            if not ready or self._latest is None or self._latest[0] <= last_seq:
+                return last_seq, None
+            
+            seq, frame = self._latest
+            
+            # นับเฟรมที่ตัวตรวจจับไม่ได้ประมวลผล
+            if seq > self._last_taken_seq + 1:
+                self.dropped_frames += seq - self._last_taken_seq - 1
+            self._last_taken_seq = seq
+            
+            return seq, frame
+    
+    def peek_latest(self):
+        """ส่งคืนเฟรมล่าสุดโดยไม่นับว่าถูกประมวลผล (หรือ None)"""
+        with self._condition:
+            return self._latest[1] if self._latest is not None else None
+    
+    def get_stats(self):
+        """ส่งคืนสถิติการอ่านเฟรมและการเชื่อมต่อ"""
+        downtime = self.total_downtime
+        if self._down_since is not None:
+            downtime += time.time() - self._down_since
+        
+        return {
+            'captured_frames': self.captured_frames,
+            'dropped_frames': self.dropped_frames,
+            'read_failures': self.read_failures,
+            'capture_state': self.state,
+            'reconnects': self.reconnect_count,
+            'downtime_seconds': round(downtime, 1)
+        }
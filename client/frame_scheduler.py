@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# frame_scheduler.py - ปรับจำนวนเฟรมที่ข้ามตามเวลาประมวลผลจริง เมื่อตัวตรวจจับตามกล้องไม่ทัน
+import time
+
+class AdaptiveFrameScheduler:
+    """ตัวจัดรอบการประมวลผลเฟรมของกล้องหนึ่งตัว
+    
+    วัดเวลาประมวลผลต่อเฟรมและอัตราเฟรมที่กล้องส่งมา แล้วเลือกประมวลผลทุก ๆ skip เฟรม
+    เวลาที่ใช้ได้ต่อเฟรมที่ประมวลผล (latency budget) คือ skip x ช่วงเวลาระหว่างเฟรม x target_load
+    ถ้าเวลาประมวลผลเกิน budget จะเพิ่ม skip และลด skip เมื่อมีเวลาเหลือพอ
+    """
+    
+    def __init__(self, target_load=0.8, max_skip=8, enabled=True, smoothing=0.2, adjust_interval=0.5):
+        """กำหนดค่าเริ่มต้นสำหรับตัวจัดรอบ"""
+        self.target_load = target_load
+        self.max_skip = max(1, max_skip)
+        self.enabled = enabled
+        self.smoothing = smoothing
+        self.adjust_interval = adjust_interval
+        
+        self.skip = 1
+        
+        # ค่าเฉลี่ยแบบ exponential ของเวลาประมวลผล และช่วงเวลาระหว่างเฟรมจากกล้อง
+        self.avg_process_time = 0.0
+        self.avg_frame_interval = 0.0
+        
+        self.processed_frames = 0
+        self.processed_fps = 0.0
+        
+        self._last_seq = None
+        self._last_seq_time = None
+        self._last_adjust_time = 0.0
+        self._fps_window_start = time.time()
+        self._fps_window_count = 0
+    
+    def next_seq(self, last_seq):
+        """หมายเลขลำดับที่ต้องรอให้ใหม่กว่า ก่อนจะประมวลผลเฟรมถัดไป"""
+        return last_seq + self.skip - 1
+    
+    def record(self, seq, process_time):
+        """บันทึกเฟรมที่ประมวลผลแล้ว (หมายเลขลำดับและเวลาที่ใช้) และปรับ skip"""
+        now = time.time()
+        
+        # ช่วงเวลาระหว่างเฟรมของกล้อง คำนวณจากหมายเลขลำดับที่เพิ่มขึ้น
+        if self._last_seq is not None and seq > self._last_seq:
+            interval = (now - self._last_seq_time) / (seq - self._last_seq)
+            self.avg_frame_interval = self._smooth(self.avg_frame_interval, interval)
+        self._last_seq = seq
+        self._last_seq_time = now
+        
+        self.avg_process_time = self._smooth(self.avg_process_time, process_time)
+        
+        # อัตราเฟรมที่ประมวลผลจริง
+        self.processed_frames += 1
+        self._fps_window_count += 1
+        elapsed = now - self._fps_window_start
+        if elapsed >= 1.0:
+            self.processed_fps = self._fps_window_count / elapsed
+            self._fps_window_start = now
+            self._fps_window_count = 0
+        
+        if self.enabled and self.avg_frame_interval > 0 and now - self._last_adjust_time >= self.adjust_interval:
+            self._adjust_skip(now)
+    
+    def _adjust_skip(self, now):
+        """เพิ่มหรือลด skip ทีละหนึ่งตาม latency budget"""
+        frame_budget = self.avg_frame_interval * self.target_load
+        
+        if self.avg_process_time > self.skip * frame_budget and self.skip < self.max_skip:
+            # ใช้เวลาเกิน budget ให้ข้ามเฟรมมากขึ้น
+            self.skip += 1
+            self._last_adjust_time = now
+        elif self.skip > 1 and self.avg_process_time < (self.skip - 1) * frame_budget * 0.9:
+            # มีเวลาเหลือพอสำหรับการข้ามเฟรมน้อยลง (เผื่อ 10% กันการสลับไปมา)
+            self.skip -= 1
+            self._last_adjust_time = now
+    
+    def _smooth(self, average, value):
+        """คำนวณค่าเฉลี่ยแบบ exponential"""
+        if average <= 0:
+            return value
+        return average + self.smoothing * (value - average)
+    
+    def get_stats(self):
+        """ส่งคืนสถิติการประมวลผล"""
+        # ถ้าไม่มีเฟรมเข้ามานานเกิน 2 วินาที ถือว่าอัตราเฟรมเป็นศูนย์
+        processed_fps = self.processed_fps
+        if self._last_seq_time is None or time.time() - self._last_seq_time > 2.0:
+            processed_fps = 0.0
+        
+        return {
+            'processed_fps': round(processed_fps, 1),
+            'frame_skip': self.skip,
+            'processing_ms': round(self.avg_process_time * 1000, 1)
+        }
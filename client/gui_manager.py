@@ -12,6 +12,8 @@ import numpy as np
 import os
 import urllib.parse
 
+from capture_backend import load_capture_options, open_capture
+
 class GUIManager:
     """คลาสสำหรับจัดการส่วนติดต่อผู้ใช้แบบกราฟิก"""
     
@@ -732,7 +734,8 @@ class GUIManager:
             self.logger.info(f"ทดสอบการเชื่อมต่อกับกล้อง: {url}")
             
             # ทดสอบการเชื่อมต่อ
-            cap = cv2.VideoCapture(url)
+            cap, backend = open_capture(url, load_capture_options(self.config_manager))
+            self.logger.info(f"เปิดการเชื่อมต่อทดสอบด้วย backend {backend}")
             
             if cap.isOpened():
                 # ลองอ่านเฟรม
@@ -1228,6 +1231,9 @@ class GUIManager:
                 self.branch_name = self.branch_name_var.get()
                 self.root.title(f"ระบบนับลูกค้า - {self.branch_name} ({self.branch_id})")
                 
+                # ใช้พารามิเตอร์การตรวจจับชุดใหม่ทันที
+                self.camera.reload_detection_profiles()
+                
                 # ปรับมุมเส้นตรวจจับหลังจากบันทึก
                 try:
                     new_angle = int(self.detection_angle_var.get())
@@ -1257,21 +1263,23 @@ class GUIManager:
                 current_frame = None
                 
                 # ถ้ามีการเลือกกล้อง ใช้กล้องที่เลือก
+                # (เฟรมจากตัวกระจายเฟรมเป็นชุดเดียวกับที่ส่งให้เว็บ จึงไม่ต้องคัดลอก
+                #  เพราะขั้นตอนด้านล่างสร้างภาพใหม่ทุกครั้งโดยไม่แก้ไขเฟรมเดิม)
                 if self.selected_camera_id is not None:
                     # ดึงเฟรมจากกล้องที่เลือก
                     cameras = [cam for cam in self.camera.cameras if cam['id'] == self.selected_camera_id]
-                    if cameras and 'current_frame' in cameras[0] and cameras[0]['current_frame'] is not None:
-                        current_frame = cameras[0]['current_frame'].copy()
+                    if cameras and cameras[0].get('broadcaster') is not None:
+                        current_frame = cameras[0]['broadcaster'].get_frame()
                 
                 # ถ้าไม่มีเฟรมจากกล้องที่เลือก ใช้เฟรมหลัก
                 if current_frame is None and self.camera.current_frame is not None:
-                    current_frame = self.camera.current_frame.copy()
+                    current_frame = self.camera.current_frame
                 
                 # ถ้าไม่มีเฟรมหลัก ใช้เฟรมจากกล้องใดก็ได้ที่มี
                 if current_frame is None:
                     for cam in self.camera.cameras:
-                        if 'current_frame' in cam and cam['current_frame'] is not None:
-                            current_frame = cam['current_frame'].copy()
+                        if cam.get('broadcaster') is not None and cam['broadcaster'].get_frame() is not None:
+                            current_frame = cam['broadcaster'].get_frame()
                             break
                 
                 if current_frame is not None:
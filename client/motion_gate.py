@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# motion_gate.py - ตรวจการเคลื่อนไหวแบบประหยัดใน ROI เพื่อลดรอบการประมวลผลเมื่อไม่มีคน
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """ประตูตรวจการเคลื่อนไหวของกล้องหนึ่งตัว
+    
+    เปรียบเทียบภาพสีเทาขนาดเล็กของ ROI รอบเส้นตรวจจับกับเฟรมก่อนหน้า ถ้าไม่มีการเคลื่อนไหว
+    นานเกิน idle_after วินาที จะเข้าสู่โหมดพัก และให้ประมวลผลเต็มรูปแบบเพียง idle_fps เฟรมต่อวินาที
+    เมื่อพบการเคลื่อนไหวจะกลับมาประมวลผลทุกเฟรมตั้งแต่เฟรมนั้นทันที
+    """
+    
+    def __init__(self, sample_width=80, pixel_threshold=25, motion_ratio=0.002, idle_after=5.0, idle_fps=1.0):
+        """กำหนดค่าเริ่มต้นสำหรับประตูตรวจการเคลื่อนไหว"""
+        self.sample_width = sample_width
+        self.pixel_threshold = pixel_threshold
+        self.motion_ratio = motion_ratio
+        self.idle_after = idle_after
+        self.idle_interval = 1.0 / idle_fps if idle_fps > 0 else 1.0
+        
+        self.idle = False
+        self._previous = None
+        self._last_motion_time = time.time()
+        self._last_full_time = 0.0
+    
+    def check(self, frame, line):
+        """ตรวจเฟรมใหม่ ส่งคืน True ถ้าควรประมวลผลเฟรมนี้เต็มรูปแบบ"""
+        now = time.time()
+        
+        if self._has_motion(frame, line):
+            self._last_motion_time = now
+            self.idle = False
+        elif not self.idle and now - self._last_motion_time > self.idle_after:
+            self.idle = True
+        
+        # ในโหมดพัก ยังประมวลผลเป็นระยะเพื่อให้ background model และภาพที่แสดงเป็นปัจจุบัน
+        if self.idle and now - self._last_full_time < self.idle_interval:
+            return False
+        
+        self._last_full_time = now
+        return True
+    
+    def _has_motion(self, frame, line):
+        """เปรียบเทียบภาพย่อของ ROI กับเฟรมก่อนหน้า"""
+        roi = frame[line.roi_y:line.roi_y + line.roi_h, line.roi_x:line.roi_x + line.roi_w]
+        
+        # ย่อภาพก่อนแปลงเป็นสีเทา เพื่อให้ต้นทุนต่อเฟรมต่ำที่สุด
+        sample_height = max(1, int(line.roi_h * self.sample_width / max(1, line.roi_w)))
+        small = cv2.resize(roi, (self.sample_width, sample_height), interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        
+        previous = self._previous
+        self._previous = small
+        
+        # เฟรมแรก หรือ ROI เปลี่ยนขนาด ถือว่ามีการเคลื่อนไหว
+        if previous is None or previous.shape != small.shape:
+            return True
+        
+        changed = np.count_nonzero(cv2.absdiff(small, previous) > self.pixel_threshold)
+        return changed >= self.motion_ratio * small.size
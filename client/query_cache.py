@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# query_cache.py - แคชผลลัพธ์ของคำค้นในหน่วยความจำ (LRU พร้อมอายุข้อมูล) สำหรับหน้าสถิติ
+import threading
+import time
+import collections
+
+class QueryCache:
+    """แคชผลลัพธ์ขนาดจำกัด ลบรายการที่ใช้น้อยที่สุดเมื่อเต็ม และรายการที่เก่ากว่า ttl วินาที
+    
+    ถ้าหลายเธรดขอ key เดียวกันที่ยังไม่อยู่ในแคช จะคำนวณเพียงครั้งเดียว เธรดอื่นรอผลนั้น
+    ผลที่คำนวณเสร็จหลังจากมีการล้างแคช (invalidate) จะไม่ถูกเก็บ เพื่อไม่ให้ข้อมูลเก่ากลับเข้าแคช
+    """
+    
+    def __init__(self, max_entries=128, ttl=300.0):
+        """กำหนดค่าเริ่มต้นสำหรับแคช"""
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        
+        self._lock = threading.Lock()
+        
+        # key -> (เวลาที่เก็บ, ผลลัพธ์) เรียงจากใช้ล่าสุดน้อยที่สุดไปมากที่สุด
+        self._entries = collections.OrderedDict()
+        
+        # key -> Event ของการคำนวณที่กำลังทำอยู่
+        self._pending = {}
+        
+        # เพิ่มขึ้นทุกครั้งที่ล้างแคช
+        self._generation = 0
+        
+        # สถิติ
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get_or_compute(self, key, compute):
+        """ส่งคืนผลลัพธ์ของ key จากแคช หรือเรียก compute() แล้วเก็บผลไว้"""
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and time.time() - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                
+                pending = self._pending.get(key)
+                if pending is None:
+                    # เธรดนี้เป็นผู้คำนวณ
+                    self._entries.pop(key, None)
+                    self.misses += 1
+                    generation = self._generation
+                    done = self._pending[key] = threading.Event()
+                    break
+            
+            # มีเธรดอื่นกำลังคำนวณ key นี้อยู่ รอแล้วอ่านจากแคชอีกครั้ง
+            pending.wait()
+        
+        try:
+            result = compute()
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = (time.time(), result)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                del self._pending[key]
+            done.set()
+    
+    def invalidate(self, predicate=None):
+        """ล้างรายการที่ predicate(key) เป็นจริง (หรือทั้งหมดถ้าไม่ระบุ)"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if predicate is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if predicate(key)]:
+                    del self._entries[key]
+    
+    def get_stats(self):
+        """ส่งคืนสถิติของแคช"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# stream_export.py - ส่งออกข้อมูลเป็นสตรีมทีละชุด (CSV, CSV แบบบีบอัด หรือ Parquet) โดยไม่เก็บข้อมูลทั้งหมดไว้ในหน่วยความจำ
+import csv
+import io
+import zlib
+from typing import NamedTuple
+
+class ExportDataset(NamedTuple):
+    """ข้อมูลชุดหนึ่งที่ส่งออกได้"""
+    table: str
+    columns: tuple        # ((ชื่อคอลัมน์, 'int' หรือ 'str'), ...)
+    time_column: str      # คอลัมน์วันที่/เวลา (ข้อความ 'YYYY-MM-DD...') สำหรับกรองช่วงวันที่
+    order_by: str         # ต้องตรงกับลำดับของดัชนี เพื่อให้ SQLite ไม่ต้องเรียงข้อมูลทั้งหมดก่อนส่ง
+    has_camera: bool      # กรองตามกล้องได้หรือไม่
+
+EXPORT_DATASETS = {
+    'raw': ExportDataset(
+        'customer_counts',
+        (('branch_id', 'str'), ('timestamp', 'str'), ('entries', 'int'), ('exits', 'int'), ('total_in_store', 'int')),
+        'timestamp', 'timestamp, id', False
+    ),
+    'hourly': ExportDataset(
+        'traffic_hourly',
+        (('branch_id', 'str'), ('camera_id', 'str'), ('bucket_start', 'str'), ('entries', 'int'), ('exits', 'int'),
+         ('max_occupancy', 'int')),
+        'bucket_start', 'camera_id, bucket_start', True
+    ),
+    'daily': ExportDataset(
+        'daily_stats',
+        (('branch_id', 'str'), ('date', 'str'), ('total_entries', 'int'), ('total_exits', 'int'), ('peak_time', 'str'),
+         ('peak_count', 'int'), ('notes', 'str')),
+        'date', 'date', False
+    )
+}
+
+# รูปแบบไฟล์ -> (content type, นามสกุลไฟล์)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+def encode_export(columns, row_chunks, export_format='csv'):
+    """แปลงชุดของแถว (รายการ tuple ต่อชุด) เป็น generator ของ bytes ตามรูปแบบที่เลือก
+    
+    ตรวจสอบรูปแบบและไลบรารีที่ต้องใช้ทันที (ก่อนเริ่มส่งข้อมูล) และส่ง ValueError ถ้าใช้ไม่ได้
+    """
+    if export_format == 'csv':
+        return _csv_stream(columns, row_chunks)
+    if export_format == 'csv.gz':
+        return _gzip_stream(_csv_stream(columns, row_chunks))
+    if export_format == 'parquet':
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("การส่งออกแบบ Parquet ต้องติดตั้งไลบรารี pyarrow")
+        return _parquet_stream(columns, row_chunks, pyarrow, pyarrow.parquet)
+    raise ValueError(f"ไม่รองรับรูปแบบไฟล์ {export_format}")
+
+def _csv_stream(columns, row_chunks):
+    """เขียน CSV ทีละชุด (หัวตารางอยู่ในชุดแรก)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    
+    for rows in row_chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    
+    # ไม่มีข้อมูลเลย ส่งเฉพาะหัวตาราง
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def _gzip_stream(chunks, level=6):
+    """บีบอัดสตรีมของ bytes เป็นรูปแบบ gzip ทีละชุด"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class _ChunkSink(io.RawIOBase):
+    """ปลายทางสำหรับ ParquetWriter ที่เก็บ bytes ไว้จนกว่าจะถูกดึงออกไปส่ง"""
+    
+    def __init__(self):
+        """กำหนดค่าเริ่มต้น"""
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self._position
+    
+    def drain(self):
+        """ส่งคืน bytes ที่เขียนไว้ตั้งแต่ครั้งก่อนและล้างออก"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _parquet_stream(columns, row_chunks, pa, pq, row_group_size=50000):
+    """เขียน Parquet ทีละ row group (รวมชุดของแถวให้ได้ประมาณ row_group_size แถวก่อนเขียน)"""
+    schema = pa.schema([(name, pa.int64() if kind == 'int' else pa.string()) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    
+    def write_group(rows):
+        arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    
+    try:
+        pending = []
+        for rows in row_chunks:
+            pending.extend(rows)
+            if len(pending) >= row_group_size:
+                write_group(pending)
+                pending = []
+                data = sink.drain()
+                if data:
+                    yield data
+        
+        if pending:
+            write_group(pending)
+    finally:
+        # เขียน footer ของไฟล์ (หรือปิดตัวเขียนเมื่อผู้รับยกเลิก)
+        writer.close()
+    
+    yield sink.drain()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# traffic_rollup.py - สรุปจำนวนคนเข้า/ออกเป็นช่วงเวลา (รายชั่วโมงและราย 15 นาที) ต่อสาขาและต่อกล้อง
+import datetime
+
+# camera_id ของแถวที่เป็นยอดรวมทั้งสาขา
+BRANCH_TOTAL = ''
+
+# (ความยาวช่วงเวลาเป็นนาที, ชื่อตาราง)
+ROLLUP_TABLES = (
+    (60, 'traffic_hourly'),
+    (15, 'traffic_15min')
+)
+
+def bucket_start(time_text, minutes):
+    """ส่งคืนเวลาเริ่มต้นของช่วงที่ time_text ('YYYY-MM-DD HH:MM...') อยู่ ในรูปแบบ 'YYYY-MM-DD HH:MM'"""
+    minute = int(time_text[14:16])
+    if minutes >= 60:
+        return f"{time_text[:13]}:00"
+    return f"{time_text[:14]}{minute - minute % minutes:02d}"
+
+def create_rollup_tables(cursor):
+    """สร้างตารางสรุปตามช่วงเวลา (หนึ่งแถวต่อสาขา กล้อง และช่วงเวลา)"""
+    for _, table in ROLLUP_TABLES:
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            branch_id TEXT NOT NULL,
+            camera_id TEXT NOT NULL DEFAULT '',
+            bucket_start TEXT NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            exits INTEGER NOT NULL DEFAULT 0,
+            max_occupancy INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (branch_id, camera_id, bucket_start)
+        ) WITHOUT ROWID
+        ''')
+        
+        # ค้นหาตามช่วงเวลาโดยไม่ระบุกล้อง
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table} (bucket_start)")
+
+def write_rollups(cursor, samples):
+    """รวมตัวอย่างที่อยู่ในช่วงเดียวกันแล้วเพิ่มเข้าตารางสรุปด้วยคำสั่ง upsert
+    
+    samples คือรายการ (branch_id, camera_id, เวลา 'YYYY-MM-DD HH:MM', คนเข้าเพิ่ม, คนออกเพิ่ม, จำนวนคนในร้าน)
+    """
+    for minutes, table in ROLLUP_TABLES:
+        buckets = {}
+        for branch_id, camera_id, time_text, entries, exits, occupancy in samples:
+            key = (branch_id, camera_id, bucket_start(time_text, minutes))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [entries, exits, occupancy]
+            else:
+                bucket[0] += entries
+                bucket[1] += exits
+                bucket[2] = max(bucket[2], occupancy)
+        
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (branch_id, camera_id, bucket_start, entries, exits, max_occupancy)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (branch_id, camera_id, bucket_start) DO UPDATE SET
+                entries = {table}.entries + excluded.entries,
+                exits = {table}.exits + excluded.exits,
+                max_occupancy = MAX({table}.max_occupancy, excluded.max_occupancy)
+            """,
+            [key + tuple(values) for key, values in buckets.items()]
+        )
+
+def backfill_rollups(cursor, chunk_size=5000):
+    """สร้างยอดรวมรายสาขาจากข้อมูลดิบใน customer_counts ที่บันทึกไว้ก่อนมีตารางสรุป
+    
+    ข้อมูลเดิมไม่มีรายกล้อง จึงเติมเฉพาะแถวยอดรวมของสาขา ส่งคืนจำนวนแถวดิบที่อ่าน
+    """
+    tracker = CounterDeltas()
+    read_cursor = cursor.connection.cursor()
+    read_cursor.execute(
+        "SELECT branch_id, timestamp, entries, exits, total_in_store FROM customer_counts ORDER BY branch_id, timestamp, id"
+    )
+    
+    row_count = 0
+    while True:
+        rows = read_cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        row_count += len(rows)
+        
+        samples = []
+        for branch_id, timestamp, entries, exits, total_in_store in rows:
+            # ข้ามแถวที่เวลาไม่อยู่ในรูปแบบ 'YYYY-MM-DD HH:MM:SS'
+            try:
+                when = datetime.datetime.strptime(str(timestamp)[:16], "%Y-%m-%d %H:%M")
+            except ValueError:
+                continue
+            
+            pieces = tracker.advance((branch_id, BRANCH_TOTAL), entries or 0, exits or 0, when)
+            samples.extend(rollup_samples(branch_id, BRANCH_TOTAL, pieces, total_in_store or 0))
+        
+        write_rollups(cursor, samples)
+    
+    return row_count
+
+class CounterDeltas:
+    """แปลงตัวนับสะสม (entries/exits) เป็นจำนวนที่เพิ่มขึ้นตั้งแต่ค่าที่เห็นครั้งก่อน แบ่งตามช่วงเวลาที่เพิ่มขึ้น
+    
+    ตัวนับเริ่มจาก 0 ทุกครั้งที่เปิดโปรแกรม key ที่ยังไม่มีค่าก่อนหน้าจึงนับค่าทั้งหมดเป็นจำนวนที่เพิ่มขึ้น
+    เมื่อรีเซ็ตตัวนับ ผู้เรียกควรแจ้งด้วย reset() ถ้าไม่ได้แจ้ง ค่าที่น้อยกว่าครั้งก่อนจะถือว่าถูกรีเซ็ต
+    แต่ถ้ารีเซ็ตแล้วนับเกินค่าเดิมก่อนถึงตัวอย่างถัดไป จะแยกไม่ออกจากการนับปกติและนับขาดไป
+    
+    จำนวนที่เพิ่มขึ้นระหว่างสองตัวอย่างถูกแบ่งตามสัดส่วนเวลาให้ทุกช่วง SPREAD_MINUTES นาทีที่คาบเกี่ยว
+    (ถ้าสองตัวอย่างห่างกันเกิน max_spread นาที ไม่รู้ว่าเพิ่มขึ้นเมื่อไร จึงนับให้เวลาปัจจุบันทั้งหมด)
+    ผู้เรียกต้องส่งค่าตามลำดับเวลาที่อ่านได้ (ไม่ล็อกภายใน)
+    """
+    
+    # ความละเอียดของการแบ่ง (ช่วงที่สั้นที่สุดของตารางสรุป)
+    SPREAD_MINUTES = min(minutes for minutes, _ in ROLLUP_TABLES)
+    
+    def __init__(self, max_spread=60):
+        """กำหนดค่าเริ่มต้น"""
+        self.max_spread = datetime.timedelta(minutes=max_spread)
+        
+        # (branch_id, camera_id) -> (entries, exits, เวลา) ล่าสุด
+        self._last = {}
+    
+    def reset(self, branch_id=None):
+        """แจ้งว่าตัวนับสะสมของสาขา branch_id (หรือทุกสาขา) ถูกรีเซ็ตเป็น 0"""
+        for key, (_, _, when) in list(self._last.items()):
+            if branch_id is None or key[0] == branch_id:
+                self._last[key] = (0, 0, when)
+    
+    def advance(self, key, entries, exits, when):
+        """บันทึกค่าตัวนับของ key ณ เวลา when (datetime) และส่งคืนรายการ (เวลา 'YYYY-MM-DD HH:MM', คนเข้าเพิ่ม, คนออกเพิ่ม)
+        
+        รายการสุดท้ายเป็นนาทีของ when เสมอ (แม้ไม่มีจำนวนที่เพิ่มขึ้น)
+        """
+        last = self._last.get(key)
+        self._last[key] = (entries, exits, when)
+        
+        if last is None:
+            # ไม่มีค่าก่อนหน้า (เปิดโปรแกรมใหม่หรือกล้องใหม่) ตัวนับเริ่มจาก 0 แต่ไม่รู้ว่าเริ่มเมื่อไร
+            return [(when.strftime("%Y-%m-%d %H:%M"), entries, exits)]
+        
+        last_entries, last_exits, last_when = last
+        if entries < last_entries or exits < last_exits:
+            # ตัวนับถูกรีเซ็ตโดยไม่ได้แจ้ง นับค่าใหม่ทั้งหมดเป็นจำนวนที่เพิ่มขึ้น
+            last_entries, last_exits = 0, 0
+        
+        return self._spread(last_when, when, entries - last_entries, exits - last_exits)
+    
+    def _spread(self, start, end, entries, exits):
+        """แบ่ง entries/exits ที่เพิ่มขึ้นระหว่าง start ถึง end ตามสัดส่วนเวลาในแต่ละช่วง SPREAD_MINUTES นาที"""
+        end_text = end.strftime("%Y-%m-%d %H:%M")
+        span = (end - start).total_seconds()
+        if (entries == 0 and exits == 0) or span <= 0 or end - start > self.max_spread:
+            return [(end_text, entries, exits)]
+        
+        # เวลาเริ่มของแต่ละช่วงที่คาบเกี่ยว
+        points = [start]
+        boundary = start.replace(minute=start.minute - start.minute % self.SPREAD_MINUTES, second=0, microsecond=0)
+        while True:
+            boundary += datetime.timedelta(minutes=self.SPREAD_MINUTES)
+            if boundary >= end:
+                break
+            points.append(boundary)
+        
+        # ปัดเศษจากยอดสะสม เพื่อให้ผลรวมของทุกช่วงเท่ากับจำนวนที่เพิ่มขึ้นพอดี
+        pieces = []
+        done_entries = done_exits = 0
+        for index, point in enumerate(points):
+            if index + 1 < len(points):
+                share = (points[index + 1] - start).total_seconds() / span
+                upto_entries, upto_exits = round(entries * share), round(exits * share)
+                time_text = point.strftime("%Y-%m-%d %H:%M")
+            else:
+                upto_entries, upto_exits = entries, exits
+                time_text = end_text
+            
+            if upto_entries != done_entries or upto_exits != done_exits or index + 1 == len(points):
+                pieces.append((time_text, upto_entries - done_entries, upto_exits - done_exits))
+            done_entries, done_exits = upto_entries, upto_exits
+        
+        return pieces
+
+def rollup_samples(branch_id, camera_id, pieces, occupancy):
+    """แปลงผลของ CounterDeltas.advance เป็นตัวอย่างสำหรับ write_rollups (จำนวนคนในร้านเป็นของนาทีล่าสุด)"""
+    last = len(pieces) - 1
+    return [
+        (branch_id, camera_id, time_text, entries, exits, occupancy if index == last else 0)
+        for index, (time_text, entries, exits) in enumerate(pieces)
+    ]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# write_behind.py - คิวเขียนข้อมูลแบบหน่วงเวลา รวมหลายรายการแล้วเขียนในเธรดเดียวครั้งละหนึ่ง transaction
+import threading
+import queue
+import time
+import logging
+
+class WriteBehindQueue:
+    """คิวขนาดจำกัดสำหรับส่งรายการไปเขียนในเธรดเขียนของตัวเอง
+    
+    เธรดเขียนรอรายการแรก แล้วรวบรวมรายการที่ตามมาภายใน flush_interval วินาที (ไม่เกิน batch_size)
+    ส่งให้ flush_func เขียนทีเดียว ถ้าคิวเต็มหรือ flush_func ล้มเหลว รายการจะถูกส่งให้
+    overflow_func เพื่อเก็บสำรองแทน เมื่อหยุดทำงานจะเขียนรายการที่ค้างอยู่ทั้งหมดก่อนออก
+    """
+    
+    def __init__(self, name, flush_func, overflow_func, max_size=1000, batch_size=200, flush_interval=1.0):
+        """กำหนดค่าเริ่มต้นและเริ่มเธรดเขียน"""
+        self.logger = logging.getLogger("WriteBehindQueue")
+        self.name = name
+        self.flush_func = flush_func
+        self.overflow_func = overflow_func
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        
+        self._queue = queue.Queue(maxsize=max(1, max_size))
+        self._stop_event = threading.Event()
+        
+        # สถิติ
+        self.flushed_records = 0
+        self.flush_count = 0
+        self.overflow_records = 0
+        self.last_flush_ms = 0.0
+        
+        self._thread = threading.Thread(target=self._writer_loop, name=f"{name}-writer", daemon=True)
+        self._thread.start()
+    
+    def put(self, record):
+        """ส่งรายการเข้าคิวโดยไม่รอ ส่งคืน False ถ้าคิวเต็มหรือหยุดแล้ว (รายการถูกส่งให้ overflow_func)"""
+        if not self._stop_event.is_set():
+            try:
+                self._queue.put_nowait(record)
+                return True
+            except queue.Full:
+                self.logger.warning(f"คิวเขียน {self.name} เต็ม ({self._queue.maxsize} รายการ) เก็บรายการสำรองแทน")
+        
+        self._overflow([record])
+        return False
+    
+    def flush(self, timeout=None):
+        """รอจนรายการที่อยู่ในคิวตอนนี้ถูกเขียนหมด ส่งคืน True ถ้าเสร็จภายใน timeout"""
+        end_time = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if end_time is not None and time.time() >= end_time:
+                return False
+            time.sleep(0.01)
+        return True
+    
+    def close(self, timeout=10.0):
+        """หยุดรับรายการใหม่ เขียนรายการที่ค้างทั้งหมด แล้วหยุดเธรดเขียน"""
+        self._stop_event.set()
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            self.logger.warning(f"เธรดเขียน {self.name} ยังไม่หยุดภายใน {timeout} วินาที")
+    
+    @property
+    def pending(self):
+        """จำนวนรายการที่รอเขียน"""
+        return self._queue.qsize()
+    
+    def _writer_loop(self):
+        """รวบรวมรายการเป็นชุดแล้วเขียน (เรียกจากเธรดเขียน)"""
+        while not self._stop_event.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            batch = [first]
+            deadline = time.time() + self.flush_interval
+            
+            # รวบรวมรายการที่ตามมา จนกว่าจะครบชุด หมดเวลา หรือกำลังหยุด (ตอนหยุดเอาเท่าที่มีในคิว)
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                try:
+                    if self._stop_event.is_set() or remaining <= 0:
+                        batch.append(self._queue.get_nowait())
+                    else:
+                        batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._write_batch(batch)
+    
+    def _write_batch(self, batch):
+        """เขียนหนึ่งชุด และส่งให้ overflow_func ถ้าเขียนไม่สำเร็จ"""
+        start_time = time.time()
+        try:
+            self.flush_func(batch)
+            self.flushed_records += len(batch)
+            self.flush_count += 1
+            self.last_flush_ms = (time.time() - start_time) * 1000
+        except Exception as e:
+            self.logger.error(f"เกิดข้อผิดพลาดในการเขียนข้อมูลจากคิว {self.name} ({len(batch)} รายการ): {str(e)}")
+            self._overflow(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+    
+    def _overflow(self, records):
+        """ส่งรายการที่เขียนไม่ได้ให้ overflow_func"""
+        self.overflow_records += len(records)
+        try:
+            self.overflow_func(records)
+        except Exception as e:
+            self.logger.error(f"เกิดข้อผิดพลาดในการเก็บรายการสำรองของคิว {self.name}: {str(e)}")
+    
+    def get_stats(self):
+        """ส่งคืนสถิติของคิว"""
+        return {
+            'pending': self.pending,
+            'flushed_records': self.flushed_records,
+            'flush_count': self.flush_count,
+            'overflow_records': self.overflow_records,
+            'last_flush_ms': round(self.last_flush_ms, 1)
+        }
@@ -109,6 +109,9 @@ def main():
             gui = GUIManager(camera, data_manager, api_client, config_manager)
             gui.run()
         
+        # ปิดการเชื่อมต่อฐานข้อมูล
+        data_manager.close()
+        
     except Exception as e:
         logger.error(f"เกิดข้อผิดพลาดในการเริ่มระบบ: {str(e)}", exc_info=True)
         return 1
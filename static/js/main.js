@@ -12,6 +12,10 @@ let selectedCameraId = null;        // รหัสกล้องที่เ
 let frameUpdateInterval = null;     // ตัวแปรสำหรับอัพเดตเฟรม
 let statusUpdateInterval = null;    // ตัวแปรสำหรับอัพเดตสถานะ
 let syncStatusInterval = null;      // ตัวแปรสำหรับอัพเดตสถานะการซิงค์
+let lastFrameEtag = null;           // ETag ของเฟรมวิดีโอล่าสุดที่แสดงอยู่
+let lastFrameUrl = null;            // Object URL ของเฟรมวิดีโอล่าสุด
+let frameRequestPending = false;    // มีคำขอเฟรมที่ยังไม่เสร็จอยู่หรือไม่
+let statusEventSource = null;       // การเชื่อมต่อ Server-Sent Events สำหรับตัวนับและสถานะ
 let currentPage = '';               // หน้าปัจจุบัน
 let currentTheme = 'light';         // ธีมปัจจุบัน (light หรือ dark)
 
@@ -168,39 +172,71 @@ async function callApi(url, method = 'GET', data = null) {
 // ฟังก์ชันสำหรับหน้าหลัก (Dashboard)
 // =============================================
 
+/**
+ * ดึงเฟรม JPEG ของกล้องแล้วแสดงใน element ที่กำหนด
+ * ส่ง If-None-Match ด้วย ETag ของเฟรมล่าสุด เซิร์ฟเวอร์จะตอบ 304 ถ้าเฟรมยังไม่เปลี่ยน
+ * @param {number|string} cameraId - รหัสกล้อง
+ * @param {HTMLImageElement} imgElement - element สำหรับแสดงภาพ
+ */
+function fetchVideoFrame(cameraId, imgElement) {
+    if (frameRequestPending || !imgElement) {
+        return;
+    }
+    
+    const headers = {};
+    if (lastFrameEtag) {
+        headers['If-None-Match'] = lastFrameEtag;
+    }
+    
+    frameRequestPending = true;
+    fetch(`/api/frame/${cameraId}`, { headers, cache: 'no-store' })
+        .then(response => {
+            // เฟรมยังไม่เปลี่ยน ไม่ต้องดาวน์โหลดซ้ำ
+            if (response.status === 304) {
+                return null;
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            lastFrameEtag = response.headers.get('ETag');
+            return response.blob();
+        })
+        .then(blob => {
+            if (!blob) {
+                return;
+            }
+            
+            // แสดงภาพจาก Object URL และคืนหน่วยความจำของภาพก่อนหน้า
+            const frameUrl = URL.createObjectURL(blob);
+            imgElement.src = frameUrl;
+            if (lastFrameUrl) {
+                URL.revokeObjectURL(lastFrameUrl);
+            }
+            lastFrameUrl = frameUrl;
+        })
+        .catch(error => {
+            console.error("Error fetching frame:", error);
+        })
+        .finally(() => {
+            frameRequestPending = false;
+        });
+}
+
 /**
  * อัพเดตเฟรมวิดีโอ
  */
 function updateVideoFrame() {
-    // เพิ่ม log เพื่อดูการทำงาน
-    console.log("Updating video frame, camera running:", cameraRunning, "selected camera ID:", selectedCameraId);
-    
     if (!cameraRunning || !selectedCameraId) {
-        console.log("Camera not running or no camera selected");
         return;
     }
     
-    $.ajax({
-        url: `/api/frame/${selectedCameraId}`,
-        type: 'GET',
-        dataType: 'json',
-        success: function(data) {
-            console.log("Frame data received:", data);
-            if (data.frame) {
-                const imgElement = document.getElementById('videoFrame');
-                if (imgElement) {
-                    imgElement.src = 'data:image/jpeg;base64,' + data.frame;
-                } else {
-                    console.error("Video frame element not found");
-                }
-            } else {
-                console.warn("No frame data in response");
-            }
-        },
-        error: function(xhr, status, error) {
-            console.error("Error fetching frame:", error);
-        }
-    });
+    const imgElement = document.getElementById('videoFrame');
+    if (!imgElement) {
+        console.error("Video frame element not found");
+        return;
+    }
+    
+    fetchVideoFrame(selectedCameraId, imgElement);
 }
 
 /**
@@ -222,35 +258,54 @@ function stopFrameUpdate() {
     }
 }
 
+/**
+ * แสดงตัวนับและสถานะกล้อง
+ * รับได้ทั้งข้อมูลเต็มจาก /api/status และข้อมูลเฉพาะส่วนที่เปลี่ยนจาก /api/events
+ * @param {Object} data - ข้อมูลตัวนับและสถานะ
+ */
+function applyCountUpdate(data) {
+    // อัพเดตตัวนับ
+    if ('people_in_store' in data) {
+        document.getElementById('currentCount').textContent = data.people_in_store || '0';
+    }
+    if ('entry_count' in data) {
+        document.getElementById('entryCount').textContent = data.entry_count || '0';
+    }
+    if ('exit_count' in data) {
+        document.getElementById('exitCount').textContent = data.exit_count || '0';
+    }
+    
+    if (!('running' in data)) {
+        return;
+    }
+    
+    // อัพเดตสถานะกล้อง
+    document.getElementById('cameraStatus').textContent = data.running ? 'ทำงาน' : 'ไม่ทำงาน';
+    
+    // อัพเดตปุ่มควบคุม
+    document.getElementById('startCameraBtn').disabled = data.running;
+    document.getElementById('stopCameraBtn').disabled = !data.running;
+    
+    // อัพเดตสถานะระบบ
+    const appStatusEl = document.getElementById('appStatus');
+    if (data.running) {
+        appStatusEl.innerHTML = '<i class="fas fa-circle text-success me-1"></i> กล้องกำลังทำงาน';
+        cameraRunning = true;
+        startFrameUpdate();
+    } else {
+        appStatusEl.innerHTML = '<i class="fas fa-circle text-warning me-1"></i> กล้องไม่ทำงาน';
+        cameraRunning = false;
+        stopFrameUpdate();
+    }
+}
+
 /**
  * อัพเดตสถานะกล้องและระบบ
  */
 function updateStatus() {
     callApi('/api/status', 'GET')
         .then(data => {
-            // อัพเดตตัวนับ
-            document.getElementById('currentCount').textContent = data.people_in_store || '0';
-            document.getElementById('entryCount').textContent = data.entry_count || '0';
-            document.getElementById('exitCount').textContent = data.exit_count || '0';
-            
-            // อัพเดตสถานะกล้อง
-            document.getElementById('cameraStatus').textContent = data.running ? 'ทำงาน' : 'ไม่ทำงาน';
-            
-            // อัพเดตปุ่มควบคุม
-            document.getElementById('startCameraBtn').disabled = data.running;
-            document.getElementById('stopCameraBtn').disabled = !data.running;
-            
-            // อัพเดตสถานะระบบ
-            const appStatusEl = document.getElementById('appStatus');
-            if (data.running) {
-                appStatusEl.innerHTML = '<i class="fas fa-circle text-success me-1"></i> กล้องกำลังทำงาน';
-                cameraRunning = true;
-                startFrameUpdate();
-            } else {
-                appStatusEl.innerHTML = '<i class="fas fa-circle text-warning me-1"></i> กล้องไม่ทำงาน';
-                cameraRunning = false;
-                stopFrameUpdate();
-            }
+            applyCountUpdate(data);
             
             // อัพเดตสถานะการซิงค์
             if (data.sync) {
@@ -263,6 +318,49 @@ function updateStatus() {
         });
 }
 
+/**
+ * เริ่มรับการเปลี่ยนแปลงตัวนับและสถานะแบบ push ผ่าน Server-Sent Events
+ * เซิร์ฟเวอร์ส่งข้อมูลเฉพาะเมื่อตัวนับหรือสถานะกล้องเปลี่ยน จึงไม่ต้องเรียก /api/status ซ้ำๆ
+ * @returns {boolean} true ถ้าเบราว์เซอร์รองรับและเริ่มการเชื่อมต่อแล้ว
+ */
+function startStatusStream() {
+    if (!window.EventSource) {
+        return false;
+    }
+    
+    if (statusEventSource) {
+        return true;
+    }
+    
+    statusEventSource = new EventSource('/api/events');
+    
+    // ข้อมูลทั้งหมดเมื่อเชื่อมต่อ (รวมถึงหลังเชื่อมต่อใหม่อัตโนมัติ)
+    statusEventSource.addEventListener('snapshot', event => {
+        const data = JSON.parse(event.data);
+        applyCountUpdate(data);
+        if (data.sync) {
+            updateSyncStatus(data.sync);
+        }
+    });
+    
+    // เฉพาะค่าที่เปลี่ยน
+    statusEventSource.addEventListener('counts', event => {
+        applyCountUpdate(JSON.parse(event.data));
+    });
+    
+    // สถานะการซิงค์ (ส่งมาเป็นระยะเพื่อรักษาการเชื่อมต่อ)
+    statusEventSource.addEventListener('sync', event => {
+        updateSyncStatus(JSON.parse(event.data));
+    });
+    
+    statusEventSource.onerror = () => {
+        // EventSource จะเชื่อมต่อใหม่เองโดยอัตโนมัติ
+        console.warn('Status event stream disconnected, retrying...');
+    };
+    
+    return true;
+}
+
 /**
  * อัพเดตสถานะการซิงค์
  * @param {Object} syncData - ข้อมูลสถานะการซิงค์
@@ -543,8 +641,9 @@ function testCameraConnection(isEdit = false) {
             document.getElementById('cameraPath').value;
     }
     
-    // เรียก API ทดสอบการเชื่อมต่อ
+    // เรียก API ทดสอบการเชื่อมต่อ (ได้รหัสงานกลับมาทันที แล้วรอผลจากงานนั้น)
     callApi('/api/camera/test_connection', 'POST', requestData)
+        .then(response => waitForProbe(response))
         .then(response => {
             if (response.success) {
                 showAlert('เชื่อมต่อกับกล้องสำเร็จ', 'success');
@@ -558,6 +657,20 @@ function testCameraConnection(isEdit = false) {
         });
 }
 
+/**
+ * รอผลการทดสอบการเชื่อมต่อที่ทำในพื้นหลัง
+ * @param {Object} job - ข้อมูลงานที่ได้จาก API
+ * @returns {Promise<Object>} - ข้อมูลงานเมื่อทดสอบเสร็จ
+ */
+async function waitForProbe(job) {
+    while (job.status === 'pending' || job.status === 'running') {
+        toggleSpinner(true);
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        job = await callApi(`/api/camera/probe/${job.job_id}`, 'GET');
+    }
+    return job;
+}
+
 /**
  * เพิ่มกล้องใหม่
  */
@@ -1168,11 +1281,13 @@ function setupDashboardEvents() {
         }
     }
     
-    // เริ่มอัพเดตสถานะ
-    statusUpdateInterval = setInterval(updateStatus, 2000);
-    
-    // อัพเดตสถานะครั้งแรก
-    updateStatus();
+    // รับการเปลี่ยนแปลงสถานะแบบ push (ใช้การเรียกเป็นระยะเฉพาะเมื่อเบราว์เซอร์ไม่รองรับ)
+    if (!startStatusStream()) {
+        statusUpdateInterval = setInterval(updateStatus, 2000);
+        
+        // อัพเดตสถานะครั้งแรก
+        updateStatus();
+    }
 }
 
 /**
@@ -1401,8 +1516,11 @@ function setupCommonEvents() {
    updateTime();
    setInterval(updateTime, 1000);
    
-   // อัพเดตสถานะการซิงค์ทุก 5 วินาที
+   // อัพเดตสถานะการซิงค์ทุก 5 วินาที (ถ้ายังไม่ได้รับผ่าน /api/events)
    syncStatusInterval = setInterval(() => {
+       if (statusEventSource) {
+           return;
+       }
        callApi('/api/status', 'GET')
            .then(data => {
                if (data.sync) {
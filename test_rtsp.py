@@ -2,17 +2,22 @@
 # test_rtsp.py - ทดสอบการเชื่อมต่อกับกล้องผ่าน RTSP
 
 import cv2
+import sys
 import time
 import argparse
 import urllib.parse
 
-def test_rtsp_connection(url, timeout=10):
+sys.path.append('client')
+from capture_backend import CaptureOptions, open_capture
+
+def test_rtsp_connection(url, timeout=10, options=None):
     """
     ทดสอบการเชื่อมต่อกับกล้องผ่าน RTSP
     
     Args:
         url: RTSP URL หรือข้อมูลการเชื่อมต่อ (username, password, host, port)
         timeout: เวลาที่รอก่อนยกเลิกการเชื่อมต่อ (วินาที)
+        options: CaptureOptions สำหรับเลือก backend และตัวเลือกการถอดรหัส
     
     Returns:
         bool: True ถ้าเชื่อมต่อสำเร็จ, False ถ้าไม่สำเร็จ
@@ -51,7 +56,8 @@ def test_rtsp_connection(url, timeout=10):
     print(f"ทดสอบการเชื่อมต่อกับ: {url}")
     
     # เริ่มการเชื่อมต่อ
-    cap = cv2.VideoCapture(url)
+    cap, backend = open_capture(url, options)
+    print(f"ใช้ backend: {backend}")
     
     start_time = time.time()
     success = False
@@ -111,6 +117,11 @@ if __name__ == "__main__":
     
     parser.add_argument('--timeout', type=int, default=10, help='เวลาที่รอก่อนยกเลิกการเชื่อมต่อ (วินาที) (ค่าเริ่มต้น: 10)')
     
+    # ตัวเลือก backend สำหรับการถอดรหัส
+    parser.add_argument('--backend', type=str, default='auto', help='backend สำหรับเปิดสตรีม (auto, ffmpeg, gstreamer) (ค่าเริ่มต้น: auto)')
+    parser.add_argument('--transport', type=str, default='tcp', help='RTSP transport (tcp, udp) (ค่าเริ่มต้น: tcp)')
+    parser.add_argument('--hw-accel', action='store_true', help='ขอใช้ตัวถอดรหัสฮาร์ดแวร์ถ้ามี')
+    
     args = parser.parse_args()
     
     url = None
@@ -138,7 +149,14 @@ if __name__ == "__main__":
         else:  # dahua หรือประเภทอื่นๆ
             url = build_dahua_url(username, password, host, port, channel)
     
-    success = test_rtsp_connection(url, args.timeout)
+    options = CaptureOptions(
+        backend=args.backend.lower(),
+        rtsp_transport=args.transport.lower(),
+        hw_accel=args.hw_accel,
+        open_timeout_ms=args.timeout * 1000
+    )
+    
+    success = test_rtsp_connection(url, args.timeout, options)
     
     if success:
         print("\nการทดสอบสำเร็จ! สามารถเชื่อมต่อกับกล้องได้")
@@ -0,0 +1,32 @@
+# conftest.py - ตั้งค่าร่วมของชุดทดสอบ: ให้ import โมดูลใน client ได้แบบเดียวกับโปรแกรมหลัก และ fixture ที่ใช้ร่วมกัน
+import os
+import sys
+import configparser
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'client'))
+
+@pytest.fixture
+def make_data_manager(tmp_path, monkeypatch):
+    """สร้าง DataManager ที่ใช้ฐานข้อมูลและไฟล์แคชในโฟลเดอร์ชั่วคราว (ปิดให้เมื่อจบการทดสอบ)"""
+    from data_manager import DataManager
+    
+    # ไฟล์บันทึกสำรองอยู่ใน cache/ ของโฟลเดอร์ปัจจุบัน
+    monkeypatch.chdir(tmp_path)
+    managers = []
+    
+    def make(**database):
+        config = configparser.ConfigParser()
+        config.read_dict({
+            'Branch': {'id': 'b1'},
+            'Database': {'db_name': str(tmp_path / 'shop_tracking.db'), **{k: str(v) for k, v in database.items()}}
+        })
+        manager = DataManager(config)
+        managers.append(manager)
+        return manager
+    
+    yield make
+    
+    for manager in managers:
+        manager.close()
@@ -0,0 +1,72 @@
+# test_centroid_tracker.py - ทดสอบการจับคู่จุดศูนย์กลางและการนับการข้ามเส้นของ CentroidTracker
+from typing import NamedTuple
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from centroid_tracker import CentroidTracker, associate_centroids
+
+class VerticalLine(NamedTuple):
+    """เส้นตรวจจับแนวตั้งที่ x คงที่ (ทางซ้ายคือ x น้อยกว่าเส้น)"""
+    x: int
+    
+    def is_left_many(self, points):
+        return points[:, 0] < self.x
+
+LINE = VerticalLine(100)
+
+def walk(tracker, xs, y=50, threshold=10):
+    """เลื่อนวัตถุหนึ่งชิ้นไปตามตำแหน่ง x ที่กำหนด แล้วส่งคืนเหตุการณ์ทั้งหมด"""
+    events = []
+    for x in xs:
+        _, frame_events = tracker.update([(x, y)], LINE, threshold)
+        events.extend(frame_events)
+    return events
+
+def test_associate_picks_closest_pairs_one_to_one():
+    rows, cols, distances = associate_centroids([(0, 0), (12, 0)], [(10, 0), (1, 0)])
+    pairs = sorted(zip(rows.tolist(), cols.tolist()))
+    assert pairs == [(0, 1), (1, 0)]
+    assert sorted(distances.tolist()) == [1.0, 2.0]
+
+def test_associate_ignores_points_beyond_max_distance():
+    rows, cols, _ = associate_centroids([(0, 0)], [(100, 0)], max_distance=50)
+    assert len(rows) == 0 and len(cols) == 0
+
+def test_associate_handles_empty_input():
+    rows, cols, distances = associate_centroids([], [(1, 1)])
+    assert len(rows) == len(cols) == len(distances) == 0
+
+def test_left_to_right_crossing_counts_one_entry():
+    tracker = CentroidTracker()
+    assert walk(tracker, [70, 85, 95, 105, 115, 130]) == ['entry']
+
+def test_right_to_left_crossing_counts_one_exit():
+    tracker = CentroidTracker()
+    assert walk(tracker, [130, 115, 105, 95, 85, 70]) == ['exit']
+
+def test_jitter_around_the_line_is_not_counted():
+    tracker = CentroidTracker()
+    # ขยับข้ามเส้นไปมาแต่ไม่ไกลจากจุดที่ยืนยันฝั่งเกิน threshold
+    assert walk(tracker, [96, 103, 97, 104, 98], threshold=10) == []
+
+def test_track_keeps_id_through_missed_frames():
+    tracker = CentroidTracker(max_missed=2)
+    ids, _ = tracker.update([(50, 50)], LINE, 10)
+    tracker.update([], LINE, 10)
+    tracker.update([], LINE, 10)
+    same_ids, _ = tracker.update([(55, 50)], LINE, 10)
+    assert same_ids == ids
+    
+    # หายไปนานเกิน max_missed จะได้หมายเลขใหม่
+    for _ in range(3):
+        tracker.update([], LINE, 10)
+    new_ids, _ = tracker.update([(55, 50)], LINE, 10)
+    assert new_ids != ids
+
+def test_tracks_are_bounded_by_max_tracks():
+    tracker = CentroidTracker(max_tracks=2)
+    ids, _ = tracker.update([(0, 0), (200, 0), (400, 0)], LINE, 10)
+    assert ids[2] == -1
+    assert tracker.track_count == 2
@@ -0,0 +1,88 @@
+# test_count_journal.py - ทดสอบการต่อท้ายและการกู้คืนไฟล์บันทึก CountJournal รวมถึงบรรทัดที่เสียหาย
+import json
+import os
+import zlib
+
+from count_journal import CountJournal
+
+def records(count, start=0):
+    return [{'branch_id': 'b1', 'timestamp': f"2026-01-05 10:00:{i:02d}", 'entries': i} for i in range(start, start + count)]
+
+def journal_line(record):
+    payload = json.dumps(record).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+def test_appended_records_are_replayed_in_order(tmp_path):
+    journal = CountJournal(str(tmp_path / 'counts.journal'), fsync_interval=0.0)
+    journal.append(records(3))
+    journal.append(records(2, start=3))
+    
+    assert journal.begin_replay() == records(5)
+    journal.finish_replay()
+    assert journal.begin_replay() == []
+    journal.close()
+
+def test_replay_skips_a_crc_mismatched_trailing_line(tmp_path):
+    path = str(tmp_path / 'counts.journal')
+    journal = CountJournal(path)
+    journal.append(records(2))
+    journal.close()
+    
+    # บรรทัดสุดท้ายครบทั้งบรรทัดแต่ข้อมูลไม่ตรงกับ checksum
+    bad = bytearray(journal_line(records(1, start=9)[0]))
+    bad[20] ^= 0x01
+    with open(path, 'ab') as f:
+        f.write(bytes(bad))
+    
+    assert CountJournal(path).begin_replay() == records(2)
+
+def test_replay_skips_a_torn_trailing_line(tmp_path):
+    path = str(tmp_path / 'counts.journal')
+    with open(path, 'wb') as f:
+        f.write(journal_line(records(1)[0]))
+        f.write(journal_line(records(1, start=1)[0])[:-7])
+    
+    assert CountJournal(path).begin_replay() == records(1)
+
+def test_append_after_a_torn_line_starts_a_new_line(tmp_path):
+    path = str(tmp_path / 'counts.journal')
+    with open(path, 'wb') as f:
+        f.write(journal_line(records(1)[0])[:-7])
+    
+    journal = CountJournal(path)
+    journal.append(records(1, start=5))
+    assert journal.begin_replay() == records(1, start=5)
+    journal.close()
+
+def test_unfinished_replay_is_kept_and_merged_with_new_records(tmp_path):
+    path = str(tmp_path / 'counts.journal')
+    journal = CountJournal(path)
+    journal.append(records(2))
+    assert journal.begin_replay() == records(2)
+    
+    # เขียนลงฐานข้อมูลไม่สำเร็จ (ไม่ได้เรียก finish_replay) แล้วมีรายการใหม่เข้ามา
+    journal.append(records(1, start=2))
+    assert journal.begin_replay() == records(3)
+    journal.finish_replay()
+    assert not os.path.exists(journal.replay_path)
+    journal.close()
+
+def test_data_manager_replays_journal_and_legacy_files_on_start(tmp_path, make_data_manager):
+    os.makedirs(tmp_path / 'cache')
+    journal = CountJournal(str(tmp_path / 'cache' / 'customer_counts.journal'))
+    journal.append([{
+        'branch_id': 'b1', 'timestamp': '2026-01-05 10:00:00', 'entries': 4, 'exits': 1, 'total_in_store': 3,
+        'date': '2026-01-05', 'time': '10:00', 'rollup': [['b1', '', '2026-01-05 10:00', 4, 1, 3]]
+    }])
+    journal.close()
+    with open(tmp_path / 'cache' / 'customer_data_1.json', 'w') as f:
+        json.dump({'branch_id': 'b1', 'timestamp': '2026-01-04 18:30:00', 'entries': 7, 'exits': 6, 'total_in_store': 1}, f)
+    
+    manager = make_data_manager()
+    with manager.db.read() as conn:
+        daily = [tuple(row) for row in conn.execute("SELECT date, total_entries, peak_time FROM daily_stats ORDER BY date")]
+    
+    # ไฟล์รุ่นเก่าใช้วันเวลาของรายการเอง
+    assert daily == [('2026-01-04', 7, '18:30'), ('2026-01-05', 4, '10:00')]
+    assert not os.path.exists(tmp_path / 'cache' / 'customer_data_1.json')
+    assert not os.path.exists(manager.journal.replay_path)
@@ -0,0 +1,117 @@
+# test_detection_process.py - ทดสอบ DetectionProcess (process ตรวจจับแยกแบบ spawn ที่รับเฟรมผ่าน shared memory)
+import os
+import signal
+import time
+import logging
+from multiprocessing import shared_memory
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from centroid_tracker import CentroidTracker
+from detection_engine import DetectionProfile, DetectionProcess, LineGeometry, detect_frame
+
+WIDTH, HEIGHT = 320, 240
+PROFILE = DetectionProfile(blur_size=5, threshold=25, min_area=300, direction_threshold=10, scale=1.0, scaled_min_area=300)
+LINE = LineGeometry.build(WIDTH, HEIGHT, None, 90)
+
+def synthetic_frames():
+    """ฉากว่างให้ background subtractor เรียนรู้ แล้วตามด้วยกล่องสีขาวที่เดินจากซ้ายไปขวาข้ามเส้นกลางภาพ"""
+    frames = [np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8) for _ in range(5)]
+    for x in range(40, 260, 20):
+        frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        frame[90:150, x:x + 30] = 255
+        frames.append(frame)
+    return frames
+
+@pytest.fixture
+def make_detector():
+    """สร้าง DetectionProcess และหยุดให้เมื่อจบการทดสอบ"""
+    detectors = []
+    
+    def make(**options):
+        detector = DetectionProcess('test', **options)
+        detectors.append(detector)
+        return detector
+    
+    yield make
+    
+    for detector in detectors:
+        detector.stop()
+
+def test_process_matches_in_thread_detection(make_detector):
+    detector = make_detector()
+    fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+    tracker = CentroidTracker(max_missed=5)
+    
+    expected = [detect_frame(frame, fgbg, tracker, PROFILE, LINE) for frame in synthetic_frames()]
+    actual = [detector.process(frame, PROFILE, LINE) for frame in synthetic_frames()]
+    
+    assert [tuple(result) for result in actual] == [tuple(result) for result in expected]
+    assert any(boxes for boxes, _, _, _ in expected)
+    assert any(events for _, _, _, events in expected)
+    assert detector.discarded_replies == 0
+
+def test_late_reply_is_discarded(make_detector):
+    detector = make_detector()
+    frame = synthetic_frames()[0]
+    detector.process(frame, PROFILE, LINE)
+    
+    # ส่งเฟรมเพิ่มโดยไม่รอคำตอบ จำลองคำตอบของเฟรมก่อนหน้าที่มาถึงหลังหมดเวลารอ
+    detector._seq += 1
+    detector._conn.send(('frame', detector._seq, detector._shm.name, frame.shape, frame.dtype.str, PROFILE, LINE))
+    
+    boxes, centers, track_ids, events = detector.process(frame, PROFILE, LINE)
+    
+    assert detector.discarded_replies == 1
+    assert (boxes, centers, events) == ([], [], [])
+
+def test_unresponsive_worker_is_stopped_and_not_reused(make_detector):
+    detector = make_detector(timeout=0.5)
+    frame = synthetic_frames()[0]
+    detector.process(frame, PROFILE, LINE)
+    shm_name = detector._shm.name
+    
+    # หยุด process ตรวจจับไว้กลางคันเหมือนค้างอยู่ระหว่างประมวลผล
+    os.kill(detector._process.pid, signal.SIGSTOP)
+    with pytest.raises(RuntimeError):
+        detector.process(frame, PROFILE, LINE)
+    
+    assert not detector.is_alive()
+    assert detector._shm is None
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=shm_name)
+    
+    # เฟรมถัดไปไม่ต้องรอจนหมดเวลาอีก
+    started = time.monotonic()
+    with pytest.raises(RuntimeError):
+        detector.process(frame, PROFILE, LINE)
+    assert time.monotonic() - started < 0.1
+    assert detector._shm is None
+
+def test_camera_falls_back_to_in_thread_detection_when_worker_dies(make_detector):
+    pytest.importorskip("PIL")
+    from camera_counter import CameraCounter
+    
+    detector = make_detector()
+    detector._process.kill()
+    detector._process.join()
+    
+    counter = CameraCounter.__new__(CameraCounter)
+    counter.logger = logging.getLogger("CameraCounter")
+    camera = {
+        'name': 'test',
+        'profile': PROFILE,
+        'line': LINE,
+        'detector': detector,
+        'tracker': CentroidTracker(max_missed=5)
+    }
+    fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+    
+    frame = synthetic_frames()[0]
+    annotated = counter._process_frame(camera, frame, fgbg)
+    
+    assert camera['detector'] is None
+    assert annotated is not frame
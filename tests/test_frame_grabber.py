@@ -0,0 +1,97 @@
+# test_frame_grabber.py - ทดสอบการเชื่อมต่อใหม่แบบ exponential backoff ของ FrameGrabber
+import threading
+import time
+
+import pytest
+
+import frame_grabber
+from frame_grabber import FrameGrabber
+
+class FakeCap:
+    """สตรีมที่เปิดได้ และส่งเฟรมได้ frames เฟรมก่อนอ่านไม่ได้อีก"""
+    
+    def __init__(self, frames=0):
+        self.frames = frames
+        self.opened = True
+    
+    def isOpened(self):
+        return self.opened
+    
+    def read(self):
+        if self.frames > 0:
+            self.frames -= 1
+            return True, object()
+        time.sleep(0.01)
+        return False, None
+    
+    def release(self):
+        self.opened = False
+
+class Opener:
+    """open_func ที่บันทึกเวลาที่ถูกเรียกแต่ละครั้ง"""
+    
+    def __init__(self, frames=0):
+        self.frames = frames
+        self.times = []
+        self.calls = threading.Semaphore(0)
+    
+    def __call__(self):
+        self.times.append(time.time())
+        self.calls.release()
+        return FakeCap(self.frames)
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(frame_grabber.random, 'uniform', lambda low, high: high)
+
+def run_until_opens(opener, count, **options):
+    grabber = FrameGrabber('test', opener, **options)
+    grabber.start()
+    try:
+        for _ in range(count):
+            assert opener.calls.acquire(timeout=10.0)
+    finally:
+        grabber.stop()
+    return grabber
+
+def gaps(times):
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+def test_stalled_stream_is_reopened_with_growing_backoff():
+    # เปิดได้แต่ไม่เคยส่งเฟรม
+    opener = Opener()
+    grabber = run_until_opens(opener, 5, stall_timeout=0.05, backoff_initial=0.1, backoff_max=10.0)
+    
+    waits = gaps(opener.times)
+    assert waits[-1] > waits[0] * 2
+    assert all(later > earlier for earlier, later in zip(waits, waits[1:]))
+    assert grabber.reconnect_count >= 3
+
+def test_flapping_stream_keeps_backing_off():
+    # ส่งเฟรมได้หนึ่งเฟรมหลังเชื่อมต่อ แล้วค้าง
+    opener = Opener(frames=1)
+    grabber = run_until_opens(opener, 5, stall_timeout=0.05, backoff_initial=0.1, backoff_max=10.0)
+    
+    waits = gaps(opener.times)
+    assert waits[-1] > waits[0] * 2
+    assert grabber.captured_frames >= 4
+
+def test_backoff_is_capped_at_backoff_max():
+    opener = Opener()
+    run_until_opens(opener, 6, stall_timeout=0.02, backoff_initial=0.05, backoff_max=0.1)
+    assert max(gaps(opener.times)) < 0.5
+
+def test_failed_first_open_backs_off_and_retries():
+    attempts = []
+    
+    def open_func():
+        attempts.append(time.time())
+        return None
+    
+    grabber = FrameGrabber('test', open_func, backoff_initial=0.05, backoff_max=1.0)
+    grabber.start()
+    time.sleep(0.5)
+    grabber.stop()
+    
+    assert 2 <= len(attempts) <= 5
+    assert grabber.get_stats()['capture_state'] in ('backoff', 'stopped')
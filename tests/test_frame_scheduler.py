@@ -0,0 +1,62 @@
+# test_frame_scheduler.py - ทดสอบการปรับจำนวนเฟรมที่ข้ามของ AdaptiveFrameScheduler
+import pytest
+
+import frame_scheduler
+from frame_scheduler import AdaptiveFrameScheduler
+
+class FakeClock:
+    """นาฬิกาที่เลื่อนเวลาเองเมื่อถูกสั่ง"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(frame_scheduler.time, 'time', clock.time)
+    return clock
+
+def run(scheduler, clock, frames, process_time, frame_interval=0.04):
+    """จำลองกล้อง 25 fps ที่ส่งเฟรมให้ตัวจัดรอบ โดยแต่ละเฟรมใช้เวลาประมวลผล process_time"""
+    seq = scheduler._last_seq or 0
+    for _ in range(frames):
+        seq = scheduler.next_seq(seq) + 1
+        clock.now += frame_interval * scheduler.skip
+        scheduler.record(seq, process_time)
+
+def test_skip_grows_when_processing_is_slower_than_the_camera(clock):
+    scheduler = AdaptiveFrameScheduler(target_load=0.8, max_skip=8, adjust_interval=0.0)
+    run(scheduler, clock, 50, process_time=0.1)
+    
+    # 0.1 วินาทีต่อเฟรม ต้องข้ามอย่างน้อย 0.1 / (0.04 * 0.8) ≈ 3.1 เฟรม
+    assert scheduler.skip >= 4
+
+def test_skip_is_capped_at_max_skip(clock):
+    scheduler = AdaptiveFrameScheduler(max_skip=3, adjust_interval=0.0)
+    run(scheduler, clock, 50, process_time=1.0)
+    assert scheduler.skip == 3
+
+def test_skip_shrinks_back_when_processing_gets_fast(clock):
+    scheduler = AdaptiveFrameScheduler(adjust_interval=0.0)
+    run(scheduler, clock, 50, process_time=0.1)
+    assert scheduler.skip > 1
+    
+    run(scheduler, clock, 200, process_time=0.005)
+    assert scheduler.skip == 1
+
+def test_disabled_scheduler_never_skips(clock):
+    scheduler = AdaptiveFrameScheduler(enabled=False, adjust_interval=0.0)
+    run(scheduler, clock, 50, process_time=1.0)
+    assert scheduler.skip == 1
+    assert scheduler.next_seq(10) == 10
+
+def test_stats_report_zero_fps_after_frames_stop(clock):
+    scheduler = AdaptiveFrameScheduler()
+    run(scheduler, clock, 60, process_time=0.01)
+    assert scheduler.get_stats()['processed_fps'] > 0
+    
+    clock.now += 5.0
+    assert scheduler.get_stats()['processed_fps'] == 0.0
@@ -0,0 +1,77 @@
+# test_motion_gate.py - ทดสอบการเข้าและออกจากโหมดพักของ MotionGate
+from typing import NamedTuple
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+import motion_gate
+from motion_gate import MotionGate
+
+class Roi(NamedTuple):
+    """พื้นที่สนใจรอบเส้นตรวจจับ (ใช้เฉพาะฟิลด์ที่ MotionGate อ่าน)"""
+    roi_x: int
+    roi_y: int
+    roi_w: int
+    roi_h: int
+
+ROI = Roi(40, 20, 160, 120)
+
+class FakeClock:
+    """นาฬิกาที่เลื่อนเวลาเองเมื่อถูกสั่ง"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(motion_gate.time, 'time', clock.time)
+    return clock
+
+def still_frame():
+    return np.full((240, 320, 3), 80, dtype=np.uint8)
+
+def moving_frame():
+    frame = still_frame()
+    frame[40:100, 60:120] = 255
+    return frame
+
+def test_enters_idle_after_quiet_period_and_throttles(clock):
+    gate = MotionGate(idle_after=5.0, idle_fps=1.0)
+    assert gate.check(still_frame(), ROI)
+    
+    clock.now += 6.0
+    assert gate.check(still_frame(), ROI)
+    assert gate.idle
+    
+    # ในโหมดพักประมวลผลได้ idle_fps เฟรมต่อวินาที
+    clock.now += 0.2
+    assert not gate.check(still_frame(), ROI)
+    clock.now += 1.0
+    assert gate.check(still_frame(), ROI)
+
+def test_motion_wakes_the_gate_immediately(clock):
+    gate = MotionGate(idle_after=5.0, idle_fps=1.0)
+    gate.check(still_frame(), ROI)
+    clock.now += 6.0
+    gate.check(still_frame(), ROI)
+    assert gate.idle
+    
+    clock.now += 0.1
+    assert gate.check(moving_frame(), ROI)
+    assert not gate.idle
+
+def test_motion_outside_roi_is_ignored(clock):
+    gate = MotionGate(idle_after=5.0)
+    gate.check(still_frame(), ROI)
+    clock.now += 6.0
+    
+    frame = still_frame()
+    frame[200:240, 0:40] = 255
+    gate.check(frame, ROI)
+    assert gate.idle
@@ -0,0 +1,124 @@
+# test_query_cache.py - ทดสอบอายุข้อมูล การคำนวณครั้งเดียวต่อ key และการล้างแคชของ QueryCache
+import datetime
+import threading
+import time
+
+import query_cache
+from query_cache import QueryCache
+
+def test_hit_after_first_compute():
+    cache = QueryCache()
+    calls = []
+    assert cache.get_or_compute('k', lambda: calls.append(1) or 'v') == 'v'
+    assert cache.get_or_compute('k', lambda: calls.append(1) or 'other') == 'v'
+    assert len(calls) == 1
+    assert cache.get_stats()['hits'] == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, 'time', lambda: now[0])
+    cache = QueryCache(ttl=10.0)
+    cache.get_or_compute('k', lambda: 'old')
+    
+    now[0] += 5.0
+    assert cache.get_or_compute('k', lambda: 'new') == 'old'
+    now[0] += 6.0
+    assert cache.get_or_compute('k', lambda: 'new') == 'new'
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.get_or_compute('b', lambda: 2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.get_or_compute('c', lambda: 3)
+    
+    assert cache.get_or_compute('a', lambda: 'recomputed') == 1
+    assert cache.get_or_compute('b', lambda: 'recomputed') == 'recomputed'
+
+def test_concurrent_misses_compute_once():
+    cache = QueryCache()
+    calls = []
+    
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'v'
+    
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(calls) == 1
+    assert results == ['v'] * 10
+
+def test_failed_compute_is_not_cached_and_releases_waiters():
+    cache = QueryCache()
+    
+    def fail():
+        raise RuntimeError("boom")
+    
+    try:
+        cache.get_or_compute('k', fail)
+    except RuntimeError:
+        pass
+    assert cache.get_or_compute('k', lambda: 'v') == 'v'
+
+def test_invalidate_with_predicate_keeps_other_entries():
+    cache = QueryCache()
+    cache.get_or_compute(('b1', '2026-01-01'), lambda: 'old day')
+    cache.get_or_compute(('b1', '2026-01-05'), lambda: 'today')
+    cache.invalidate(lambda key: key[1] >= '2026-01-05')
+    
+    assert cache.get_or_compute(('b1', '2026-01-01'), lambda: 'recomputed') == 'old day'
+    assert cache.get_or_compute(('b1', '2026-01-05'), lambda: 'recomputed') == 'recomputed'
+
+def test_result_computed_across_an_invalidation_is_not_stored():
+    cache = QueryCache()
+    
+    def compute():
+        # ข้อมูลถูกเขียนใหม่ระหว่างที่กำลังอ่าน
+        cache.invalidate()
+        return 'stale'
+    
+    assert cache.get_or_compute('k', compute) == 'stale'
+    assert cache.get_or_compute('k', lambda: 'fresh') == 'fresh'
+
+def test_data_manager_write_invalidates_cached_stats(make_data_manager):
+    manager = make_data_manager()
+    today = datetime.date.today().isoformat()
+    
+    manager.record_customer_count('t1', 2, 0, 2)
+    assert manager.flush(timeout=5.0)
+    before = manager.get_stats_series(today, today, 'day')
+    assert [row['total_entries'] for row in before] == [2]
+    
+    # ยังอยู่ในแคช
+    assert manager.get_stats_series(today, today, 'day') == before
+    hits = manager.stats_cache.get_stats()['hits']
+    assert hits >= 1
+    
+    manager.record_customer_count('t2', 5, 1, 4)
+    assert manager.flush(timeout=5.0)
+    after = manager.get_stats_series(today, today, 'day')
+    assert [row['total_entries'] for row in after] == [5]
+    assert manager.stats_cache.get_stats()['hits'] == hits
+
+def test_failed_stats_query_is_not_cached(make_data_manager, monkeypatch):
+    manager = make_data_manager()
+    today = datetime.date.today().isoformat()
+    
+    manager.record_customer_count('t1', 3, 0, 3)
+    assert manager.flush(timeout=5.0)
+    
+    def fail(*args):
+        raise RuntimeError("database is locked")
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(manager, '_query_traffic_buckets', fail)
+        assert manager.get_stats_series(today, today, 'day') == []
+    
+    # ผลลัพธ์ว่างจากข้อผิดพลาดต้องไม่ค้างอยู่ในแคชจนหมด TTL
+    assert [row['total_entries'] for row in manager.get_stats_series(today, today, 'day')] == [3]
@@ -0,0 +1,112 @@
+# test_schema_migrations.py - ทดสอบการปรับโครงสร้างฐานข้อมูลจากไฟล์ shop_tracking.db รุ่นแรก (user_version 0)
+import sqlite3
+
+from data_manager import DataManager
+
+# โครงสร้างของฐานข้อมูลรุ่นแรก ก่อนมีการกำหนดเวอร์ชัน
+V0_SCHEMA = '''
+CREATE TABLE employees (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    position TEXT NOT NULL,
+    status TEXT DEFAULT 'available'
+);
+CREATE TABLE appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_name TEXT NOT NULL,
+    phone TEXT,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    service TEXT NOT NULL,
+    employee_id INTEGER,
+    status TEXT DEFAULT 'scheduled',
+    notes TEXT,
+    synced BOOLEAN DEFAULT 0,
+    FOREIGN KEY (employee_id) REFERENCES employees (id)
+);
+CREATE TABLE customer_counts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    exits INTEGER NOT NULL,
+    total_in_store INTEGER NOT NULL,
+    synced BOOLEAN DEFAULT 0
+);
+CREATE TABLE daily_stats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    total_entries INTEGER NOT NULL,
+    total_exits INTEGER NOT NULL,
+    peak_time TEXT,
+    peak_count INTEGER,
+    notes TEXT,
+    synced BOOLEAN DEFAULT 0,
+    UNIQUE(branch_id, date)
+);
+'''
+
+def create_v0_database(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(V0_SCHEMA)
+    conn.executemany(
+        "INSERT INTO customer_counts (branch_id, timestamp, entries, exits, total_in_store) VALUES (?, ?, ?, ?, ?)",
+        [
+            ('b1', '2026-01-05 09:10:00', 2, 0, 2),
+            ('b1', '2026-01-05 09:50:00', 5, 1, 4),
+            ('b1', '2026-01-05 10:20:00', 9, 4, 5),
+        ]
+    )
+    conn.execute(
+        "INSERT INTO daily_stats (branch_id, date, total_entries, total_exits, peak_time, peak_count) VALUES (?, ?, ?, ?, ?, ?)",
+        ('b1', '2026-01-05', 9, 4, '10:20', 5)
+    )
+    conn.commit()
+    conn.close()
+
+def read_all(path, query):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+def test_v0_database_is_upgraded_to_the_latest_version(tmp_path, make_data_manager):
+    db_path = str(tmp_path / 'shop_tracking.db')
+    create_v0_database(db_path)
+    
+    manager = make_data_manager()
+    manager.close()
+    
+    latest = DataManager.SCHEMA_MIGRATIONS[-1][0]
+    assert read_all(db_path, "PRAGMA user_version") == [(latest,)]
+    
+    # ข้อมูลเดิมยังอยู่ครบ
+    assert read_all(db_path, "SELECT COUNT(*) FROM customer_counts") == [(3,)]
+    assert read_all(db_path, "SELECT total_entries, peak_count FROM daily_stats") == [(9, 5)]
+    
+    indexes = {name for (name,) in read_all(db_path, "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_customer_counts_unsynced', 'idx_customer_counts_branch_time', 'idx_daily_stats_unsynced'} <= indexes
+
+def test_v0_counts_are_backfilled_into_hourly_rollups(tmp_path, make_data_manager):
+    create_v0_database(str(tmp_path / 'shop_tracking.db'))
+    manager = make_data_manager()
+    
+    buckets = manager.get_traffic_buckets('2026-01-05', '2026-01-05', 60)
+    assert sum(b['entries'] for b in buckets) == 9
+    assert sum(b['exits'] for b in buckets) == 4
+    assert {b['bucket_start'] for b in buckets} == {'2026-01-05 09:00', '2026-01-05 10:00'}
+
+def test_reopening_does_not_repeat_migrations(tmp_path, make_data_manager):
+    create_v0_database(str(tmp_path / 'shop_tracking.db'))
+    make_data_manager().close()
+    
+    manager = make_data_manager()
+    buckets = manager.get_traffic_buckets('2026-01-05', '2026-01-05', 60)
+    assert sum(b['entries'] for b in buckets) == 9
+
+def test_new_database_starts_at_the_latest_version(tmp_path, make_data_manager):
+    make_data_manager().close()
+    latest = DataManager.SCHEMA_MIGRATIONS[-1][0]
+    assert read_all(str(tmp_path / 'shop_tracking.db'), "PRAGMA user_version") == [(latest,)]
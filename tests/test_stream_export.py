@@ -0,0 +1,106 @@
+# test_stream_export.py - ทดสอบการส่งออกข้อมูลแบบสตรีม (CSV, CSV แบบบีบอัด) และการอ่านทีละชุดจากฐานข้อมูล
+import csv
+import datetime
+import gzip
+import io
+
+import pytest
+
+from stream_export import EXPORT_DATASETS, encode_export
+
+COLUMNS = (('name', 'str'), ('count', 'int'))
+
+def parse_csv(data):
+    return list(csv.reader(io.StringIO(data.decode('utf-8'))))
+
+def test_csv_streams_one_piece_per_chunk_with_header_first():
+    pieces = list(encode_export(COLUMNS, iter([[('a', 1), ('b', 2)], [('c', 3)]]), 'csv'))
+    assert len(pieces) == 2
+    assert parse_csv(b''.join(pieces)) == [['name', 'count'], ['a', '1'], ['b', '2'], ['c', '3']]
+
+def test_csv_without_rows_still_has_header():
+    assert parse_csv(b''.join(encode_export(COLUMNS, iter([]), 'csv'))) == [['name', 'count']]
+
+def test_gzip_output_decompresses_to_the_same_csv():
+    chunks = [[(f"row{i}", i) for i in range(start, start + 100)] for start in range(0, 1000, 100)]
+    plain = b''.join(encode_export(COLUMNS, iter(chunks), 'csv'))
+    compressed = b''.join(encode_export(COLUMNS, iter(chunks), 'csv.gz'))
+    assert gzip.decompress(compressed) == plain
+    assert len(compressed) < len(plain)
+
+def test_rows_are_consumed_lazily():
+    consumed = []
+    
+    def chunks():
+        for i in range(3):
+            consumed.append(i)
+            yield [(str(i), i)]
+    
+    stream = encode_export(COLUMNS, chunks(), 'csv')
+    next(stream)
+    assert consumed == [0]
+
+def test_unknown_format_is_rejected_before_streaming():
+    with pytest.raises(ValueError):
+        encode_export(COLUMNS, iter([]), 'xlsx')
+
+def test_parquet_requires_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        with pytest.raises(ValueError):
+            encode_export(COLUMNS, iter([]), 'parquet')
+    else:
+        pytest.skip("ติดตั้ง pyarrow แล้ว")
+
+def test_iter_export_reads_in_chunks_outside_the_reader_pool(make_data_manager):
+    manager = make_data_manager(read_connections=1)
+    for i in range(25):
+        manager.record_customer_count(f"2026-01-05 10:{i:02d}:00", i, 0, i)
+    assert manager.flush(timeout=5.0)
+    
+    chunks = manager.iter_export('raw', chunk_size=10)
+    first = next(chunks)
+    assert len(first) == 10
+    assert first[0] == ('b1', '2026-01-05 10:00:00', 0, 0, 0)
+    
+    # ระหว่างส่งออก ตัวอ่านเพียงตัวเดียวใน pool ยังว่างให้คำค้นอื่น
+    with manager.db.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM customer_counts").fetchone()[0] == 25
+    
+    rest = list(chunks)
+    assert [len(chunk) for chunk in rest] == [10, 5]
+
+def test_iter_export_filters_by_date_and_camera(make_data_manager):
+    manager = make_data_manager()
+    manager.record_customer_count('t', 3, 0, 3, camera_counts={1: (2, 0, 2), 2: (1, 0, 1)})
+    assert manager.flush(timeout=5.0)
+    
+    today = datetime.date.today().isoformat()
+    rows = [row for chunk in manager.iter_export('hourly', today, today, camera_id=2) for row in chunk]
+    assert len(rows) == 1
+    assert rows[0][1] == '2' and rows[0][3] == 1
+    
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    assert list(manager.iter_export('hourly', yesterday, yesterday)) == []
+    
+    columns = [name for name, _ in EXPORT_DATASETS['hourly'].columns]
+    assert columns[:3] == ['branch_id', 'camera_id', 'bucket_start']
+
+def test_hourly_export_without_camera_sums_to_branch_total(make_data_manager):
+    manager = make_data_manager()
+    manager.record_customer_count('t1', 3, 1, 2, camera_counts={1: (2, 1, 1), 2: (1, 0, 1)})
+    manager.record_customer_count('t2', 7, 2, 5, camera_counts={1: (4, 1, 3), 2: (3, 1, 2)})
+    assert manager.flush(timeout=5.0)
+    
+    today = datetime.date.today().isoformat()
+    columns = [name for name, _ in EXPORT_DATASETS['hourly'].columns]
+    
+    def exported_entries(camera_id=None):
+        rows = [dict(zip(columns, row)) for chunk in manager.iter_export('hourly', today, today, camera_id) for row in chunk]
+        return sum(row['entries'] for row in rows), {row['camera_id'] for row in rows}
+    
+    # ไม่ระบุกล้อง = เฉพาะยอดรวมของสาขา ไม่รวมแถวรายกล้องซ้ำอีกรอบ
+    assert exported_entries() == (7, {''})
+    assert exported_entries(1) == (4, {'1'})
+    assert exported_entries(2) == (3, {'2'})
@@ -0,0 +1,105 @@
+# test_traffic_rollup.py - ทดสอบการแปลงตัวนับสะสมเป็นจำนวนที่เพิ่มขึ้น และตารางสรุปตามช่วงเวลา
+import datetime
+import sqlite3
+
+from traffic_rollup import BRANCH_TOTAL, CounterDeltas, bucket_start, create_rollup_tables, rollup_samples, write_rollups
+
+KEY = ('b1', BRANCH_TOTAL)
+T0 = datetime.datetime(2026, 1, 5, 10, 10)
+
+def at(minutes, seconds=0):
+    return T0 + datetime.timedelta(minutes=minutes, seconds=seconds)
+
+def test_bucket_start():
+    assert bucket_start('2026-01-05 10:44:59', 60) == '2026-01-05 10:00'
+    assert bucket_start('2026-01-05 10:44:59', 15) == '2026-01-05 10:30'
+    assert bucket_start('2026-01-05 10:45', 15) == '2026-01-05 10:45'
+
+def test_first_sample_counts_everything_from_zero():
+    deltas = CounterDeltas()
+    assert deltas.advance(KEY, 5, 2, T0) == [('2026-01-05 10:10', 5, 2)]
+
+def test_increments_within_one_bucket():
+    deltas = CounterDeltas()
+    deltas.advance(KEY, 5, 2, T0)
+    assert deltas.advance(KEY, 8, 2, at(1)) == [('2026-01-05 10:11', 3, 0)]
+    assert deltas.advance(KEY, 8, 2, at(2)) == [('2026-01-05 10:12', 0, 0)]
+
+def test_increment_is_spread_across_the_buckets_it_spans():
+    deltas = CounterDeltas()
+    deltas.advance(KEY, 0, 0, at(1))
+    
+    # 10:11 -> 10:41 คือ 4 นาทีในช่วง 10:00, 15 นาทีในช่วง 10:15 และ 11 นาทีในช่วง 10:30
+    pieces = deltas.advance(KEY, 30, 0, at(31))
+    assert pieces == [('2026-01-05 10:11', 4, 0), ('2026-01-05 10:15', 15, 0), ('2026-01-05 10:41', 11, 0)]
+    assert [bucket_start(t, 15) for t, _, _ in pieces] == ['2026-01-05 10:00', '2026-01-05 10:15', '2026-01-05 10:30']
+
+def test_spread_preserves_the_total():
+    deltas = CounterDeltas()
+    deltas.advance(KEY, 0, 0, at(0, 20))
+    pieces = deltas.advance(KEY, 7, 3, at(47, 40))
+    assert sum(p[1] for p in pieces) == 7
+    assert sum(p[2] for p in pieces) == 3
+
+def test_long_gap_is_credited_to_the_current_minute():
+    deltas = CounterDeltas(max_spread=60)
+    deltas.advance(KEY, 0, 0, T0)
+    assert deltas.advance(KEY, 10, 0, at(180)) == [('2026-01-05 13:10', 10, 0)]
+
+def test_decreasing_counter_is_treated_as_reset():
+    deltas = CounterDeltas()
+    deltas.advance(KEY, 20, 10, T0)
+    assert deltas.advance(KEY, 3, 1, at(1)) == [('2026-01-05 10:11', 3, 1)]
+
+def test_signalled_reset_counts_climb_past_old_value():
+    deltas = CounterDeltas()
+    deltas.advance(KEY, 20, 10, T0)
+    deltas.reset('b1')
+    
+    # โดยไม่ได้แจ้ง 25 > 20 จะถูกนับเป็นเพิ่มขึ้นเพียง 5
+    assert deltas.advance(KEY, 25, 12, at(1)) == [('2026-01-05 10:11', 25, 12)]
+
+def test_reset_only_touches_the_given_branch():
+    deltas = CounterDeltas()
+    other = ('b2', BRANCH_TOTAL)
+    deltas.advance(KEY, 20, 10, T0)
+    deltas.advance(other, 20, 10, T0)
+    deltas.reset('b1')
+    assert deltas.advance(other, 21, 10, at(1)) == [('2026-01-05 10:11', 1, 0)]
+
+def test_rollup_samples_put_occupancy_on_the_latest_minute():
+    samples = rollup_samples('b1', '1', [('2026-01-05 10:11', 4, 0), ('2026-01-05 10:20', 2, 1)], 6)
+    assert samples == [('b1', '1', '2026-01-05 10:11', 4, 0, 0), ('b1', '1', '2026-01-05 10:20', 2, 1, 6)]
+
+def test_write_rollups_accumulates_into_hourly_and_15_minute_tables():
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.cursor()
+    create_rollup_tables(cursor)
+    
+    write_rollups(cursor, [
+        ('b1', '', '2026-01-05 10:05', 2, 0, 2),
+        ('b1', '', '2026-01-05 10:20', 3, 1, 4),
+    ])
+    write_rollups(cursor, [('b1', '', '2026-01-05 10:25', 1, 2, 3)])
+    
+    assert cursor.execute("SELECT bucket_start, entries, exits, max_occupancy FROM traffic_hourly").fetchall() == [
+        ('2026-01-05 10:00', 6, 3, 4)
+    ]
+    assert cursor.execute("SELECT bucket_start, entries, exits, max_occupancy FROM traffic_15min ORDER BY bucket_start").fetchall() == [
+        ('2026-01-05 10:00', 2, 0, 2),
+        ('2026-01-05 10:15', 4, 3, 4)
+    ]
+
+def test_data_manager_records_branch_and_camera_rollups(make_data_manager):
+    manager = make_data_manager()
+    manager.record_customer_count('t1', 3, 1, 2, camera_counts={1: (2, 1, 1), 2: (1, 0, 1)})
+    manager.reset_count_deltas()
+    manager.record_customer_count('t2', 4, 0, 4, camera_counts={1: (3, 0, 3), 2: (1, 0, 1)})
+    assert manager.flush(timeout=5.0)
+    
+    today = datetime.date.today().isoformat()
+    branch = manager.get_traffic_buckets(today, today, 60)
+    camera = manager.get_traffic_buckets(today, today, 60, camera_id=1)
+    assert sum(b['entries'] for b in branch) == 7
+    assert sum(b['exits'] for b in branch) == 1
+    assert sum(b['entries'] for b in camera) == 5
@@ -0,0 +1,73 @@
+# test_write_behind.py - ทดสอบการรวมชุด การเก็บสำรอง และการหยุดทำงานของ WriteBehindQueue
+import threading
+
+from write_behind import WriteBehindQueue
+
+class Recorder:
+    """เก็บชุดที่ถูกเขียนและรายการที่ถูกส่งไปเก็บสำรอง"""
+    
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self.overflow = []
+    
+    def flush(self, batch):
+        if self.fail:
+            raise RuntimeError("เขียนไม่ได้")
+        self.batches.append(list(batch))
+    
+    def store(self, records):
+        self.overflow.extend(records)
+
+def test_records_are_written_in_batches_in_order():
+    recorder = Recorder()
+    queue = WriteBehindQueue('test', recorder.flush, recorder.store, batch_size=50, flush_interval=0.2)
+    for i in range(120):
+        assert queue.put(i)
+    
+    assert queue.flush(timeout=5.0)
+    queue.close()
+    
+    assert [r for batch in recorder.batches for r in batch] == list(range(120))
+    assert all(len(batch) <= 50 for batch in recorder.batches)
+    assert len(recorder.batches) < 120
+    assert queue.get_stats()['flushed_records'] == 120
+
+def test_failed_batch_goes_to_overflow():
+    recorder = Recorder(fail=True)
+    queue = WriteBehindQueue('test', recorder.flush, recorder.store, flush_interval=0.05)
+    queue.put('a')
+    queue.put('b')
+    assert queue.flush(timeout=5.0)
+    queue.close()
+    
+    assert recorder.overflow == ['a', 'b']
+    assert queue.get_stats()['overflow_records'] == 2
+
+def test_full_queue_overflows_without_blocking():
+    release = threading.Event()
+    recorder = Recorder()
+    
+    def slow_flush(batch):
+        release.wait(5.0)
+        recorder.flush(batch)
+    
+    queue = WriteBehindQueue('test', slow_flush, recorder.store, max_size=2, batch_size=1, flush_interval=0.0)
+    results = [queue.put(i) for i in range(10)]
+    release.set()
+    queue.close()
+    
+    assert not all(results)
+    written = [r for batch in recorder.batches for r in batch]
+    assert sorted(written + recorder.overflow) == list(range(10))
+
+def test_close_drains_pending_records_and_rejects_new_ones():
+    recorder = Recorder()
+    queue = WriteBehindQueue('test', recorder.flush, recorder.store, flush_interval=0.2)
+    for i in range(5):
+        queue.put(i)
+    queue.close()
+    
+    assert [r for batch in recorder.batches for r in batch] == list(range(5))
+    assert not queue.put('late')
+    assert recorder.overflow == ['late']
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # web_app.py - เว็บแอปพลิเคชันสำหรับระบบนับลูกค้าผ่านกล้องวงจรปิด
-from flask import Flask, render_template, request, jsonify, Response, redirect, url_for, send_file, send_from_directory
+from flask import Flask, render_template, request, jsonify, Response, redirect, url_for, send_file, send_from_directory, make_response
 import threading
 import time
 import datetime
@@ -23,6 +23,9 @@ from config_manager import ConfigManager
 from camera_counter import CameraCounter
 from data_manager import DataManager
 from api_client import APIClient
+from capture_backend import load_capture_options
+from camera_probe import CameraProbeService, PROBE_PENDING, PROBE_RUNNING
+from stream_export import EXPORT_DATASETS, EXPORT_FORMATS, encode_export
 
 # ตั้งค่าการบันทึกล็อก
 log_dir = 'logs'
@@ -60,23 +63,19 @@ config_manager = None
 data_manager = None
 api_client = None
 camera = None
+probe_service = None
 branch_id = None
 branch_name = None
-video_frames = {}  # เก็บเฟรมล่าสุดของกล้องแต่ละตัว
-last_frame_time = {}  # เวลาที่อัปเดตเฟรมล่าสุดของแต่ละกล้อง
-frame_quality = 80  # คุณภาพในการบีบอัดเฟรม JPEG (1-100)
-max_fps = 15  # จำกัด FPS สูงสุดสำหรับส่งเฟรมไปยังเว็บไคลเอนต์
 client_sessions = {}  # เก็บข้อมูล session ของแต่ละไคลเอนต์
 
 # กำหนดค่า optimization
-OPTIMIZE_VIDEO_STREAMING = True  # เปิดใช้งานการปรับขนาดเฟรม
-FRAME_RESIZE_FACTOR = 0.75  # ลดขนาดลง 25%
-FRAME_QUALITY = 80  # คุณภาพ JPEG (0-100)
+# (ขนาดและคุณภาพ JPEG กำหนดในส่วน [Streaming] และเข้ารหัสครั้งเดียวโดย FrameBroadcaster ของแต่ละกล้อง)
+USE_MJPEG_STREAMING = True  # ใช้ MJPEG stream ที่แชร์ JPEG ร่วมกันระหว่างผู้ชม
 
 
 # เริ่มการทำงานของระบบ
 def initialize_system(config_path='config.ini', debug_mode=False):
-    global config_manager, data_manager, api_client, camera, branch_id, branch_name
+    global config_manager, data_manager, api_client, camera, probe_service, branch_id, branch_name
     
     try:
         # โหลดการตั้งค่า
@@ -110,12 +109,12 @@ def initialize_system(config_path='config.ini', debug_mode=False):
             debug_mode=debug_mode
         )
         
+        # บริการทดสอบการเชื่อมต่อกล้องในพื้นหลัง
+        probe_service = CameraProbeService.from_config(config_manager)
+        
         # เริ่มการซิงค์ข้อมูลกับเซิร์ฟเวอร์
         api_client.start_sync()
         
-        # เริ่มเธรดสำหรับดึงเฟรมและอัพเดตข้อมูล
-        threading.Thread(target=update_frames, daemon=True).start()
-        
         logger.info("เริ่มต้นระบบสำเร็จ")
         return True
     except Exception as e:
@@ -124,85 +123,44 @@ def initialize_system(config_path='config.ini', debug_mode=False):
 
 
 
-# อัพเดตเฟรมและข้อมูลในพื้นหลัง
-def update_frames():
-    global video_frames, last_frame_time
-    
-    while True:
-        try:
-            if camera and camera.camera_running:
-                current_time = time.time()
-                
-                # ดึงเฟรมล่าสุดจากกล้องทุกตัว
-                for cam in camera.cameras:
-                    # ข้ามถ้ากล้องไม่ได้ทำงานหรือไม่มีเฟรม
-                    if not cam['running'] or 'current_frame' not in cam or cam['current_frame'] is None:
-                        continue
-                    
-                    cam_id = cam['id']
-                    
-                    # ตรวจสอบว่าควรอัพเดตเฟรมหรือไม่ (จำกัด FPS)
-                    if cam_id in last_frame_time and current_time - last_frame_time[cam_id] < 1.0 / max_fps:
-                        continue
-                    
-                    # บันทึกเวลาที่อัพเดตเฟรม
-                    last_frame_time[cam_id] = current_time
-                    
-                    # ปรับขนาดเฟรมเพื่อลดการใช้แบนด์วิดท์ (ถ้าเปิดใช้งาน)
-                    frame = cam['current_frame'].copy()
-                    if OPTIMIZE_VIDEO_STREAMING and FRAME_RESIZE_FACTOR < 1.0:
-                        h, w = frame.shape[:2]
-                        new_w = int(w * FRAME_RESIZE_FACTOR)
-                        new_h = int(h * FRAME_RESIZE_FACTOR)
-                        frame = cv2.resize(frame, (new_w, new_h))
-                    
-                    # แปลงเฟรมเป็น base64 สำหรับส่งไปยัง HTML
-                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, frame_quality])
-                    base64_frame = base64.b64encode(buffer).decode('utf-8')
-                    video_frames[cam_id] = base64_frame
-            
-            # รอก่อนอัพเดตครั้งต่อไป
-            time.sleep(0.01)  # 10ms สำหรับการตรวจสอบอย่างรวดเร็ว
-            
-        except Exception as e:
-            logger.error(f"เกิดข้อผิดพลาดในการอัพเดตเฟรม: {str(e)}")
-            time.sleep(1.0)  # รอนานขึ้นในกรณีเกิดข้อผิดพลาด
+# ค้นหาตัวกระจายเฟรมของกล้องที่ทำงานอยู่
+def get_camera_broadcaster(camera_id):
+    if not camera:
+        return None
+    for cam in camera.cameras:
+        if cam['id'] == camera_id and cam['running']:
+            return cam.get('broadcaster')
+    return None
 
 # ฟังก์ชันสำหรับเจนเนอเรท MJPEG stream
 def generate_mjpeg_stream(camera_id):
     try:
         camera_id = int(camera_id)
         boundary = '--jpgboundary'
+        last_seq = 0
         
         while True:
-            if camera and camera.camera_running:
-                # ดึงเฟรมล่าสุดของกล้องนี้
-                frame = None
-                for cam in camera.cameras:
-                    if cam['id'] == camera_id and cam['running'] and 'current_frame' in cam and cam['current_frame'] is not None:
-                        frame = cam['current_frame'].copy()
-                        break
-                
-                if frame is not None:
-                    # ปรับขนาดเฟรมเพื่อลดการใช้แบนด์วิดท์ (ถ้าเปิดใช้งาน)
-                    if OPTIMIZE_VIDEO_STREAMING and FRAME_RESIZE_FACTOR < 1.0:
-                        h, w = frame.shape[:2]
-                        new_w = int(w * FRAME_RESIZE_FACTOR)
-                        new_h = int(h * FRAME_RESIZE_FACTOR)
-                        frame = cv2.resize(frame, (new_w, new_h))
-                    
-                    # บีบอัดเป็นไฟล์ JPEG
-                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, frame_quality])
-                    bytes_frame = buffer.tobytes()
-                    
-                    # ส่งเฟรมในรูปแบบ multipart/x-mixed-replace
-                    yield (b'--' + boundary.encode() + b'\r\n'
-                           b'Content-Type: image/jpeg\r\n'
-                           b'Content-Length: ' + str(len(bytes_frame)).encode() + b'\r\n\r\n' + 
-                           bytes_frame + b'\r\n')
+            # ใช้ JPEG ที่เข้ารหัสไว้แล้วร่วมกับผู้ชมคนอื่น (ไม่เข้ารหัสซ้ำต่อไคลเอนต์)
+            broadcaster = get_camera_broadcaster(camera_id) if camera and camera.camera_running else None
+            if broadcaster is None:
+                # กล้องยังไม่ทำงาน รอสัญญาณเฟรมใหม่แทนการวนตรวจสอบ
+                if camera:
+                    camera.wait_for_frame(camera.frame_seq, timeout=1.0)
+                else:
+                    time.sleep(1.0)
+                continue
+            
+            # รอเฟรมใหม่ (จำกัด FPS โดยตัวกระจายเฟรม)
+            seq, bytes_frame = broadcaster.wait_for_jpeg(last_seq, timeout=1.0)
             
-            # จำกัด FPS
-            time.sleep(1.0 / max_fps)
+            if bytes_frame is not None and seq != last_seq:
+                last_seq = seq
+                
+                # ส่งเฟรมในรูปแบบ multipart/x-mixed-replace
+                yield (b'--' + boundary.encode() + b'\r\n'
+                       b'Content-Type: image/jpeg\r\n'
+                       b'Content-Length: ' + str(len(bytes_frame)).encode() + b'\r\n\r\n' + 
+                       bytes_frame + b'\r\n')
     except Exception as e:
         logger.error(f"เกิดข้อผิดพลาดในการสร้าง MJPEG stream: {str(e)}")
         yield b'--' + b'jpgboundary' + b'\r\n'
@@ -260,30 +218,6 @@ def cleanup_sessions():
     if expired_sessions:
         logger.debug(f"ลบ {len(expired_sessions)} sessions ที่หมดอายุ")
 
- # อัพเดตเฟรมและข้อมูลในพื้นหลัง
-def update_frames():
-    global video_frames
-    
-    while True:
-        try:
-            if camera and camera.camera_running:
-                # ดึงเฟรมล่าสุดจากกล้องทุกตัว
-                for cam in camera.cameras:
-                    logger.debug(f"Checking camera {cam['id']}, running: {cam['running']}")
-                    if cam['running'] and 'current_frame' in cam and cam['current_frame'] is not None:
-                        logger.debug(f"Updating frame for camera {cam['id']}")
-                        # แปลงเฟรมเป็น base64 สำหรับส่งไปยัง HTML
-                        _, buffer = cv2.imencode('.jpg', cam['current_frame'], [cv2.IMWRITE_JPEG_QUALITY, 80])
-                        base64_frame = base64.b64encode(buffer).decode('utf-8')
-                        video_frames[cam['id']] = base64_frame
-            
-            # รอก่อนอัพเดตครั้งต่อไป (0.1 วินาที หรือ 10 fps)
-            time.sleep(0.1)
-            
-        except Exception as e:
-            logger.error(f"เกิดข้อผิดพลาดในการอัพเดตเฟรม: {str(e)}")
-            time.sleep(1.0)  # รอนานขึ้นในกรณีเกิดข้อผิดพลาด       
-
 # ROUTE HANDLERS
 
 # เส้นทาง (Route) สำหรับหน้าหลัก
@@ -363,10 +297,11 @@ def favicon():
                                'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
 
-# API สำหรับดึงเฟรมปัจจุบันของกล้องแบบ
+# API สำหรับดึงเฟรมปัจจุบันของกล้องเป็นไฟล์ JPEG โดยตรง
+# รองรับ ETag (If-None-Match) และพารามิเตอร์ ?since=<seq> เพื่อตอบ 304 เมื่อเฟรมยังไม่เปลี่ยน
 @app.route('/api/frame/<int:camera_id>')
 def get_frame(camera_id):
-    app.logger.info(f"Getting frame for camera: {camera_id}")
+    app.logger.debug(f"Getting frame for camera: {camera_id}")
     try:
         # ระบุ session ID
         session_id = request.cookies.get('session_id')
@@ -374,44 +309,25 @@ def get_frame(camera_id):
             client_sessions[session_id]['last_active'] = time.time()
             client_sessions[session_id]['selected_camera'] = camera_id
         
-        # ตรวจสอบว่ามีเฟรมใน video_frames
-        if camera_id in video_frames:
-            app.logger.info(f"Found frame in cache for camera: {camera_id}")
-            return jsonify({'frame': video_frames[camera_id]})
+        # ใช้ JPEG ล่าสุดจากตัวกระจายเฟรมของกล้อง (เข้ารหัสเมื่อมีผู้ขอเท่านั้น)
+        broadcaster = get_camera_broadcaster(camera_id)
+        seq, buffer = broadcaster.get_jpeg() if broadcaster is not None else (None, None)
+        if buffer is None:
+            app.logger.warning(f"No frame found for camera: {camera_id}")
+            return jsonify({'error': 'ไม่พบเฟรมสำหรับกล้องนี้'}), 404
         
-        app.logger.info(f"Frame not in cache, trying to get directly for camera: {camera_id}")
+        etag = f"{camera_id}-{seq}"
         
-        # ถ้าไม่มีใน video_frames ให้ลองดึงเฟรมปัจจุบันจากกล้องโดยตรง
-        for cam in camera.cameras:
-            if cam['id'] == camera_id and cam['running'] and 'current_frame' in cam and cam['current_frame'] is not None:
-                app.logger.info(f"Got frame directly from camera: {camera_id}")
-                
-                # ดึงเฟรมปัจจุบัน
-                frame = cam['current_frame']
-                
-                # ตรวจสอบการตั้งค่าการปรับขนาดเฟรม (ถ้ามี)
-                # ต้องตรวจสอบว่าตัวแปรเหล่านี้มีอยู่หรือไม่
-                if 'OPTIMIZE_VIDEO_STREAMING' in globals() and OPTIMIZE_VIDEO_STREAMING and 'FRAME_RESIZE_FACTOR' in globals() and FRAME_RESIZE_FACTOR < 1.0:
-                    h, w = frame.shape[:2]
-                    new_w = int(w * FRAME_RESIZE_FACTOR)
-                    new_h = int(h * FRAME_RESIZE_FACTOR)
-                    frame = cv2.resize(frame, (new_w, new_h))
-                
-                # กำหนดค่า frame_quality ถ้ายังไม่มีการกำหนด
-                frame_quality = 80
-                if 'frame_quality' in globals():
-                    frame_quality = frame_quality
-                
-                # แปลงเฟรมเป็น base64
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, frame_quality])
-                base64_frame = base64.b64encode(buffer).decode('utf-8')
-                
-                # เก็บในแคช
-                video_frames[camera_id] = base64_frame
-                return jsonify({'frame': base64_frame})
+        # เฟรมยังไม่เปลี่ยนจากที่ไคลเอนต์มีอยู่
+        if request.if_none_match.contains(etag) or request.args.get('since') == str(seq):
+            response = Response(status=304)
+        else:
+            response = Response(buffer, mimetype='image/jpeg')
         
-        app.logger.warning(f"No frame found for camera: {camera_id}")
-        return jsonify({'error': 'ไม่พบเฟรมสำหรับกล้องนี้'}), 404
+        response.set_etag(etag)
+        response.headers['X-Frame-Seq'] = str(seq)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         app.logger.error(f"Error in get_frame: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -490,6 +406,7 @@ def stop_camera():
     try:
         if camera:
             success = camera.stop()
+            
             return jsonify({'success': success, 'message': 'หยุดการทำงานของกล้องสำเร็จ' if success else 'ไม่สามารถหยุดการทำงานของกล้องได้'})
         return jsonify({'success': False, 'message': 'ไม่พบอินสแตนซ์ของกล้อง'}), 500
     except Exception as e:
@@ -568,6 +485,118 @@ def get_status():
         logger.error(f"Error in get_status: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# จัดรูปแบบข้อความสำหรับ Server-Sent Events
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# หาส่วนที่เปลี่ยนไประหว่างตัวนับสองชุด (ส่งเฉพาะค่าที่เปลี่ยน)
+def diff_counts(previous, current):
+    delta = {key: value for key, value in current.items() if key != 'cameras' and previous.get(key) != value}
+    
+    cameras = {}
+    previous_cameras = previous.get('cameras', {})
+    for cam_id, cam in current.get('cameras', {}).items():
+        previous_cam = previous_cameras.get(cam_id, {})
+        changed = {key: value for key, value in cam.items() if previous_cam.get(key) != value}
+        if changed:
+            cameras[cam_id] = changed
+    
+    if cameras:
+        delta['cameras'] = cameras
+    
+    return delta
+
+# เจนเนอเรทเหตุการณ์การเปลี่ยนแปลงตัวนับและสถานะกล้อง
+def generate_status_events():
+    try:
+        # ส่งข้อมูลทั้งหมดครั้งแรก
+        status_seq = camera.status_seq
+        snapshot = camera.get_counts()
+        initial = dict(snapshot)
+        if api_client:
+            initial['sync'] = api_client.get_sync_status()
+        yield format_sse('snapshot', initial)
+        
+        while True:
+            # รอจนกว่าตัวนับหรือสถานะกล้องจะเปลี่ยน (ไม่มีการวนตรวจสอบ)
+            new_seq = camera.wait_for_status_change(status_seq, timeout=15.0)
+            
+            if new_seq == status_seq:
+                # ไม่มีการเปลี่ยนแปลง ส่งสถานะการซิงค์เพื่อรักษาการเชื่อมต่อ
+                if api_client:
+                    yield format_sse('sync', api_client.get_sync_status())
+                else:
+                    yield ": keepalive\n\n"
+                continue
+            
+            status_seq = new_seq
+            current = camera.get_counts()
+            delta = diff_counts(snapshot, current)
+            snapshot = current
+            
+            if delta:
+                yield format_sse('counts', delta)
+    except GeneratorExit:
+        pass
+    except Exception as e:
+        logger.error(f"เกิดข้อผิดพลาดในการส่งเหตุการณ์สถานะ: {str(e)}")
+
+# API สำหรับรับการเปลี่ยนแปลงตัวนับและสถานะกล้องแบบ push (Server-Sent Events)
+@app.route('/api/events')
+def status_events():
+    if not camera:
+        return jsonify({'error': 'ไม่พบอินสแตนซ์ของกล้อง'}), 500
+    
+    # ทำความสะอาด session ที่ไม่ได้ใช้งาน (ครั้งเดียวต่อการเชื่อมต่อ)
+    cleanup_sessions()
+    
+    response = Response(generate_status_events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # ปิดการบัฟเฟอร์ของ reverse proxy
+    return response
+
+# API สำหรับข้อมูลสถิติตามช่วงวันที่ (ผลลัพธ์ถูกแคชไว้ใน DataManager จนกว่าจะมีการเขียนข้อมูลใหม่)
+@app.route('/api/stats/data')
+def stats_data():
+    if not data_manager:
+        return jsonify({'success': False, 'message': 'ไม่พบอินสแตนซ์ของตัวจัดการข้อมูล'}), 500
+    
+    try:
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('hour', 'day', 'week', 'month'):
+            return jsonify({'success': False, 'message': f"ไม่รองรับการแบ่งช่วงแบบ {granularity}"}), 400
+        
+        # ช่วงวันที่: start_date/end_date หรือ days วันล่าสุด
+        if request.args.get('start_date') and request.args.get('end_date'):
+            start_date = datetime.date.fromisoformat(request.args['start_date'])
+            end_date = datetime.date.fromisoformat(request.args['end_date'])
+        else:
+            days = max(1, int(request.args.get('days', 7)))
+            end_date = datetime.date.today()
+            start_date = end_date - datetime.timedelta(days=days - 1)
+        
+        if start_date > end_date:
+            return jsonify({'success': False, 'message': 'วันที่เริ่มต้นต้องไม่อยู่หลังวันที่สิ้นสุด'}), 400
+        
+        camera_id = request.args.get('camera_id')
+        if camera_id in (None, '', 'all'):
+            camera_id = None
+        
+        data = data_manager.get_stats_series(start_date.isoformat(), end_date.isoformat(), granularity, camera_id)
+        return jsonify({
+            'success': True,
+            'granularity': granularity,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'camera_id': camera_id,
+            'data': data
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f"พารามิเตอร์ไม่ถูกต้อง: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"Error in stats_data: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # API สำหรับส่งออกรายงาน
 @app.route('/api/stats/export', methods=['POST'])
 def export_stats():
@@ -592,6 +621,44 @@ def export_stats():
         logger.error(f"Error in export_stats: {str(e)}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# API สำหรับดาวน์โหลดข้อมูลแบบสตรีม (อ่านจากฐานข้อมูลและส่งทีละชุด ไม่สร้างไฟล์ชั่วคราว)
+@app.route('/api/stats/export', methods=['GET'])
+def stream_export_stats():
+    if not data_manager:
+        return jsonify({'success': False, 'message': 'ไม่พบอินสแตนซ์ของตัวจัดการข้อมูล'}), 500
+    
+    try:
+        dataset = request.args.get('dataset', 'daily')
+        export_format = request.args.get('format', 'csv')
+        if dataset not in EXPORT_DATASETS:
+            return jsonify({'success': False, 'message': f"ไม่รองรับข้อมูลชุด {dataset}"}), 400
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'success': False, 'message': f"ไม่รองรับรูปแบบไฟล์ {export_format}"}), 400
+        
+        start_date = request.args.get('start_date') or None
+        end_date = request.args.get('end_date') or None
+        for value in (start_date, end_date):
+            if value:
+                datetime.date.fromisoformat(value)
+        
+        camera_id = request.args.get('camera_id')
+        if camera_id in (None, '', 'all'):
+            camera_id = None
+        
+        dataset_columns = EXPORT_DATASETS[dataset].columns
+        body = encode_export(dataset_columns, data_manager.iter_export(dataset, start_date, end_date, camera_id), export_format)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    content_type, extension = EXPORT_FORMATS[export_format]
+    period = f"_{start_date or 'start'}_{end_date or 'end'}" if start_date or end_date else ''
+    filename = f"{dataset}_{branch_id}{period}.{extension}"
+    
+    response = Response(body, mimetype=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'  # ส่งทีละชุดผ่าน reverse proxy
+    return response
+
 # API สำหรับดาวน์โหลดไฟล์
 @app.route('/api/download/<path:filename>')
 def download_file(filename):
@@ -666,15 +733,8 @@ def add_camera():
             # รีเซ็ต camera_counter เพื่อโหลดกล้องใหม่
             camera._setup_multiple_cameras()
             
-            # ล้างแคชสำหรับเฟรมกล้อง
-            if new_camera_id in video_frames:
-                del video_frames[new_camera_id]
-            if new_camera_id in last_frame_time:
-                del last_frame_time[new_camera_id]
-            
-            # ทดสอบการเชื่อมต่อกับกล้องใหม่
-            connection_success = False
-            connection_message = "ไม่สามารถทดสอบการเชื่อมต่อได้"
+            # ทดสอบการเชื่อมต่อกับกล้องใหม่ในพื้นหลัง (ผลลัพธ์ดึงได้จาก /api/camera/probe/<job_id>)
+            connection_test = {'success': False, 'status': 'error', 'message': "ไม่สามารถทดสอบการเชื่อมต่อได้"}
             
             try:
                 # ทดสอบการเชื่อมต่อกับกล้องใหม่
@@ -706,40 +766,17 @@ def add_camera():
                             else:
                                 url += path
                 
-                # ให้เวลาในการทดสอบการเชื่อมต่อ 3 วินาที
-                connection_timeout = 3.0
-                cap = cv2.VideoCapture(url)
-                
-                # รอการเชื่อมต่อ
-                start_time = time.time()
-                while not cap.isOpened() and time.time() - start_time < connection_timeout:
-                    time.sleep(0.1)
-                
-                if cap.isOpened():
-                    # ลองอ่านเฟรม
-                    ret, frame = cap.read()
-                    cap.release()
-                    
-                    if ret:
-                        connection_success = True
-                        connection_message = "การเชื่อมต่อกับกล้องสำเร็จ"
-                    else:
-                        connection_message = "เปิดการเชื่อมต่อได้ แต่ไม่สามารถอ่านภาพได้"
-                else:
-                    connection_message = "ไม่สามารถเชื่อมต่อกับกล้องได้"
-                    cap.release()
+                job_id = probe_service.submit(url, load_capture_options(config_manager, camera_section))
+                connection_test = probe_summary(probe_service.get_job(job_id))
             
             except Exception as e:
-                connection_message = f"เกิดข้อผิดพลาดในการทดสอบการเชื่อมต่อ: {str(e)}"
+                connection_test['message'] = f"เกิดข้อผิดพลาดในการทดสอบการเชื่อมต่อ: {str(e)}"
             
             return jsonify({
                 'success': True,
                 'message': f"เพิ่มกล้อง '{data.get('name', f'Camera {new_camera_id}')}' สำเร็จ",
                 'camera_id': new_camera_id,
-                'connection_test': {
-                    'success': connection_success,
-                    'message': connection_message
-                }
+                'connection_test': connection_test
             })
             
         except Exception as e:
@@ -885,6 +922,9 @@ def save_settings():
                 global branch_name
                 branch_name = data.get('branch_name', 'สาขาหลัก')
                 
+                # ใช้พารามิเตอร์การตรวจจับชุดใหม่ทันที
+                camera.reload_detection_profiles()
+                
                 # ปรับมุมเส้นตรวจจับหลังจากบันทึก
                 try:
                     new_angle = int(data.get('detection_angle', '90'))
@@ -945,22 +985,9 @@ def test_camera_connection():
         # แสดง URL ที่ใช้
         logger.info(f"ทดสอบการเชื่อมต่อกับกล้อง: {url}")
         
-        # ทดสอบการเชื่อมต่อ
-        cap = cv2.VideoCapture(url)
-        
-        if cap.isOpened():
-            # ลองอ่านเฟรม
-            ret, frame = cap.read()
-            
-            # ปิดการเชื่อมต่อ
-            cap.release()
-            
-            if ret:
-                return jsonify({'success': True, 'message': 'เชื่อมต่อกับกล้องสำเร็จ'})
-            else:
-                return jsonify({'success': False, 'message': 'เปิดการเชื่อมต่อได้ แต่ไม่สามารถอ่านเฟรมได้'})
-        
-        return jsonify({'success': False, 'message': 'ไม่สามารถเชื่อมต่อกับกล้องได้'})
+        # ส่งงานทดสอบให้ pool แล้วตอบกลับทันทีพร้อมรหัสงาน (ถ้ามีผลล่าสุดใน cache จะได้ผลนั้นเลย)
+        job_id = probe_service.submit(url, load_capture_options(config_manager))
+        return jsonify(probe_summary(probe_service.get_job(job_id)))
         
     except Exception as e:
         logger.error(f"เกิดข้อผิดพลาดในการทดสอบการเชื่อมต่อกับกล้อง: {str(e)}")
@@ -1035,6 +1062,20 @@ def get_camera_details(camera_id):
     
     return jsonify({'success': False, 'message': 'ไม่พบอินสแตนซ์ของกล้องหรือตัวจัดการการตั้งค่า'}), 500
 
+# สรุปผลงานทดสอบสำหรับส่งกลับเป็น JSON (ไม่รวมภาพ)
+def probe_summary(job):
+    if job is None:
+        return {'success': False, 'status': 'unknown', 'message': 'ไม่พบงานทดสอบนี้'}
+    return {key: value for key, value in job.items() if key != 'snapshot'}
+
+# API สำหรับดึงผลการทดสอบการเชื่อมต่อ
+@app.route('/api/camera/probe/<job_id>')
+def get_probe_result(job_id):
+    job = probe_service.get_job(job_id) if probe_service else None
+    if job is None:
+        return jsonify(probe_summary(None)), 404
+    return jsonify(probe_summary(job))
+
 # ทดสอบการเชื่อมต่อกล้องโดยตรง
 @app.route('/test_camera/<int:camera_id>')
 def test_camera_view(camera_id):
@@ -1069,30 +1110,36 @@ def test_camera_view(camera_id):
                 else:
                     url += path
     
-    # ทดสอบการเชื่อมต่อ
+    # ทดสอบการเชื่อมต่อในพื้นหลัง หน้านี้จะรีเฟรชตัวเองจนกว่าจะได้ผล
     try:
-        cap = cv2.VideoCapture(url)
-        if cap.isOpened():
-            ret, frame = cap.read()
-            cap.release()
-            
-            if ret:
-                _, buffer = cv2.imencode('.jpg', frame)
-                img_str = base64.b64encode(buffer).decode('utf-8')
+        job_id = request.args.get('job')
+        job = probe_service.get_job(job_id) if job_id else None
+        if job is None:
+            job_id = probe_service.submit(url, load_capture_options(config_manager, camera_section), snapshot=True)
+            job = probe_service.wait(job_id, timeout=0.5)
+        
+        if job['status'] in (PROBE_PENDING, PROBE_RUNNING):
+            return f"<html><head><meta http-equiv=\"refresh\" content=\"1;url=?job={job_id}\"></head><body><h1>ทดสอบการเชื่อมต่อกล้อง {camera_id}</h1><p>URL: {url}</p><p>สถานะ: กำลังทดสอบการเชื่อมต่อ...</p></body></html>"
+        
+        backend = job['backend']
+        if job['success']:
+            if job['snapshot']:
+                img_str = job['snapshot']
                 return f"""
                 <html>
                 <body>
                     <h1>ทดสอบการเชื่อมต่อกล้อง {camera_id}</h1>
                     <p>URL: {url}</p>
+                    <p>Backend: {backend}</p>
                     <p>สถานะ: เชื่อมต่อสำเร็จ</p>
                     <img src="data:image/jpeg;base64,{img_str}" width="640">
                 </body>
                 </html>
                 """
             else:
-                return f"<html><body><h1>ทดสอบการเชื่อมต่อกล้อง {camera_id}</h1><p>URL: {url}</p><p>สถานะ: เปิดการเชื่อมต่อได้แต่ไม่สามารถอ่านเฟรมได้</p></body></html>"
+                return f"<html><body><h1>ทดสอบการเชื่อมต่อกล้อง {camera_id}</h1><p>URL: {url}</p><p>สถานะ: เชื่อมต่อสำเร็จ</p></body></html>"
         else:
-            return f"<html><body><h1>ทดสอบการเชื่อมต่อกล้อง {camera_id}</h1><p>URL: {url}</p><p>สถานะ: ไม่สามารถเชื่อมต่อกับกล้องได้</p></body></html>"
+            return f"<html><body><h1>ทดสอบการเชื่อมต่อกล้อง {camera_id}</h1><p>URL: {url}</p><p>สถานะ: {job['message']}</p></body></html>"
     except Exception as e:
         return f"<html><body><h1>ทดสอบการเชื่อมต่อกล้อง {camera_id}</h1><p>URL: {url}</p><p>สถานะ: เกิดข้อผิดพลาด - {str(e)}</p></body></html>"
 
@@ -1112,4 +1159,7 @@ if __name__ == '__main__':
     # เริ่มต้นระบบ
     if initialize_system(args.config, args.debug):
         # เริ่มเซิร์ฟเวอร์
-        app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
\ No newline at end of file
+        app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
+        
+        # ปิดการเชื่อมต่อฐานข้อมูลเมื่อเซิร์ฟเวอร์หยุด
+        data_manager.close()
\ No newline at end of file